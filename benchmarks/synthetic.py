@@ -0,0 +1,376 @@
+"""Generate synthetic projects to benchmark the import pipeline with.
+
+A synthetic project consists of:
+
+* ``schemas`` source forms with ``attributes`` variables each, mixing
+  choice, number, date and string variables in realistic proportions
+* one upload per source form containing ``patients`` x ``visits`` rows,
+  with a fraction of the values missing
+* one target form per source form with a direct mapping for every source
+  variable and an imputation mapping that flags high numeric values
+
+Everything is derived from a seed, so the same parameters always generate
+the same project.
+"""
+
+import collections
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from occams_datastore import models as datastore
+from occams_studies import models as studies
+from occams_imports import models
+
+
+# Proportion of each attribute type in generated forms
+TYPE_WEIGHTS = collections.OrderedDict([
+    ('choice', 0.5),
+    ('number', 0.3),
+    ('date', 0.1),
+    ('string', 0.1),
+])
+
+PUBLISH_DATE = datetime.date(2017, 1, 1)
+
+CODEBOOK_COLUMNS = [
+    'table', 'form', 'publish_date', 'field', 'title', 'description',
+    'is_required', 'is_system', 'is_collection', 'is_private', 'type',
+    'choices', 'order',
+]
+
+
+Spec = collections.namedtuple('Spec', [
+    'patients',
+    'visits',
+    'schemas',
+    'attributes',
+    'choices',
+    'missing',
+    'seed',
+])
+
+
+def make_spec(
+        patients=1000,
+        visits=4,
+        schemas=5,
+        attributes=20,
+        choices=5,
+        missing=0.1,
+        seed=0,
+        ):
+    """
+    Creates the parameters of a synthetic project
+
+    :param patients: Number of patients
+    :param visits: Number of visits per patient
+    :param schemas: Number of source forms
+    :param attributes: Number of variables per form
+    :param choices: Number of choices per choice variable
+    :param missing: Fraction of values left blank
+    :param seed: Seed of the random generator
+    """
+    return Spec(patients, visits, schemas, attributes, choices, missing, seed)
+
+
+def get_attribute_types(spec):
+    """
+    Returns the types of a form's variables, in order
+
+    :param spec: The project parameters
+    :type spec: Spec
+
+    :rtype: list[str]
+    """
+    types = []
+    for type_, weight in TYPE_WEIGHTS.items():
+        types.extend([type_] * int(round(spec.attributes * weight)))
+    # Rounding may leave the form short, pad it with the most common type
+    types.extend(['choice'] * (spec.attributes - len(types)))
+    return types[:spec.attributes]
+
+
+def get_schema_names(spec):
+    return ['form{:03d}'.format(i) for i in range(spec.schemas)]
+
+
+def get_attribute_names(spec):
+    return [
+        '{}{:03d}'.format(type_, i)
+        for i, type_ in enumerate(get_attribute_types(spec))
+    ]
+
+
+def generate_codebook(spec):
+    """
+    Generates the codebook of the source forms
+
+    :param spec: The project parameters
+    :type spec: Spec
+
+    :returns: codebook rows in the OCCAMS codebook format
+    :rtype: pandas.DataFrame
+    """
+
+    rows = []
+
+    for schema_name in get_schema_names(spec):
+        for order, (name, type_) in enumerate(zip(
+                get_attribute_names(spec), get_attribute_types(spec))):
+            if type_ == 'choice':
+                choices = ';'.join(
+                    '{0}=Choice {0}'.format(code)
+                    for code in range(spec.choices)
+                )
+            else:
+                choices = ''
+            rows.append({
+                'table': schema_name,
+                'form': schema_name.title(),
+                'publish_date': PUBLISH_DATE.isoformat(),
+                'field': name,
+                'title': name.title(),
+                'description': '',
+                'is_required': False,
+                'is_system': False,
+                'is_collection': False,
+                'is_private': False,
+                'type': type_,
+                'choices': choices,
+                'order': order,
+            })
+
+    return pd.DataFrame(rows, columns=CODEBOOK_COLUMNS)
+
+
+def generate_upload(spec, schema_name):
+    """
+    Generates the data file of a source form
+
+    :param spec: The project parameters
+    :type spec: Spec
+    :param schema_name: The form to generate data for
+    :type schema_name: str
+
+    :returns: the data file contents in CSV format
+    :rtype: bytes
+    """
+
+    offset = get_schema_names(spec).index(schema_name)
+    random = np.random.RandomState(spec.seed + offset)
+
+    size = spec.patients * spec.visits
+
+    pids = np.repeat(
+        ['P{:06d}'.format(i) for i in range(spec.patients)], spec.visits)
+    visits = np.tile(
+        ['week{}'.format(i) for i in range(spec.visits)], spec.patients)
+
+    start = np.datetime64(PUBLISH_DATE.isoformat())
+
+    data = collections.OrderedDict([
+        ('pid', pids),
+        ('visit', visits),
+        ('collect_date', start + random.randint(0, 365, size)),
+    ])
+
+    for name, type_ in zip(
+            get_attribute_names(spec), get_attribute_types(spec)):
+        if type_ == 'choice':
+            values = random.randint(0, spec.choices, size).astype(object)
+        elif type_ == 'number':
+            values = np.round(random.normal(50, 15, size), 2).astype(object)
+        elif type_ == 'date':
+            values = (start + random.randint(0, 3650, size)).astype(object)
+        else:
+            values = np.array(
+                ['text {}'.format(v) for v in random.randint(0, 1000, size)],
+                dtype=object)
+
+        values[random.random_sample(size) < spec.missing] = None
+        data[name] = values
+
+    frame = pd.DataFrame(data)
+
+    return frame.to_csv(index=False).encode('utf-8')
+
+
+def _make_schema(name, attributes):
+    return datastore.Schema(
+        name=name,
+        title=name.title(),
+        publish_date=PUBLISH_DATE,
+        attributes={
+            attribute.name: attribute
+            for attribute in attributes
+        }
+    )
+
+
+def _make_attribute(name, type_, order, choices=0):
+    return datastore.Attribute(
+        name=name,
+        title=name.title(),
+        type=type_,
+        order=order,
+        choices={
+            str(code): datastore.Choice(
+                name=str(code),
+                title='Choice {}'.format(code),
+                order=code
+            )
+            for code in range(choices)
+        }
+    )
+
+
+def _make_attributes(spec, names, types):
+    return [
+        _make_attribute(
+            name,
+            type_,
+            order,
+            spec.choices if type_ == 'choice' else 0
+        )
+        for order, (name, type_) in enumerate(zip(names, types))
+    ]
+
+
+def _make_study(name):
+    return studies.Study(
+        name=name,
+        title=name.title(),
+        short_title=name,
+        code=name,
+        consent_date=PUBLISH_DATE,
+        is_randomized=False
+    )
+
+
+def populate(db_session, spec, source_name='bench', target_name='drsc'):
+    """
+    Creates a synthetic project in the database
+
+    :param db_session: Application database session
+    :type db_session: sqlalchemy.orm.Session
+    :param spec: The project parameters
+    :type spec: Spec
+    :param source_name: Name of the project the data is uploaded to
+    :type source_name: str
+    :param target_name: Name of the project the data is mapped to
+    :type target_name: str
+
+    :returns: the source project, the target project and the uploaded
+              contents of each source form by name
+    :rtype: (occams_studies.models.Study, occams_studies.models.Study, dict)
+    """
+
+    source = _make_study(source_name)
+    target = _make_study(target_name)
+
+    db_session.add_all([
+        source,
+        target,
+        studies.Site(name=source_name, title=source_name.title()),
+        studies.Site(name=target_name, title=target_name.title()),
+    ])
+
+    approved = (
+        db_session.query(models.Status)
+        .filter_by(name='approved')
+        .one()
+    )
+
+    names = get_attribute_names(spec)
+    types = get_attribute_types(spec)
+    contents = {}
+
+    for schema_name in get_schema_names(spec):
+        source_schema = _make_schema(
+            schema_name,
+            _make_attributes(spec, names, types)
+        )
+        source.schemata.add(source_schema)
+
+        target_schema = _make_schema(
+            'target_' + schema_name,
+            _make_attributes(spec, names, types) + [
+                _make_attribute('flag', 'choice', len(names), 2)
+            ]
+        )
+        target.schemata.add(target_schema)
+
+        contents[schema_name] = generate_upload(spec, schema_name)
+
+        db_session.add(models.Upload(
+            study=source,
+            schema=source_schema,
+            project_file=contents[schema_name],
+            filename=schema_name + '.csv',
+            size=len(contents[schema_name])
+        ))
+
+        for name, type_ in zip(names, types):
+            logic = {
+                'source_schema': schema_name,
+                'source_variable': name,
+                'target_schema': target_schema.name,
+                'target_variable': name,
+            }
+            if type_ == 'choice':
+                logic['choices_mapping'] = [
+                    {'source': str(code), 'target': str(code)}
+                    for code in range(spec.choices)
+                ]
+            db_session.add(models.Mapping(
+                study=source,
+                status=approved,
+                type=u'direct',
+                logic=logic
+            ))
+
+        numbers = [n for n, t in zip(names, types) if t == 'number']
+
+        if numbers:
+            db_session.add(models.Mapping(
+                study=source,
+                status=approved,
+                type=u'imputation',
+                logic=_make_imputation(
+                    schema_name, target_schema.name, numbers)
+            ))
+
+    db_session.flush()
+
+    return source, target, contents
+
+
+def _make_imputation(schema_name, target_schema_name, numbers):
+    """
+    Flags rows where any of the numeric variables is above average
+    """
+    return {
+        'target_schema': target_schema_name,
+        'target_variable': 'flag',
+        'target_choice': {'name': '1', 'title': 'Choice 1'},
+        'condition': 'ANY',
+        'forms': [[schema_name, schema_name]],
+        'groups': [
+            {
+                'conversions': [{
+                    'byVariable': True,
+                    'value': {
+                        'schema': {'name': schema_name},
+                        'attribute': {'name': name},
+                    }
+                }],
+                'logic': {
+                    'operator': 'ALL',
+                    'imputations': [{'operator': 'GT', 'value': 50}],
+                },
+            }
+            for name in numbers
+        ],
+    }
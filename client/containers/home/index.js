@@ -44,7 +44,21 @@ function formListViewModel(){
 
   var self = this;
 
+  // Number of mappings listed per page
+  self.pageSize = 100;
+
+  // Columns the listing can be sorted by, and their names on the server
+  self.sortColumns = {
+    targetForm: 'target_form',
+    study: 'study',
+    dateMapped: 'id',
+    status: 'status'
+  };
+
+  self.statuses = ['review', 'in-progress', 'approved', 'rejected'];
+
   self.isReady = ko.observable(false);
+  self.isLoading = ko.observable(false);
 
   self.mapped = ko.observableArray();
 
@@ -57,54 +71,52 @@ function formListViewModel(){
   self.numOfMappings = ko.observable(0);
   self.numOfDRSCMappings = ko.observable(0);
   self.filter = ko.observable();
+  self.statusFilter = ko.observable();
 
   self.addDirectUrl = ko.observable()
   self.addImputationUrl = ko.observable()
   self.deleteUrl = ko.observable()
 
+  // The listing's pages are only linked forwards, so the pages before the
+  // current one are kept to go back to them
+  self.pageUrl = ko.observable();
+  self.nextUrl = ko.observable();
+  self.previousUrls = ko.observableArray();
+
   self.canAdd = ko.pureComputed(() => {
     return !! (self.addDirectUrl() || self.addImputationUrl())
   })
 
+  self.hasPrevious = ko.pureComputed(function(){
+    return self.previousUrls().length > 0;
+  });
+
+  self.hasNext = ko.pureComputed(function(){
+    return !! self.nextUrl();
+  });
+
   self.goToMapping = function(mapping){
       window.location.href = mapping.url;
   };
 
-  self.sorts = {
-    'targetForm asc': { field: 'targetForm', direction: 'asc'},
-    'targetForm desc': { field: 'targetForm', direction: 'desc'},
-    'targetVariable asc': { field: 'targetVariable', direction: 'asc'},
-    'targetVariable desc': { field: 'targetVariable', direction: 'desc'},
-    'study asc': { field: 'study', direction: 'asc'},
-    'study desc': { field: 'study', direction: 'desc'},
-    'studyForm asc': { field: 'studyForm', direction: 'asc'},
-    'studyForm desc': { field: 'studyForm', direction: 'desc'},
-    'studyVariable asc': { field: 'studyVariable', direction: 'asc'},
-    'studyVariable desc': { field: 'studyVariable', direction: 'desc'},
-    'dateMapped asc': { field: 'dateMapped', direction: 'asc'},
-    'dateMapped desc': { field: 'dateMapped', direction: 'desc'},
-    'status asc': { field: 'status', direction: 'asc'},
-    'status desc': { field: 'status', direction: 'desc'},
-  };
-
-  self.sort = ko.observable(self.sorts['targetForm asc']);
+  self.sort = ko.observable({field: 'targetForm', direction: 'asc'});
 
   self.totalShowing  = ko.pureComputed(function(){
-    return self.filteredMapped().length;
-  });
-
-  self.totalDRSCShowing  = ko.pureComputed(function(){
-    self.vars = ko.utils.arrayMap(self.filteredMapped(), function(item){ return item.targetVariable()})
-
-    return ko.utils.arrayGetDistinctValues(self.vars).length;
+    return self.mapped().length;
   });
 
   /**
    * Given a column name, determine the current sort type & order.
    */
   self.sortBy = function(columnName) {
-      self.sort(self.sortForName(self.sort(),
-          columnName, self.sorts));
+    var sort = self.sort();
+    var direction = 'asc';
+
+    if (sort.field === columnName && sort.direction === 'asc') {
+      direction = 'desc';
+    }
+
+    self.sort({field: columnName, direction: direction});
   };
 
   //determine arrow type
@@ -118,18 +130,7 @@ function formListViewModel(){
         }
       }
       return arrow;
-    },
-
-  //obtain current sort
-  self.sortForName = function(sort, columnName, allSorts) {
-    var newSort;
-      if (sort.field === columnName && sort.direction === 'asc') {
-        newSort = allSorts[columnName+' desc'];
-      } else {
-        newSort = allSorts[columnName+' asc'];
-      }
-      return newSort;
-    }
+    };
 
   // determine if box is checked
   // delete button only visible if at least one box is checked
@@ -144,62 +145,99 @@ function formListViewModel(){
     });
 
   /**
-   *  Filtered mappings based on filter string>
+   * URL of the first page of mappings, filtered and sorted on the server
    */
-  self.filteredMapped = ko.pureComputed(function(){
-    var filter = self.filter();
-    var asc = self.sort().direction === 'asc' ? true : false;
-
-    // No filter, return mapped list
-    if (!filter) {
-      return self.mapped().sort(function (a, b) {
-        // sort here
-        var aprop = a[self.sort().field]();
-        var bprop = b[self.sort().field]();
-        if (asc) {
-          return aprop > bprop ? 1 : -1;
-        } else {
-         return aprop < bprop ? 1 : -1;
-        }
-      });
+  self.listUrl = function(){
+    var sort = self.sort();
+    var params = {
+      limit: self.pageSize,
+      sort: (sort.direction === 'desc' ? '-' : '') + self.sortColumns[sort.field]
+    };
+
+    if (self.filter()){
+      params.target_form = self.filter();
     }
 
-    // filter and sort mappings
-    filter = filter.toLowerCase();
+    if (self.statusFilter()){
+      params.status = self.statusFilter();
+    }
+
+    return '/imports/mappings/view?' + $.param(params);
+  }
 
-    return self.mapped().filter(function(mapping) {
-      var formVarMatch = false;
+  self.loadPage = function(url){
+    self.isLoading(true);
 
-      var matchFormOrVar = function(){
-        return ko.utils.arrayFirst(mapping.imputationForms(), function(imputation){
-          return imputation.form().toLowerCase().indexOf(filter) > -1
-            || imputation.variable().toLowerCase().indexOf(filter) > -1
+    $.ajax({
+      url: url,
+      method: 'GET',
+      headers: {'X-CSRF-Token': Cookies.get('csrf_token')},
+      beforeSend: function(){
+      },
+      success: function(data, textStatus, jqXHR){
+        var json = data;
+        var rows = [];
+
+        self.addDirectUrl(data.$addDirectUrl)
+        self.addImputationUrl(data.$addImputationUrl)
+        self.deleteUrl(data.$deleteUrl)
+
+        $.each(json.rows, function(){
+          var row = new mappedModel(this.target_form, this.target_variable, this.study,
+            this.study_form, this.study_variable, this.date_mapped,
+            this.mapped_id, this.status, this.note);
+
+          //if there are forms, this is an imputation and imputation
+          //objects need to be instantiated
+          //this supports multi line forms and variables in the view
+          if (this.forms){
+            var mappedId = this.mapped_id;
+            $.each(this.forms, function(index, formData) {
+              row.imputationForms.push(
+                new imputationFormsModel(formData[0], formData[1], mappedId));
+            });
+          }
+          rows.push(row);
         });
-      }
 
-      if (mapping.imputationForms().length >= 1){
-        formVarMatch = matchFormOrVar();
+        self.mapped(rows);
+        self.pageUrl(url);
+        self.nextUrl(json.$next);
+        self.numOfMappings(json.count);
+        self.numOfDRSCMappings(json.variable_count);
+      },
+      error: function(data, textStatus, jqXHR){
+        console.log(data.responseJSON);
+        self.isInfo(false);
+        self.isDanger(true);
+        self.msgType('Error - ');
+        self.msg('There was an error loading the mappings.');
+      },
+      complete: function(){
+        self.isLoading(false);
+        self.isReady(true);
       }
+    });
+  }
 
-      return formVarMatch
-        || mapping.targetVariable().toLowerCase().indexOf(filter) > -1
-        || mapping.targetForm().toLowerCase().indexOf(filter) > -1
-        || mapping.study().toLowerCase().indexOf(filter) > -1
-        || mapping.studyForm().toLowerCase().indexOf(filter) > -1
-        || mapping.studyVariable().toLowerCase().indexOf(filter) > -1
-        || mapping.dateMapped().toLowerCase().indexOf(filter) > -1
-        || mapping.status().toLowerCase().indexOf(filter) > -1
-      })
-      .sort(function(a, b){
-        var aprop = a[self.sort().field]();
-        var bprop = b[self.sort().field]();
-        if (asc) {
-          return aprop > bprop ? 1 : -1;
-        } else {
-         return aprop < bprop ? 1 : -1;
-        }
-      });
-  })
+  // Filters and sorts list the mappings from their first page again
+  self.reload = function(){
+    self.previousUrls([]);
+    self.loadPage(self.listUrl());
+  }
+
+  self.nextPage = function(){
+    self.previousUrls.push(self.pageUrl());
+    self.loadPage(self.nextUrl());
+  }
+
+  self.previousPage = function(){
+    self.loadPage(self.previousUrls.pop());
+  }
+
+  self.filter.subscribe(self.reload);
+  self.statusFilter.subscribe(self.reload);
+  self.sort.subscribe(self.reload);
 
   self.deleteRows = function(){
 
@@ -211,16 +249,13 @@ function formListViewModel(){
       beforeSend: function(){
       },
       success: function(data, textStatus, jqXHR){
-        self.mapped.remove(function(item) { return item.deleteRow() == true })
-
         self.isInfo(false);
         self.isSuccess(true);
         self.msgType('Success - ');
         self.msg('All selected records deleted from database.');
 
-        self.numOfMappings(self.mapped().length);
-        self.vars = ko.utils.arrayMap(self.mapped(), function(item){ return item.targetVariable()})
-        self.numOfDRSCMappings(ko.utils.arrayGetDistinctValues(self.vars).length);
+        // Update the page and the totals
+        self.loadPage(self.pageUrl());
       },
       error: function(data, textStatus, jqXHR){
         console.log(data.responseJSON);
@@ -235,44 +270,7 @@ function formListViewModel(){
   }
 
   // get initial data
-  $.ajax({
-    url: '/imports/mappings/view',
-    method: 'GET',
-    headers: {'X-CSRF-Token': Cookies.get('csrf_token')},
-    beforeSend: function(){
-    },
-    success: function(data, textStatus, jqXHR){
-      var json = data;
-
-      self.addDirectUrl(data.$addDirectUrl)
-      self.addImputationUrl(data.$addImputationUrl)
-      self.deleteUrl(data.$deleteUrl)
-
-      $.each(json.rows, function(){
-        var row = new mappedModel(this.target_form, this.target_variable, this.study,
-          this.study_form, this.study_variable, this.date_mapped,
-          this.mapped_id, this.status, this.note);
-
-        //if there are forms, this is an imputation and imputation
-        //objects need to be instantiated
-        //this supports multi line forms and variables in the view
-        if (this.forms){
-          var mappedId = this.mapped_id;
-          $.each(this.forms, function(index, formData) {
-            row.imputationForms.push(
-              new imputationFormsModel(formData[0], formData[1], mappedId));
-          });
-        }
-        self.mapped.push(row);
-      });
-    },
-    complete: function(){
-      self.numOfMappings(self.mapped().length);
-      self.vars = ko.utils.arrayMap(self.mapped(), function(item){ return item.targetVariable()})
-      self.numOfDRSCMappings(ko.utils.arrayGetDistinctValues(self.vars).length);
-      self.isReady(true);
-  }
-  });
+  self.reload();
 }
 
 ko.components.register(
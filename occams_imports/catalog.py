@@ -0,0 +1,286 @@
+"""
+Precomputed catalog of the schemata available for mapping
+
+The mapping pages pick their variables from every schema, attribute and
+choice of the studies, a listing that is expensive to build yet only
+changes when codebooks are imported. Listings are therefore serialized
+once, compressed and kept in redis along with a checksum of their contents
+(used as their ETag), so that they can be served to clients as they are
+and revalidated with conditional requests.
+
+Besides the full listing, the catalog provides an index of the forms
+without their attributes (optionally of a single study) and the attributes
+of each form, so that clients may fetch forms only as they are needed.
+
+Entries belong to a generation: importing codebooks starts a new
+generation (see :func:`invalidate`) and entries of previous generations
+are left to expire.
+"""
+
+from collections import defaultdict
+import gzip
+import hashlib
+import io
+import json
+import uuid
+
+from occams_datastore import models as datastore
+from occams_studies import models as studies
+
+
+CATALOG_TTL_SETTING = 'imports.catalog.ttl'
+
+DEFAULT_CATALOG_TTL = 24 * 60 * 60  # One day
+
+GENERATION_KEY = 'imports:catalog:generation'
+
+# Target forms are the ones of this study
+TARGET_STUDY = u'drsc'
+
+
+def get_catalog_ttl(settings):
+    """
+    Returns the number of seconds catalog entries are kept in redis
+
+    :param settings: Application settings
+    :type settings: dict
+
+    :rtype: int
+    """
+    return int((settings or {}).get(CATALOG_TTL_SETTING) or
+               DEFAULT_CATALOG_TTL)
+
+
+def get_generation(redis):
+    """
+    Returns the current generation of the catalog
+
+    Generations are random tokens rather than a counter, so that a
+    generation is never reused if redis loses its keys.
+
+    :param redis: Redis connection
+    :type redis: redis.StrictRedis
+
+    :rtype: str
+    """
+    generation = redis.get(GENERATION_KEY)
+
+    if generation is None:
+        redis.set(GENERATION_KEY, uuid.uuid4().hex, nx=True)
+        generation = redis.get(GENERATION_KEY)
+
+    if isinstance(generation, bytes):
+        generation = generation.decode('ascii')
+
+    return generation
+
+
+def invalidate(redis):
+    """
+    Discards all catalog entries, as the available schemata changed
+
+    :param redis: Redis connection
+    :type redis: redis.StrictRedis
+    """
+    redis.set(GENERATION_KEY, uuid.uuid4().hex)
+
+
+def get_entry_key(generation, *parts):
+    """
+    Returns the redis key of a catalog entry
+
+    :param generation: The catalog generation the entry belongs to
+    :type generation: str
+    :param parts: Parts identifying the entry (e.g. ``'index'``)
+
+    :rtype: str
+    """
+    return u':'.join(
+        [u'imports:catalog', u'{}'.format(generation)] +
+        [u'{}'.format(part or u'') for part in parts])
+
+
+def query_forms(db_session, study_name=None, schema_name=None,
+                publish_date=None, attributes=True):
+    """
+    Lists the forms of studies with their attributes and choices
+
+    Forms, attributes and choices are each loaded in a single query as
+    plain rows, target (DRSC) forms are listed after those of the other
+    studies.
+
+    :param db_session: Application database session
+    :type db_session: sqlalchemy.orm.Session
+    :param study_name: (optional) Only list forms of this study
+    :type study_name: str
+    :param schema_name: (optional) Only list forms of this name
+    :type schema_name: str
+    :param publish_date: (optional) Only list forms of this publish date
+    :type publish_date: str
+    :param attributes: Whether to list the attributes of the forms
+    :type attributes: bool
+
+    :returns: form listings, as expected by the mapping pages
+    :rtype: list[dict]
+    """
+
+    is_target = (studies.Study.name == TARGET_STUDY).label('is_target')
+
+    # mappings may only occur with schemas associated with a study
+    query = (
+        db_session.query(
+            datastore.Schema.id,
+            datastore.Schema.name,
+            datastore.Schema.publish_date,
+            is_target)
+        .select_from(studies.Study)
+        .join(studies.Study.schemata)
+        .distinct()
+        .order_by(is_target, datastore.Schema.name,
+                  datastore.Schema.publish_date))
+
+    if study_name:
+        query = query.filter(studies.Study.name == study_name)
+
+    if schema_name:
+        query = query.filter(datastore.Schema.name == schema_name)
+
+    if publish_date:
+        query = query.filter(datastore.Schema.publish_date == publish_date)
+
+    rows = query.all()
+    listed = defaultdict(list)
+
+    if attributes and rows:
+        schema_ids = sorted({row.id for row in rows})
+        choices = defaultdict(list)
+
+        choices_query = (
+            db_session.query(
+                datastore.Choice.attribute_id,
+                datastore.Choice.name,
+                datastore.Choice.title,
+                datastore.Choice.order)
+            .join(datastore.Attribute)
+            .filter(datastore.Attribute.schema_id.in_(schema_ids))
+            .order_by(datastore.Choice.attribute_id, datastore.Choice.order))
+
+        for choice in choices_query:
+            choices[choice.attribute_id].append({
+                u'name': choice.name,
+                u'label': choice.title,
+                u'order': choice.order
+            })
+
+        attributes_query = (
+            db_session.query(
+                datastore.Attribute.id,
+                datastore.Attribute.schema_id,
+                datastore.Attribute.name,
+                datastore.Attribute.title,
+                datastore.Attribute.type)
+            .filter(datastore.Attribute.schema_id.in_(schema_ids))
+            .order_by(datastore.Attribute.schema_id, datastore.Attribute.name))
+
+        for attribute in attributes_query:
+            listed[attribute.schema_id].append({
+                u'variable': attribute.name,
+                u'label': attribute.title,
+                u'datatype': attribute.type,
+                u'choices': (
+                    choices[attribute.id]
+                    if attribute.type == u'choice' else [])
+            })
+
+    forms = []
+
+    for row in rows:
+        form = {
+            u'name': row.name,
+            u'publish_date': row.publish_date.strftime('%Y-%m-%d'),
+            u'site': u'DRSC' if row.is_target else u''
+        }
+        if attributes:
+            form[u'attributes'] = listed[row.id]
+        forms.append(form)
+
+    return forms
+
+
+def serialize(data):
+    """
+    Serializes a catalog entry
+
+    :param data: The JSON-serializable entry
+    :type data: dict
+
+    :returns: the ETag and the gzip-compressed JSON body of the entry
+    :rtype: (str, bytes)
+    """
+    body = json.dumps(data, sort_keys=True).encode('utf-8')
+    etag = hashlib.sha1(body).hexdigest()
+    return etag, compress(body)
+
+
+def get_entry(redis, settings, key, build):
+    """
+    Returns a catalog entry, building it if it is not cached yet
+
+    :param redis: Redis connection
+    :type redis: redis.StrictRedis
+    :param settings: Application settings
+    :type settings: dict
+    :param key: The parts identifying the entry (see :func:`get_entry_key`)
+    :type key: tuple
+    :param build: Builds the entry's data if it is missing, may return
+                  `None` if there is no such entry
+    :type build: callable
+
+    :returns: the ETag and the compressed body of the entry, otherwise
+              `None` if there is no such entry
+    :rtype: (str, bytes)
+    """
+
+    # Read the generation first, so an entry built while codebooks are
+    # imported is stored under the generation that becomes outdated
+    entry_key = get_entry_key(get_generation(redis), *key)
+
+    cached = redis.hgetall(entry_key)
+
+    if cached:
+        etag = cached[b'etag']
+        if isinstance(etag, bytes):
+            etag = etag.decode('ascii')
+        return etag, cached[b'body']
+
+    data = build()
+
+    if data is None:
+        return None
+
+    etag, body = serialize(data)
+
+    pipeline = redis.pipeline()
+    pipeline.hmset(entry_key, {'etag': etag, 'body': body})
+    pipeline.expire(entry_key, get_catalog_ttl(settings))
+    pipeline.execute()
+
+    return etag, body
+
+
+def compress(body):
+    """
+    Compresses a body with gzip
+    """
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as fp:
+        fp.write(body)
+    return buffer.getvalue()
+
+
+def decompress(body):
+    """
+    Decompresses a gzip-compressed body
+    """
+    with gzip.GzipFile(fileobj=io.BytesIO(body), mode='rb') as fp:
+        return fp.read()
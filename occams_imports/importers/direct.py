@@ -6,6 +6,8 @@ can continue to use the application and view the mapping results at a
 later time.
 """
 
+import functools
+
 import numpy as np
 import sqlalchemy as sa
 
@@ -79,6 +81,7 @@ def apply_mapping(
         pid_column=DEFAULT_PID_COLUMN,
         visit_column=DEFAULT_VISIT_COLUMN,
         collect_date_column=DEFAULT_COLLECT_DATE_COLUMN,
+        metadata=None,
         ):
     """
     Applies all completed DIRECT mappings to the queued data set
@@ -105,6 +108,9 @@ def apply_mapping(
     :type project_name: str
     :param frame: The current data frame for the project
     :type frame: pandas.DataFrame
+    :param metadata: (optional) Prefetched form metadata, otherwise the
+                     metadata is queried for the mapping
+    :type metadata: occams_imports.importers.utils.metadata.MetadataSnapshot
 
     :returns: the mutated frame
     :rtype: pandas.DataFrame
@@ -135,17 +141,16 @@ def apply_mapping(
         frame[source_column] = np.nan
         return frame
 
+    if metadata is not None:
+        is_choice = metadata.is_choice
+        get_choices = metadata.get_choices
+    else:
+        is_choice = functools.partial(_is_choice, db_session)
+        get_choices = functools.partial(_get_choices, db_session)
+
     choices_mapping = mapping.logic.get('choices_mapping') or []
-    source_is_choice = _is_choice(
-        db_session,
-        source_schema_name,
-        source_variable
-    )
-    target_is_choice = _is_choice(
-        db_session,
-        target_schema_name,
-        target_variable
-    )
+    source_is_choice = is_choice(source_schema_name, source_variable)
+    target_is_choice = is_choice(target_schema_name, target_variable)
 
     if choices_mapping:
         value_map = {
@@ -154,11 +159,7 @@ def apply_mapping(
             if choice_mapping['source']
         }
     elif source_is_choice and not target_is_choice:
-        source_choices = _get_choices(
-            db_session,
-            source_schema_name,
-            source_variable
-        )
+        source_choices = get_choices(source_schema_name, source_variable)
 
         value_map = {c.name: c.title for c in source_choices}
 
@@ -166,7 +167,11 @@ def apply_mapping(
         value_map = {}
 
     if value_map:
-        frame[target_column] = frame[source_column].map(value_map)
+        source_values = frame[source_column]
+        # Choice columns are loaded as categoricals, map the raw codes
+        if source_values.dtype.name == 'category':
+            source_values = source_values.astype(object)
+        frame[target_column] = source_values.map(value_map)
     else:
         frame[target_column] = frame[source_column]
 
@@ -27,6 +27,7 @@ Additional Notes:
 
 """
 
+import functools
 import operator as py
 
 import pandas as pd
@@ -301,6 +302,170 @@ def _compile_imputation(
     return _process_row
 
 
+def _extract_series(project_name, conversion, frame):
+    """
+    Extracts a column of values from the frame based on the conversion
+
+    This is the vectorized counterpart of :func:`_extract_value`. Instead of
+    raising :class:`HasNan`, null values are left in place so that the
+    caller can track which rows would have failed to evaluate.
+
+    :param conversion: A conversion specification
+    :type conversion: dict
+    :param frame: The data frame being processed
+    :type frame: pandas.DataFrame
+
+    :returns: values from the frame if by variable, the scalar value in the
+              conversion broadcast to every row if by value, otherwise `np.nan`
+    :rtype: pandas.Series
+    """
+
+    values = pd.Series(np.nan, index=frame.index)
+
+    if conversion.get('byVariable'):
+        schema_name = conversion.get('value', {}).get('schema', {}).get('name')
+        attribute = conversion.get('value', {}).get('attribute', {})
+        attribute_name = attribute.get('name')
+        source_column_name = \
+            '_'.join([project_name, schema_name, attribute_name])
+        if source_column_name in frame:
+            values = frame[source_column_name]
+
+        # Choice columns are categorical, which do not support arithmetic
+        # or ordering, so operate on the raw codes instead
+        if values.dtype.name == 'category':
+            values = values.astype(object)
+
+    elif conversion.get('byValue'):
+        # XXX: Making an assumption that all conversions are by integer
+        #      values as that is the the UI currently allows
+        values = pd.Series(int(conversion.get('value')), index=frame.index)
+
+    return values
+
+
+def _truthy(values):
+    """
+    Coerces a column to the truth value each row would have in Python
+    """
+    if values.dtype == np.bool_:
+        return values
+    return values.astype(bool)
+
+
+VECTOR_REDUCERS = {
+    'ANY': (lambda clauses: functools.reduce(py.or_, clauses)),
+    'ALL': (lambda clauses: functools.reduce(py.and_, clauses)),
+}
+
+
+def _impute_group_frame(project_name, group, frame):
+    """
+    Processes an individual group in a logic mapping for every row at once
+
+    This is the vectorized counterpart of :func:`_impute_group`.
+
+    :param group: The group structure to evaluate
+    :type group: dict
+    :param frame: The data frame being processed
+    :type frame: pandas.DataFrame
+
+    :returns: A tuple of the evaluated values and a boolean mask of the
+              rows that could be evaluated (i.e. the rows for which
+              :func:`_impute_group` would not have raised :class:`HasNan`)
+    :rtype: (pandas.Series, pandas.Series)
+    """
+
+    conversions = group.get('conversions')
+
+    if not conversions:
+        values = pd.Series(np.nan, index=frame.index)
+        valid = pd.Series(True, index=frame.index)
+        return values, valid
+
+    current_values = _extract_series(project_name, conversions[0], frame)
+    valid = current_values.notnull()
+
+    for conversion in conversions[1:]:
+        operator = conversion.get('operator')
+        next_values = _extract_series(project_name, conversion, frame)
+        valid &= next_values.notnull()
+        current_values = _operate(operator, current_values, next_values)
+
+    logic = group.get('logic') or {}
+    condition = logic.get('operator') or 'ALL'
+    imputations = logic.get('imputations')
+
+    if not imputations:
+        return current_values, valid
+
+    clauses = [
+        _operate(i.get('operator'), current_values, i.get('value'))
+        for i in imputations
+    ]
+    imputed = VECTOR_REDUCERS[condition](clauses)
+
+    return imputed, valid
+
+
+def _compile_vectorized_imputation(
+        project_name,
+        condition,
+        target_column_name,
+        target_value,
+        groups
+        ):
+    """
+    Compiles imputation to process an entire dataframe into a new column
+
+    This is the vectorized counterpart of :func:`_compile_imputation`: each
+    group is evaluated as column operations and rows that would have raised
+    :class:`HasNan` are masked out. Groups are combined the same way
+    the short-circuiting ``any``/``all`` operators would have combined them
+    row-by-row, so a null in a group that is never reached does not
+    invalidate the row.
+    """
+
+    def _process_frame(frame):
+
+        index = frame.index
+        evaluated = [_impute_group_frame(project_name, g, frame) for g in groups]
+
+        if condition == 'ID':
+            if not evaluated:
+                result = pd.Series(np.nan, index=index)
+            else:
+                values, valid = evaluated[0]
+                result = values.where(valid)
+
+        elif condition in ('ANY', 'ALL'):
+            if condition == 'ALL':
+                passed = pd.Series(True, index=index)
+                for values, valid in evaluated:
+                    passed &= valid & _truthy(values)
+            else:
+                passed = pd.Series(False, index=index)
+                pending = pd.Series(True, index=index)
+                for values, valid in evaluated:
+                    truthy = _truthy(values)
+                    passed |= pending & valid & truthy
+                    pending &= valid & ~truthy
+
+            # ALL/ANY coerce to a boolean so we need to return the desired value
+            result = pd.Series(target_value, index=index).where(passed)
+
+        else:
+            raise ValueError('Unsupported condition: %s' % condition)
+
+        if target_column_name in frame:
+            existing = frame[target_column_name]
+            result = existing.where(existing.notnull(), result)
+
+        return result
+
+    return _process_frame
+
+
 def apply_mapping(
         db_session,
         channel,
@@ -311,6 +476,7 @@ def apply_mapping(
         pid_column=DEFAULT_PID_COLUMN,
         visit_column=DEFAULT_VISIT_COLUMN,
         collect_date_column=DEFAULT_COLLECT_DATE_COLUMN,
+        metadata=None,
         ):
     """
     Apply a single mapping heuristic.
@@ -338,15 +504,25 @@ def apply_mapping(
     :type jobid: str
     :param mapping: The current mapping being processed
     :type mapping: occams_imports.models.Mapping
+    :param metadata: (optional) Prefetched form metadata, otherwise the
+                     target attribute is queried for the mapping
+    :type metadata: occams_imports.importers.utils.metadata.MetadataSnapshot
     """
 
     target_schema_name = mapping.logic.get('target_schema')
     target_attribute_name = mapping.logic.get('target_variable')
-    target_attribute = _get_attribute(
-        db_session,
-        target_schema_name,
-        target_attribute_name,
-    )
+
+    if metadata is not None:
+        target_attribute = metadata.get_attribute(
+            target_schema_name,
+            target_attribute_name,
+        )
+    else:
+        target_attribute = _get_attribute(
+            db_session,
+            target_schema_name,
+            target_attribute_name,
+        )
 
     target_choice = mapping.logic.get('target_choice') or {}
     target_value = target_choice.get('name') or None
@@ -366,21 +542,16 @@ def apply_mapping(
         # Whatever the first group generates will be our target value
         # Non-choice mappings are only processed as one group
         condition = 'ID'
-        if len(groups) > 1:
-            groups = groups[0]
-
-    # XXX: In hindsight, this should have built a pandas filter query to
-    # efficiently seek out matching rows and only set the target value on
-    # those rows.
+        groups = groups[:1]
 
-    imputation = _compile_imputation(
+    imputation = _compile_vectorized_imputation(
         mapping.study.name,
         condition,
         target_column_name,
         target_value,
         groups
     )
-    frame[target_column_name] = frame.apply(imputation, axis=1)
+    frame[target_column_name] = imputation(frame)
 
     # Re-calculate the collect dates (including the current one)
     # to use the earliest collect_date
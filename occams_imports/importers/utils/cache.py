@@ -0,0 +1,244 @@
+"""
+On-disk cache of parsed upload data frames
+
+Parsing an upload into a typed data frame is one of the most expensive
+steps of the mapping pipeline, yet uploads rarely change between runs.
+Parsed frames are therefore stored in a configured directory (setting
+``imports.cache.dir``) keyed by the upload's content checksum and the
+parts of the schema that determine how the file is parsed, so a frame is
+only re-parsed if either the file or its data dictionary changes.
+
+The cache is bounded by ``imports.cache.size`` (in bytes), evicting the
+least-recently used frames first.
+
+.. note:: Frames are stored with pandas' pickle serialization, which keeps
+          the column blocks and dtypes (including categoricals) intact and
+          is available in every supported version of pandas.
+"""
+
+import errno
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import pandas as pd
+
+
+log = logging.getLogger(__name__)
+
+CACHE_DIR_SETTING = 'imports.cache.dir'
+CACHE_SIZE_SETTING = 'imports.cache.size'
+
+DEFAULT_CACHE_SIZE = 2 * 1024 ** 3  # 2 GiB
+
+# Bump this whenever the way frames are parsed changes so that frames
+# parsed by a previous version are not used.
+CACHE_VERSION = 1
+
+_EXTENSION = '.pickle'
+
+
+def get_checksum(upload):
+    """
+    Returns the content checksum of an upload
+
+    Uploads that predate checksums being recorded are hashed on the fly.
+
+    :param upload: The upload to identify
+    :type upload: occams_imports.models.Upload
+
+    :returns: SHA-256 hex digest of the upload contents
+    :rtype: str
+    """
+    if upload.checksum:
+        return upload.checksum
+    return hashlib.sha256(upload.project_file).hexdigest()
+
+
+class FrameCache(object):
+    """
+    A size-bounded least-recently-used cache of parsed upload frames
+
+    Entries are named ``<checksum>-<key>`` so that all entries for a given
+    file can be invalidated at once.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_SIZE):
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Creates a cache from the application settings
+
+        :param settings: Application settings
+        :type settings: dict
+
+        :returns: the configured cache, otherwise `None` if caching is
+                  not configured
+        :rtype: FrameCache
+        """
+        settings = settings or {}
+        cache_dir = settings.get(CACHE_DIR_SETTING)
+
+        if not cache_dir:
+            return None
+
+        max_size = int(settings.get(CACHE_SIZE_SETTING) or DEFAULT_CACHE_SIZE)
+        return cls(cache_dir, max_size)
+
+    def make_key(self, upload, *columns):
+        """
+        Generates the cache key for the parsed frame of an upload
+
+        :param upload: The upload being parsed
+        :type upload: occams_imports.models.Upload
+        :param columns: Additional parameters the frame depends on
+                        (e.g. the pid/visit/collect date column names)
+
+        :returns: the cache key
+        :rtype: str
+        """
+        schema = upload.schema
+        plan = {
+            'version': CACHE_VERSION,
+            'project': upload.study.name,
+            'schema': [
+                schema.id,
+                schema.name,
+                schema.publish_date and schema.publish_date.isoformat(),
+            ],
+            'attributes': sorted(
+                [a.name, a.type] for a in schema.iterleafs()
+            ),
+            'columns': list(columns),
+        }
+        digest = hashlib.sha256(json.dumps(plan, sort_keys=True).encode('utf-8'))
+        return '-'.join([get_checksum(upload), digest.hexdigest()])
+
+    def _get_path(self, key):
+        return os.path.join(self._cache_dir, key + _EXTENSION)
+
+    def get(self, key):
+        """
+        Returns a cached frame
+
+        :param key: The cache key
+        :type key: str
+
+        Entries that cannot be read (e.g. truncated files or frames pickled
+        by an incompatible version of pandas) are removed and treated as
+        missing.
+
+        :returns: the cached frame, otherwise `None` if it is not cached
+        :rtype: pandas.DataFrame
+        """
+        path = self._get_path(key)
+
+        if not os.path.exists(path):
+            return None
+
+        try:
+            frame = pd.read_pickle(path)
+        except Exception:
+            log.warning('Discarding unreadable cached frame %s', path,
+                        exc_info=True)
+            _unlink(path)
+            return None
+
+        # Mark the entry as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return frame
+
+    def put(self, key, frame):
+        """
+        Stores a frame in the cache and evicts old entries as needed
+
+        :param key: The cache key
+        :type key: str
+        :param frame: The parsed frame
+        :type frame: pandas.DataFrame
+        """
+        _makedirs(self._cache_dir)
+
+        fd, temp_path = tempfile.mkstemp(dir=self._cache_dir, suffix='.part')
+        os.close(fd)
+
+        try:
+            frame.to_pickle(temp_path)
+            os.rename(temp_path, self._get_path(key))
+        except:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        self.evict()
+
+    def invalidate(self, checksum):
+        """
+        Removes all cached frames of a file
+
+        :param checksum: The content checksum of the file
+        :type checksum: str
+        """
+        for filename, __, __ in self._entries():
+            if filename.startswith(checksum + '-'):
+                _unlink(os.path.join(self._cache_dir, filename))
+
+    def evict(self):
+        """
+        Removes the least-recently used entries until the cache fits
+        """
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for __, __, size in entries)
+
+        for filename, __, size in entries:
+            if total <= self._max_size:
+                break
+            _unlink(os.path.join(self._cache_dir, filename))
+            total -= size
+
+    def _entries(self):
+        """
+        Lists the cached entries as (filename, last used, size) tuples
+        """
+        try:
+            filenames = os.listdir(self._cache_dir)
+        except OSError:
+            return []
+
+        entries = []
+
+        for filename in filenames:
+            if not filename.endswith(_EXTENSION):
+                continue
+            try:
+                stat = os.stat(os.path.join(self._cache_dir, filename))
+            except OSError:
+                continue
+            entries.append((filename, stat.st_mtime, stat.st_size))
+
+        return entries
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
@@ -0,0 +1,206 @@
+"""
+Snapshot of the form metadata referenced by a project's mappings
+
+Mappers need to know the type of the attributes they read and write and
+the choices of those attributes. Rather than querying the Schema, Attribute
+and Choice tables for every single mapping, the metadata of every schema
+the mappings reference is loaded in a few bulk queries at the start of the
+pipeline and looked up in memory from then on.
+
+The metadata is loaded as plain rows rather than ORM instances, so that
+the snapshot does not leave partially loaded attributes in the session
+the target project is later populated with.
+"""
+
+import collections
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from occams_datastore import models as datastore
+
+
+AttributeInfo = collections.namedtuple(
+    'AttributeInfo', ['id', 'name', 'type', 'schema_id'])
+
+ChoiceInfo = collections.namedtuple(
+    'ChoiceInfo', ['id', 'name', 'title', 'order'])
+
+
+def get_schema_names(mappings):
+    """
+    Returns the names of the schemata that mappers look up metadata for
+
+    :param mappings: The mappings that will be applied
+    :type mappings: iterable[occams_imports.models.Mapping]
+
+    :returns: the referenced schema names
+    :rtype: set
+    """
+
+    names = set()
+
+    for mapping in mappings:
+        logic = mapping.logic or {}
+        names.add(logic.get('target_schema'))
+        if mapping.type == 'direct':
+            names.add(logic.get('source_schema'))
+
+    names.discard(None)
+
+    return names
+
+
+class MetadataSnapshot(object):
+    """
+    In-memory lookups of attribute types and choices by schema name
+
+    The snapshot is read-only once loaded so it may be shared by mappers
+    running concurrently.
+    """
+
+    def __init__(self, attributes, choice_attributes, choices):
+        self._attributes = attributes
+        self._choice_attributes = choice_attributes
+        self._choices = choices
+
+    @classmethod
+    def load(cls, db_session, schema_names):
+        """
+        Loads the metadata of the given schemata
+
+        :param db_session: Application database session
+        :type db_session: sqlalchemy.orm.Session
+        :param schema_names: The names of the schemata to load
+        :type schema_names: iterable[str]
+
+        :returns: the loaded snapshot
+        :rtype: MetadataSnapshot
+        """
+
+        schema_names = sorted(set(schema_names))
+
+        attributes = {}
+        choice_attributes = set()
+        choices = collections.defaultdict(list)
+
+        if not schema_names:
+            return cls(attributes, choice_attributes, choices)
+
+        # Attributes of every version, most recent version first. This
+        # mirrors the ordering used to find the most recent schema.
+        query = (
+            db_session.query(
+                datastore.Attribute.id,
+                datastore.Attribute.name,
+                datastore.Attribute.type,
+                datastore.Attribute.schema_id,
+                datastore.Schema.name
+            )
+            .join(datastore.Attribute.schema)
+            .filter(datastore.Schema.name.in_(schema_names))
+            .order_by(
+                datastore.Schema.name,
+                datastore.Schema.publish_date.desc().nullslast(),
+                datastore.Schema.id.desc()
+            )
+        )
+
+        latest_schemata = {}
+
+        for row in query:
+            attribute = AttributeInfo(*row[:-1])
+            schema_name = row[-1]
+            key = (schema_name, attribute.name)
+
+            if attribute.type == 'choice':
+                choice_attributes.add(key)
+
+            latest_schema_id = \
+                latest_schemata.setdefault(schema_name, attribute.schema_id)
+
+            if attribute.schema_id == latest_schema_id:
+                attributes[key] = attribute
+
+        # Choices of every published version, most recent version first
+        query = (
+            db_session.query(
+                datastore.Choice.id,
+                datastore.Choice.name,
+                datastore.Choice.title,
+                datastore.Choice.order,
+                datastore.Schema.name,
+                datastore.Attribute.name
+            )
+            .join(datastore.Choice.attribute)
+            .join(datastore.Attribute.schema)
+            .filter(
+                (datastore.Schema.name.in_(schema_names)) &
+                (datastore.Schema.publish_date != sa.null())
+            )
+            .order_by(
+                datastore.Schema.publish_date.desc(),
+                datastore.Choice.order
+            )
+        )
+
+        seen = set()
+
+        for row in query:
+            choice = ChoiceInfo(*row[:-2])
+            schema_name, attribute_name = row[-2:]
+            key = (schema_name, attribute_name)
+            if (key, choice.name) in seen:
+                continue
+            seen.add((key, choice.name))
+            choices[key].append(choice)
+
+        return cls(attributes, choice_attributes, choices)
+
+    def get_attribute(self, schema_name, attribute_name):
+        """
+        Finds the attribute in the most recent version of a schema
+
+        :param schema_name: The name of the form that contains the attribute
+        :type schema_name: str
+        :param attribute_name: The name of the attribute
+        :type attribute_name: str
+
+        :raises: sqlalchemy.orm.exc.NoResultFound: If the attribute is not
+                 found
+
+        :returns: The matching attribute
+        :rtype: AttributeInfo
+        """
+        try:
+            return self._attributes[(schema_name, attribute_name)]
+        except KeyError:
+            raise orm.exc.NoResultFound(
+                'No attribute {}.{}'.format(schema_name, attribute_name))
+
+    def is_choice(self, schema_name, attribute_name):
+        """
+        Checks if an attribute was ever a choice
+
+        :param schema_name: The name of the form that contains the attribute
+        :type schema_name: str
+        :param attribute_name: The name of the attribute
+        :type attribute_name: str
+
+        :rtype: bool
+        """
+        return (schema_name, attribute_name) in self._choice_attributes
+
+    def get_choices(self, schema_name, attribute_name):
+        """
+        Returns the most recent version of every choice ever used for the
+        attribute
+
+        :param schema_name: The name of the form that contains the attribute
+        :type schema_name: str
+        :param attribute_name: The name of the attribute
+        :type attribute_name: str
+
+        :rtype: list[ChoiceInfo]
+        """
+        return list(self._choices.get((schema_name, attribute_name), []))
@@ -2,26 +2,35 @@
 Toolset for creating a pivot table from project data files
 """
 
+import datetime
 import math
-import io
 import numbers
 import shutil
 import tempfile
+import zlib
 
 import numpy as np
 import pandas as pd
-from sqlalchemy import orm
+import six
 
 from occams_studies import models as studies
 from occams_datastore import models as datastore
 from occams_forms.renderers import apply_data
-from occams_imports import models
+from occams_imports import models, storage
+
+from .cache import FrameCache
 
 
 DEFAULT_PID_COLUMN = 'pid'
 DEFAULT_VISIT_COLUMN = 'visit'
 DEFAULT_COLLECT_DATE_COLUMN = 'collect_date'
 
+# Number of entities (or values) created by each statement or flush
+DEFAULT_BATCH_SIZE = 1000
+
+# Number of rows read at a time when only a shard of the patients is loaded
+READ_CHUNK_SIZE = 100000
+
 
 def get_uploads(db_session, project_name):
     """
@@ -44,6 +53,47 @@ def get_uploads(db_session, project_name):
     return uploads
 
 
+def _build_frame_plan(schema, index_columns):
+    """
+    Determines how each column of a schema data file should be parsed
+
+    Choice columns are loaded as categoricals since they only contain a
+    handful of distinct codes. Number and date columns are loaded as
+    strings and then converted in a single vectorized pass so that
+    malformed values can be coerced to nulls rather than failing the load.
+
+    :param schema: Schame to be used as a data dictionary for the the data file
+    :type schema: occams_datastore.models.Schema
+    :param index_columns: Columns that identify a record (e.g. pid, visit)
+    :type index_columns: list
+
+    :returns: A tuple of the dtype for each known column, the set of columns
+              to be converted to numbers and the set of columns to be
+              converted to dates
+    :rtype: (dict, set, set)
+    """
+
+    dtypes = {c: str for c in index_columns}
+    numeric_columns = set()
+    date_columns = set()
+
+    for attribute in schema.iterleafs():
+        if attribute.name in dtypes:
+            continue
+
+        if attribute.type == 'choice':
+            dtypes[attribute.name] = 'category'
+        else:
+            dtypes[attribute.name] = str
+
+        if attribute.type in ('number',):
+            numeric_columns.add(attribute.name)
+        elif attribute.type in ('date', 'datetime'):
+            date_columns.add(attribute.name)
+
+    return dtypes, numeric_columns, date_columns
+
+
 def load_schema_frame(
         project,
         schema,
@@ -51,6 +101,7 @@ def load_schema_frame(
         pid_column=DEFAULT_PID_COLUMN,
         visit_column=DEFAULT_VISIT_COLUMN,
         collect_date_column=DEFAULT_COLLECT_DATE_COLUMN,
+        shard=None,
         ):
     """
     Generates a data frame containing the data for the specified schema
@@ -70,6 +121,11 @@ def load_schema_frame(
     :param collect_date_column: (optional) Column name that contains
                                 the collect_date
     :type collect_date_column: str
+    :param shard: (optional) Only keep the rows of the patients in the given
+                  (shard number, shard count) partition, the file is then
+                  read in chunks so that other patients' rows are dropped
+                  as they are read
+    :type shard: tuple
 
     :returns: data frame containing the the uploaded schema data file
     :rtype: pandas.DataFrame
@@ -79,10 +135,34 @@ def load_schema_frame(
     index_columns = [pid_column, visit_column, collect_date_column]
     variable_columns = [a.name for a in schema.iterleafs()]
 
-    # Load the data uninterpreted so that we can convert the columns manually
-    frame = pd.read_csv(buffer_, dtype=str)
+    dtypes, numeric_columns, date_columns = \
+        _build_frame_plan(schema, index_columns)
+
+    # Only parse the columns we know about, everything else is discarded anyway
+    header = pd.read_csv(buffer_, nrows=0).columns
+    buffer_.seek(0)
+    used_columns = [c for c in header if c in dtypes]
 
-    frame[collect_date_column].apply(pd.to_datetime)
+    read_options = {
+        'usecols': used_columns,
+        'dtype': {c: dtypes[c] for c in used_columns},
+    }
+
+    if shard is None:
+        frame = pd.read_csv(buffer_, **read_options)
+    else:
+        chunks = [
+            select_shard(chunk, shard, pid_column)
+            for chunk in pd.read_csv(
+                buffer_, chunksize=READ_CHUNK_SIZE, **read_options)
+        ]
+        if not chunks:
+            buffer_.seek(0)
+            chunks = [pd.read_csv(buffer_, nrows=0, **read_options)]
+        frame = pd.concat(chunks)
+
+    frame[collect_date_column] = \
+        pd.to_datetime(frame[collect_date_column], errors='coerce')
 
     for variable_name in variable_columns:
 
@@ -91,14 +171,12 @@ def load_schema_frame(
             frame[variable_name] = np.nan
             continue
 
-        type_ = schema.attributes[variable_name].type
-
-        if type_ in ('number',):
+        if variable_name in numeric_columns:
             frame[variable_name] = \
-                frame[variable_name].apply(pd.to_numeric, errors='coerce')
-        elif type_ in ('date', 'datetime'):
+                pd.to_numeric(frame[variable_name], errors='coerce')
+        elif variable_name in date_columns:
             frame[variable_name] = \
-                frame[variable_name].apply(pd.to_datetime, errors='coerce')
+                pd.to_datetime(frame[variable_name], errors='coerce')
 
     frame = frame[index_columns + variable_columns]
 
@@ -114,6 +192,281 @@ def load_schema_frame(
     return frame
 
 
+def _load_patients(db_session, pids):
+    """
+    Loads all existing patients for the given PIDs in a single query
+
+    :param db_session: Current database transaction session
+    :type db_session: sqlalchemy.orm.session.Session
+    :param pids: PIDs to look up
+    :type pids: iterable
+
+    :returns: A lookup of PID to patient for the PIDs that already exist
+    :rtype: dict
+    """
+
+    pids = list(set(pids))
+
+    if not pids:
+        return {}
+
+    query = (
+        db_session.query(studies.Patient)
+        .filter(studies.Patient.pid.in_(pids))
+    )
+
+    return {patient.pid: patient for patient in query}
+
+
+def _has_blobs(schema):
+    """
+    Checks if any of the schema's attributes store files on disk
+    """
+    return any(a.type == 'blob' for a in schema.iterleafs())
+
+
+def _get_blame_id(db_session):
+    """
+    Returns the id of the user changes are attributed to
+    """
+    blame = db_session.info['blame']
+
+    if isinstance(blame, datastore.User):
+        return blame.id
+
+    return (
+        db_session.query(datastore.User.id)
+        .filter_by(key=blame)
+        .scalar())
+
+
+def _insert_rows(db_session, table, rows, batch_size, returning=None):
+    """
+    Inserts rows with multi-row INSERT statements
+
+    Statements bypass the ORM, so the user columns that it would otherwise
+    fill in must already be set.
+
+    :param table: Table to insert into
+    :type table: sqlalchemy.Table
+    :param rows: Column values of each row, all with the same columns
+    :type rows: list[dict]
+    :param batch_size: Number of rows inserted by each statement
+    :type batch_size: int
+    :param returning: (optional) Column to return for each inserted row
+    :type returning: sqlalchemy.Column
+
+    :returns: the returned column of each row, in insert order
+    :rtype: list
+    """
+
+    returned = []
+
+    for start in range(0, len(rows), batch_size):
+        statement = table.insert().values(rows[start:start + batch_size])
+
+        if returning is None:
+            db_session.execute(statement)
+        else:
+            # Postgres returns the rows of a multi-row INSERT in order
+            result = db_session.execute(statement.returning(returning))
+            returned.extend(value for value, in result)
+
+    return returned
+
+
+def _to_python(value):
+    """
+    Converts a frame value to a type the database driver can adapt
+    """
+    if value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _is_missing(value):
+    """
+    Checks if a frame value is missing (i.e. a NaN or NaT)
+    """
+    return (
+        value is pd.NaT or
+        (isinstance(value, numbers.Number) and math.isnan(value)))
+
+
+def _convert_value(attribute, choices, value):
+    """
+    Converts a frame value to the value stored for an attribute
+
+    :param attribute: The attribute the value is stored for
+    :type attribute: occams_datastore.models.Attribute
+    :param choices: Lookup of choice name to choice id of the attribute
+    :type choices: dict
+    :param value: The frame value
+
+    :returns: the value to store, choices are stored by id
+    :raises ValueError: if the value is not one of the attribute's choices
+    """
+
+    value = _to_python(value)
+
+    if attribute.type == 'choice':
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        name = six.text_type(value)
+        try:
+            return choices[name]
+        except KeyError:
+            raise ValueError(u'{} is not a valid choice of {}'.format(
+                name, attribute.name))
+
+    if attribute.type == 'date' and isinstance(value, datetime.datetime):
+        return value.date()
+
+    return value
+
+
+def _populate_schema_orm(
+        db_session, schema, records, columns, patients, state,
+        pid_column, collect_date_column, batch_size):
+    """
+    Creates the entities of a schema with attributes stored on disk
+
+    Files are written by the forms application while each entity is
+    created, so entities are created through the ORM and flushed in
+    batches.
+
+    :returns: the number of entities created
+    :rtype: int
+    """
+
+    pending = 0
+
+    for record in records:
+
+        payload = {}
+
+        for column_name, attribute_name in columns.items():
+            value = record[column_name]
+
+            if isinstance(value, numbers.Number) and math.isnan(value):
+                continue
+
+            payload[attribute_name] = value
+
+        entity = datastore.Entity(
+            schema=schema,
+            collect_date=record[collect_date_column],
+            state=state
+        )
+
+        patients[record[pid_column]].entities.add(entity)
+
+        upload_dir = tempfile.mkdtemp()
+        apply_data(db_session, entity, payload, upload_dir)
+        shutil.rmtree(upload_dir)
+
+        pending += 1
+
+        if pending >= batch_size:
+            db_session.flush()
+            pending = 0
+
+    db_session.flush()
+
+    return len(records)
+
+
+def _populate_schema_bulk(
+        db_session, schema, records, columns, patients, state, blame_id,
+        pid_column, collect_date_column, batch_size):
+    """
+    Creates the entities of a schema with multi-row INSERT statements
+
+    The entities, their patient contexts and the values of each value
+    table are each inserted in batches of statements, without loading any
+    of them in the session.
+
+    :returns: the number of entities created
+    :rtype: int
+    """
+
+    if not records:
+        return 0
+
+    def audited(table, **values):
+        # The ORM attributes changes to the current user
+        for column in ('create_user_id', 'modify_user_id'):
+            if column in table.c:
+                values[column] = blame_id
+        return values
+
+    entity_table = datastore.Entity.__table__
+    context_table = datastore.Context.__table__
+
+    entity_ids = _insert_rows(
+        db_session,
+        entity_table,
+        [
+            audited(
+                entity_table,
+                schema_id=schema.id,
+                state_id=state.id,
+                collect_date=_to_python(record[collect_date_column]))
+            for record in records
+        ],
+        batch_size,
+        returning=entity_table.c.id)
+
+    _insert_rows(
+        db_session,
+        context_table,
+        [
+            audited(
+                context_table,
+                external=u'patient',
+                key=patients[record[pid_column]].id,
+                entity_id=entity_id)
+            for record, entity_id in zip(records, entity_ids)
+        ],
+        batch_size)
+
+    attributes = {a.name: a for a in schema.iterleafs()}
+    values = {}
+
+    for column_name, attribute_name in sorted(columns.items()):
+        attribute = attributes[attribute_name]
+        table = datastore.nameModelMap[attribute.type].__table__
+        choices = {c.name: c.id for c in attribute.choices.values()}
+        rows = values.setdefault(table, [])
+
+        for record, entity_id in zip(records, entity_ids):
+            value = record[column_name]
+
+            if attribute.is_collection and \
+                    isinstance(value, (list, tuple, set)):
+                items = value
+            elif _is_missing(value):
+                continue
+            else:
+                items = [value]
+
+            for item in items:
+                rows.append(audited(
+                    table,
+                    entity_id=entity_id,
+                    attribute_id=attribute.id,
+                    value=_convert_value(attribute, choices, item)))
+
+    for table, rows in values.items():
+        _insert_rows(db_session, table, rows, batch_size)
+
+    return len(records)
+
+
 def populate_project(
         db_session,
         project_name,
@@ -121,18 +474,33 @@ def populate_project(
         pid_column=DEFAULT_PID_COLUMN,
         visit_column=DEFAULT_VISIT_COLUMN,
         collect_date_column=DEFAULT_COLLECT_DATE_COLUMN,
+        batch_size=DEFAULT_BATCH_SIZE,
+        schema_names=None,
         ):
     """
     Processes a final dataframe (i.e. a frame after mappings have been applied)
     and creates entities for the target project.
 
+    Patients are pre-loaded in a single query and missing patients are
+    created together. Entities are then generated one schema at a time
+    from only the rows that have data for that schema. Entities and values
+    are inserted with multi-row INSERT statements per table, only schemata
+    with attributes stored on disk are populated through the ORM (see
+    ``apply_data``).
+
     :param db_session: Current database transaction session
     :type db_session: sqlalchemy.orm.session.Session
     :param project_name: study where entities will be applied
     :type project_name: str
     :param consolidated_frame: dataframe populated with mapped variables
     :type consolidated_frame: pandas.DataFrame
-    :returns: none
+    :param batch_size: (optional) Number of rows inserted per statement
+                       (or entities created between flushes)
+    :type batch_size: int
+    :param schema_names: (optional) Only create entities for these schemata
+    :type schema_names: set
+    :returns: the number of entities created
+    :rtype: int
     """
 
     site = db_session.query(studies.Site).filter_by(name=project_name).one()
@@ -147,60 +515,71 @@ def populate_project(
         .one()
     )
 
-    for index, row in consolidated_frame.iterrows():
-        pid = row['pid']
+    pids = consolidated_frame[pid_column]
+    patients = _load_patients(db_session, pids)
 
-        try:
-            patient = (
-                db_session.query(studies.Patient)
-                .filter_by(pid=pid)
-                .one()
-            )
-        except orm.exc.NoResultFound:
+    for pid in pids.unique():
+        if pid not in patients:
             patient = studies.Patient(site=site, pid=pid)
             db_session.add(patient)
-            db_session.flush()
+            patients[pid] = patient
 
-        for schema in project.schemata:
+    db_session.flush()
 
-            payload = {}
+    blame_id = _get_blame_id(db_session)
+    created = 0
 
-            for attribute in schema.iterleafs():
-                column_name = '_'.join([
-                    project.name, schema.name, attribute.name
-                ])
+    for schema in project.schemata:
 
-                if column_name not in row:
-                    continue
+        if schema_names is not None and schema.name not in schema_names:
+            continue
 
-                value = row[column_name]
+        columns = {}
 
-                if isinstance(value, numbers.Number) and math.isnan(value):
-                    continue
+        for attribute in schema.iterleafs():
+            column_name = '_'.join([
+                project.name, schema.name, attribute.name
+            ])
 
-                payload[attribute.name] = value
+            if column_name in consolidated_frame:
+                columns[column_name] = attribute.name
 
-            # Avoid creating empty records
-            if not payload:
-                continue
+        if not columns:
+            continue
 
-            calculated_collect_date_column = '_'.join([
-                project.name, schema.name, collect_date_column
-            ])
-            collect_date = row[calculated_collect_date_column]
+        calculated_collect_date_column = '_'.join([
+            project.name, schema.name, collect_date_column
+        ])
 
-            entity = datastore.Entity(
-                schema=schema,
-                collect_date=collect_date,
-                state=default_state
-            )
+        # The collect date may also be one of the schema's own attributes
+        selected_columns = [pid_column, calculated_collect_date_column]
+        selected_columns += [c for c in columns if c not in selected_columns]
 
-            patient.entities.add(entity)
+        # Avoid creating empty records
+        subframe = (
+            consolidated_frame
+            .loc[:, selected_columns]
+            .dropna(how='all', subset=list(columns))
+        )
 
-            upload_dir = tempfile.mkdtemp()
-            apply_data(db_session, entity, payload, upload_dir)
-            shutil.rmtree(upload_dir)
-            db_session.flush()
+        records = subframe.to_dict(orient='records')
+
+        if _has_blobs(schema):
+            created += _populate_schema_orm(
+                db_session, schema, records, columns, patients,
+                default_state, pid_column, calculated_collect_date_column,
+                batch_size)
+        else:
+            created += _populate_schema_bulk(
+                db_session, schema, records, columns, patients,
+                default_state, blame_id, pid_column,
+                calculated_collect_date_column, batch_size)
+
+    # Entities inserted in bulk are not in the patients' loaded collections
+    for patient in patients.values():
+        db_session.expire(patient, ['entities'])
+
+    return created
 
 
 def truncate_project(db_session, project_name):
@@ -236,12 +615,104 @@ def truncate_project(db_session, project_name):
     )
 
 
+def truncate_schema(db_session, project_name, schema_name, pids=None):
+    """
+    Removes the entities of a schema from a project
+
+    :param db_session: Current database transaction session
+    :type db_session: sqlalchemy.orm.session.Session
+    :param project_name: Project whose data will be removed
+    :type project_name: str
+    :param schema_name: Schema whose entities will be removed
+    :type schema_name: str
+    :param pids: (optional) Only remove the entities of these patients
+    :type pids: iterable
+    """
+
+    entities_query = (
+        db_session.query(datastore.Context.entity_id)
+        .join(
+            studies.Patient,
+            (studies.Patient.id == datastore.Context.key) &
+            (datastore.Context.external == 'patient')
+        )
+        .join(datastore.Entity, datastore.Entity.id == datastore.Context.entity_id)
+        .join(datastore.Schema, datastore.Schema.id == datastore.Entity.schema_id)
+        .filter(studies.Patient.site.has(name=project_name))
+        .filter(datastore.Schema.name == schema_name)
+    )
+
+    if pids is not None:
+        entities_query = (
+            entities_query
+            .filter(studies.Patient.pid.in_(list(pids)))
+        )
+
+    entity_ids = [entity_id for entity_id, in entities_query]
+
+    if not entity_ids:
+        return
+
+    (
+        db_session.query(datastore.Context)
+        .filter(datastore.Context.entity_id.in_(entity_ids))
+        .delete(synchronize_session=False)
+    )
+
+    (
+        db_session.query(datastore.Entity)
+        .filter(datastore.Entity.id.in_(entity_ids))
+        .delete(synchronize_session=False)
+    )
+
+
+def get_shards(pids, shard_count):
+    """
+    Assigns each PID to a shard
+
+    The assignment is based on a checksum of the PID so that it is stable
+    across processes and machines.
+
+    :param pids: The PIDs to assign
+    :type pids: pandas.Series
+    :param shard_count: The number of shards
+    :type shard_count: int
+
+    :returns: the shard number of each PID
+    :rtype: pandas.Series
+    """
+
+    def get_shard(pid):
+        checksum = zlib.crc32(six.text_type(pid).encode('utf-8'))
+        return (checksum & 0xffffffff) % shard_count
+
+    return pids.map(get_shard)
+
+
+def select_shard(frame, shard, pid_column=DEFAULT_PID_COLUMN):
+    """
+    Selects the rows of the patients in a shard
+
+    :param frame: The rows to select from
+    :type frame: pandas.DataFrame
+    :param shard: The (shard number, shard count) partition to select
+    :type shard: tuple
+    :param pid_column: (optional) Column name that contains the PID
+    :type pid_column: str
+
+    :rtype: pandas.DataFrame
+    """
+    shard_number, shard_count = shard
+    return frame[get_shards(frame[pid_column], shard_count) == shard_number]
+
+
 def load_project_frame(
         db_session,
         project_name,
         pid_column=DEFAULT_PID_COLUMN,
         visit_column=DEFAULT_VISIT_COLUMN,
         collect_date_column=DEFAULT_COLLECT_DATE_COLUMN,
+        shard=None,
         ):
     """
     Generates a data frame for all of the uploaded files for a given project
@@ -267,28 +738,100 @@ def load_project_frame(
     :param collect_date_column: (optional) Column name that contains
                                 the collect_date
     :type collect_date_column: str
+    :param shard: (optional) Only load the rows of the patients in the given
+                  (shard number, shard count) partition. Rows of other
+                  patients are dropped as each upload is read, unless the
+                  upload is cached, in which case its whole frame is
+                  loaded before selecting the shard.
+    :type shard: tuple
 
     :returns: data frame containing the merged data upload tables
     :rtype: pandas.DataFrame
     """
 
     uploads = get_uploads(db_session, project_name)
+    settings = db_session.info.get('settings')
+    upload_dir = storage.get_upload_dir(settings)
+    cache = FrameCache.from_settings(settings)
+
+    subframes = []
+
+    for upload in uploads:
+
+        if cache:
+            key = cache.make_key(
+                upload, pid_column, visit_column, collect_date_column)
+            subframe = cache.get(key)
+            if subframe is not None:
+                if shard is not None:
+                    subframe = select_shard(subframe, shard, pid_column)
+                subframes.append(subframe)
+                continue
 
-    subframes = iter(
-        load_schema_frame(
-            upload.study,
-            upload.schema,
-            io.BytesIO(upload.project_file),
-            pid_column=pid_column,
-            visit_column=visit_column,
-            collect_date_column=collect_date_column
-        )
-        for upload in uploads
-    )
+        with storage.open_upload(upload_dir, upload) as buffer_:
+            subframe = load_schema_frame(
+                upload.study,
+                upload.schema,
+                buffer_,
+                pid_column=pid_column,
+                visit_column=visit_column,
+                collect_date_column=collect_date_column,
+                # Cached frames are shared by every shard
+                shard=None if cache else shard
+            )
+
+        if cache:
+            cache.put(key, subframe)
+            if shard is not None:
+                subframe = select_shard(subframe, shard, pid_column)
 
-    frame = next(subframes)
+        subframes.append(subframe)
 
-    for sub in subframes:
-        frame = frame.merge(sub, on=['pid', 'visit'], how='outer')
+    frame = join_frames(subframes, [pid_column, visit_column])
 
     return frame
+
+
+def join_frames(frames, keys):
+    """
+    Outer-joins multiple data frames on the specified key columns
+
+    Rather than merging frames one at a time (which copies an ever-growing
+    frame on every step), every frame is indexed by the keys and then all
+    of them are aligned and combined in a single concatenation.
+
+    Frames that contain duplicate keys cannot be aligned this way, so they
+    are merged into the result afterwards to retain the many-to-many
+    semantics of an outer merge.
+
+    :param frames: Data frames to join
+    :type frames: list[pandas.DataFrame]
+    :param keys: The columns to join on (e.g. pid, visit)
+    :type keys: list[str]
+
+    :returns: data frame containing the joined frames
+    :rtype: pandas.DataFrame
+    """
+
+    if not frames:
+        return pd.DataFrame(columns=keys)
+
+    indexed = []
+    duplicated = []
+
+    for frame in frames:
+        sub = frame.set_index(keys)
+        if sub.index.is_unique:
+            indexed.append(sub)
+        else:
+            duplicated.append(frame)
+
+    if indexed:
+        joined = pd.concat(indexed, axis=1, join='outer').reset_index()
+    else:
+        joined, duplicated = duplicated[0], duplicated[1:]
+
+    for sub in duplicated:
+        joined = joined.merge(sub, on=keys, how='outer')
+
+    return joined
@@ -0,0 +1,244 @@
+"""
+Instrumentation of the mapping pipeline
+
+Each phase of the pipeline (loading the project frame, applying mappings,
+truncating and populating the target project) and each individual mapping
+is measured for its wall time, CPU time, the peak resident memory of the
+process and, where applicable, the size of the data frame it produced.
+
+Measurements are published through the status channel as ``timing``
+events as soon as they are taken and summarized for the job record.
+
+When ``imports.profile.dir`` is configured, each phase is additionally run
+under :mod:`cProfile` and its statistics are written to
+``<dir>/<job>-<phase>.prof`` for inspection with :mod:`pstats` or tools
+such as snakeviz.
+
+.. note:: cProfile only profiles the thread that runs the phase, mappings
+          applied by concurrent workers are only covered by their timers.
+"""
+
+import collections
+import contextlib
+import cProfile
+import errno
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # pragma: no cover (not available on Windows)
+    resource = None
+
+
+PROFILE_DIR_SETTING = 'imports.profile.dir'
+
+
+def get_cpu_time():
+    """
+    Returns the CPU time consumed by the current thread, if supported
+
+    :returns: user and system time in seconds
+    :rtype: float
+    """
+    if resource is None:
+        return time.process_time()
+    who = getattr(resource, 'RUSAGE_THREAD', resource.RUSAGE_SELF)
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def get_peak_rss():
+    """
+    Returns the peak resident memory of the process
+
+    :returns: the peak resident set size in bytes, `None` if unsupported
+    :rtype: int
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def describe_frame(frame):
+    """
+    Summarizes the size of a data frame
+
+    :param frame: The frame to describe
+    :type frame: pandas.DataFrame
+
+    :returns: the number of rows, columns and bytes used by the values
+    :rtype: dict
+    """
+    return {
+        'rows': len(frame),
+        'columns': len(frame.columns),
+        'bytes': int(frame.memory_usage(index=True).sum()),
+    }
+
+
+class Profiler(object):
+    """
+    Collects the measurements of a single job (or shard of a job)
+
+    Mappings may be measured from multiple threads concurrently.
+    """
+
+    def __init__(self, name=None, channel=None, profile_dir=None):
+        self._name = name
+        self._channel = channel
+        self._profile_dir = profile_dir
+        self._lock = threading.Lock()
+        self._phases = collections.OrderedDict()
+        self._mappings = collections.OrderedDict()
+        self._profiles = {}
+
+    @classmethod
+    def from_settings(cls, settings, name=None, channel=None):
+        """
+        Creates a profiler, with cProfile enabled if configured
+
+        :param settings: Application settings
+        :type settings: dict
+        :param name: The name of the job, used to name profile dumps
+        :type name: str
+        :param channel: (optional) Channel to publish measurements to
+        :type channel: occams_imports.importers.utils.pubsub.ImportStatusChannel
+
+        :rtype: Profiler
+        """
+        profile_dir = (settings or {}).get(PROFILE_DIR_SETTING) or None
+        return cls(name, channel, profile_dir)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Measures a phase of the pipeline
+
+        A phase that is entered multiple times accumulates its measurements.
+        The block may report the frame it produced by adding its description
+        to the yielded dictionary under ``frame``
+        (see :func:`describe_frame`).
+
+        :param name: The name of the phase (e.g. ``load``)
+        :type name: str
+        """
+
+        profile = None
+
+        if self._profile_dir:
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+
+        details = {}
+        start, start_cpu = time.time(), get_cpu_time()
+
+        if profile is not None:
+            profile.enable()
+
+        try:
+            yield details
+        finally:
+            if profile is not None:
+                profile.disable()
+
+            stats = self._measure(start, start_cpu)
+
+            if 'frame' in details:
+                stats['frame'] = details['frame']
+
+            with self._lock:
+                stats = _accumulate(self._phases.get(name), stats)
+                self._phases[name] = stats
+
+            if profile is not None:
+                self._dump(name, profile)
+
+            if self._channel is not None:
+                self._channel.send_timing(stats, phase=name)
+
+    @contextlib.contextmanager
+    def mapping(self, mapping):
+        """
+        Measures the application of a single mapping
+
+        :param mapping: The mapping being applied
+        :type mapping: occams_imports.models.Mapping
+        """
+
+        start, start_cpu = time.time(), get_cpu_time()
+
+        try:
+            yield
+        finally:
+            stats = self._measure(start, start_cpu)
+
+            with self._lock:
+                self._mappings[str(mapping.id)] = stats
+
+            if self._channel is not None:
+                self._channel.send_timing(stats, mapping=mapping.id)
+
+    def timings(self):
+        """
+        Returns the wall time of each phase
+
+        :returns: seconds spent in each phase, by phase name
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                name: stats['wall']
+                for name, stats in self._phases.items()
+            }
+
+    def summary(self):
+        """
+        Returns all measurements taken so far
+
+        :returns: the measurements of each phase and of each mapping (by id)
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'phases': dict(self._phases),
+                'mappings': dict(self._mappings),
+            }
+
+    def _measure(self, start, start_cpu):
+        return {
+            'wall': time.time() - start,
+            'cpu': get_cpu_time() - start_cpu,
+            'peak_rss': get_peak_rss(),
+        }
+
+    def _dump(self, phase, profile):
+        _makedirs(self._profile_dir)
+        filename = '-'.join(filter(None, [self._name, phase])) + '.prof'
+        profile.dump_stats(os.path.join(self._profile_dir, filename))
+
+
+def _accumulate(previous, stats):
+    if previous is None:
+        return stats
+
+    accumulated = dict(previous)
+    accumulated['wall'] += stats['wall']
+    accumulated['cpu'] += stats['cpu']
+    accumulated['peak_rss'] = stats['peak_rss']
+
+    if 'frame' in stats:
+        accumulated['frame'] = stats['frame']
+
+    return accumulated
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
@@ -1,48 +1,442 @@
+import collections
 import json
+import logging
+import threading
+import time
+
+from six.moves import queue
+
+
+log = logging.getLogger(__name__)
 
 
 _CHANNEL = 'mapping'
 
+FLUSH_INTERVAL_SETTING = 'imports.status.flush_interval'
+FLUSH_SIZE_SETTING = 'imports.status.flush_size'
+
+DEFAULT_FLUSH_INTERVAL = 0.5  # seconds
+DEFAULT_FLUSH_SIZE = 100
+
+# Number of events kept per job for clients that reconnect
+DEFAULT_LOG_SIZE = 1000
+# Seconds the events of a job are kept after its last event
+DEFAULT_LOG_TTL = 24 * 60 * 60
+# Number of undelivered events a client may fall behind before
+# being disconnected
+DEFAULT_QUEUE_SIZE = 1000
+
+
+def get_sequence_key(jobid):
+    """
+    Returns the redis key of the counter that numbers a job's events
+    """
+    return u'imports:status:{}:sequence'.format(jobid)
+
+
+def get_log_key(jobid):
+    """
+    Returns the redis key of the list of a job's most recent events
+    """
+    return u'imports:status:{}:events'.format(jobid)
+
 
 class ImportStatusChannel(object):
+    """
+    Publishes the status events of a job
+
+    Events are numbered (``id``) by a counter shared by all the workers of
+    the job and kept in a bounded log, so that clients may resume from the
+    last event they have seen in any process (see :class:`StatusBroadcaster`).
+    """
 
-    def __init__(self, redis, jobid, channel=_CHANNEL):
+    def __init__(self, redis, jobid, channel=_CHANNEL,
+                 log_size=DEFAULT_LOG_SIZE):
         self._redis = redis
         self._jobid = jobid
         self._channel = channel
+        self._log_size = log_size
 
     def send_reset(self, total_items):
         redis = self._redis
         jobid = self._jobid
         redis.hmset(jobid, {'count': 0, 'total': total_items})
 
-    def send_progress(self):
+    def send_progress(self, count=1):
         redis = self._redis
         jobid = self._jobid
-        channel = self._channel
 
-        redis.hincrby(jobid, 'count')
+        redis.hincrby(jobid, 'count', count)
 
         # redis-py returns everything as string, so we need to clean it
         raw = redis.hgetall(jobid)
         data = {
             'event': 'progress',
+            'jobid': jobid,
             'count': int(raw['count']),
             'total': int(raw['total'])
         }
-        notification = json.dumps(data)
-        redis.publish(channel, notification)
+        self._publish([data])
 
     def send_message(self, mapping, message):
-        redis = self._redis
+        self._publish([self._make_message(mapping, message)])
+
+    def send_timing(self, stats, **subject):
+        self._publish([self._make_timing(stats, subject)])
+
+    def send_error(self, error):
+        self._publish([self._make_error(error)])
+
+    def send_complete(self, **details):
+        self._publish([dict(details, event='complete', jobid=self._jobid)])
+
+    def flush(self):
+        """
+        Sends any pending events, events are not buffered by default
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def _publish(self, events):
+        """
+        Numbers, logs and publishes events
+        """
+        sequence_key = get_sequence_key(self._jobid)
+        last_id = self._redis.incrby(sequence_key, len(events))
+        self._send(events, int(last_id))
+
+    def _send(self, events, last_id):
+        """
+        Logs and publishes events numbered up to an already reserved id
+
+        :param events: The events to send, in order
+        :type events: list[dict]
+        :param last_id: The number reserved for the last event
+        :type last_id: int
+        """
         channel = self._channel
+        log_key = get_log_key(self._jobid)
+        pipeline = self._redis.pipeline(transaction=False)
 
-        data = {
+        for number, data in enumerate(events, last_id - len(events) + 1):
+            notification = json.dumps(dict(data, id=number))
+            pipeline.rpush(log_key, notification)
+            pipeline.publish(channel, notification)
+
+        pipeline.ltrim(log_key, -self._log_size, -1)
+        pipeline.expire(log_key, DEFAULT_LOG_TTL)
+        pipeline.expire(get_sequence_key(self._jobid), DEFAULT_LOG_TTL)
+        pipeline.execute()
+
+    def _make_timing(self, stats, subject):
+        return dict(stats, event='timing', jobid=self._jobid, **subject)
+
+    def _make_error(self, error):
+        return {'event': 'error', 'jobid': self._jobid, 'error': error}
+
+    def _make_message(self, mapping, message):
+        return {
             'event': 'message',
+            'jobid': self._jobid,
             'schema': mapping.logic.get('target_schema'),
             'variable': mapping.logic.get('target_variable'),
             'message': message.format(mappings=mapping)
         }
 
-        notification = json.dumps(data)
-        redis.publish(channel, notification)
+
+class BufferedImportStatusChannel(ImportStatusChannel):
+    """
+    A status channel that sends events in batches
+
+    Progress increments and messages are buffered and sent together in a
+    single Redis pipeline once the buffer holds ``flush_size`` events or
+    ``flush_interval`` seconds have passed since the last batch, on a timer
+    so that buffered events are sent even if no other event follows (e.g.
+    during a long phase). Progress increments within a batch are coalesced
+    into a single progress event.
+
+    Events may be sent from multiple threads. Call :meth:`flush` (or use the
+    channel as a context manager) to send the remaining events when done.
+    """
+
+    def __init__(
+            self,
+            redis,
+            jobid,
+            channel=_CHANNEL,
+            flush_interval=DEFAULT_FLUSH_INTERVAL,
+            flush_size=DEFAULT_FLUSH_SIZE,
+            ):
+        super(BufferedImportStatusChannel, self).__init__(
+            redis, jobid, channel)
+        self._flush_interval = flush_interval
+        self._flush_size = flush_size
+        self._lock = threading.Lock()
+        self._progress = 0
+        self._messages = []
+        self._last_flush = time.time()
+        self._timer = None
+
+    @classmethod
+    def from_settings(cls, redis, jobid, settings, channel=_CHANNEL):
+        """
+        Creates a channel with the configured batching window
+
+        :param redis: Application redis session
+        :type redis: redis.StrictRedis
+        :param jobid: The job the events belong to
+        :type jobid: str
+        :param settings: Application settings
+        :type settings: dict
+
+        :returns: the configured channel
+        :rtype: BufferedImportStatusChannel
+        """
+        settings = settings or {}
+        flush_interval = settings.get(FLUSH_INTERVAL_SETTING)
+        flush_size = settings.get(FLUSH_SIZE_SETTING)
+
+        return cls(
+            redis,
+            jobid,
+            channel,
+            flush_interval=(
+                DEFAULT_FLUSH_INTERVAL if flush_interval is None
+                else float(flush_interval)),
+            flush_size=(
+                DEFAULT_FLUSH_SIZE if flush_size is None
+                else int(flush_size)),
+        )
+
+    def send_reset(self, total_items):
+        self.flush()
+        super(BufferedImportStatusChannel, self).send_reset(total_items)
+
+    def send_progress(self, count=1):
+        with self._lock:
+            self._progress += count
+            self._flush_if_due()
+
+    def send_message(self, mapping, message):
+        data = self._make_message(mapping, message)
+        with self._lock:
+            self._messages.append(data)
+            self._flush_if_due()
+
+    def send_timing(self, stats, **subject):
+        data = self._make_timing(stats, subject)
+        with self._lock:
+            self._messages.append(data)
+            self._flush_if_due()
+
+    def send_error(self, error):
+        data = self._make_error(error)
+        with self._lock:
+            self._messages.append(data)
+            self._flush_if_due()
+
+    def send_complete(self, **details):
+        self.flush()
+        super(BufferedImportStatusChannel, self).send_complete(**details)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush_if_due(self):
+        pending = self._progress + len(self._messages)
+        elapsed = time.time() - self._last_flush
+
+        if pending >= self._flush_size or elapsed >= self._flush_interval:
+            self._flush()
+        elif self._timer is None:
+            # Send the buffered events even if no other event follows
+            self._timer = threading.Timer(
+                self._flush_interval - elapsed, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush(self):
+        redis = self._redis
+        jobid = self._jobid
+
+        progress, self._progress = self._progress, 0
+        messages, self._messages = self._messages, []
+        self._last_flush = time.time()
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not progress and not messages:
+            return
+
+        # Reserve the events' numbers along with the progress count
+        pipeline = redis.pipeline(transaction=False)
+        pipeline.incrby(
+            get_sequence_key(jobid), len(messages) + (1 if progress else 0))
+
+        if progress:
+            pipeline.hincrby(jobid, 'count', progress)
+            pipeline.hget(jobid, 'total')
+
+        results = pipeline.execute()
+        last_id = int(results[0])
+
+        if progress:
+            # The counter may be shared with other workers, so report the
+            # total count rather than this worker's own progress
+            count, total = results[1:]
+            messages.append({
+                'event': 'progress',
+                'jobid': jobid,
+                'count': int(count),
+                'total': int(total)
+            })
+
+        self._send(messages, last_id)
+
+
+class StatusBroadcaster(object):
+    """
+    Fans status events out from a single subscription to many listeners
+
+    A single background subscriber receives every event published to the
+    channel, decodes it once, and delivers it to the listeners of the job
+    the event belongs to. Events are numbered by their publishers and the
+    most recent ones of each job are logged in redis, so that a listener
+    can resume from the last event it has seen in any process.
+
+    Listeners that fall too far behind are dropped (they receive `None`)
+    and may resume from the log.
+    """
+
+    def __init__(
+            self,
+            redis,
+            channel=_CHANNEL,
+            queue_size=DEFAULT_QUEUE_SIZE,
+            ):
+        self._redis = redis
+        self._channel = channel
+        self._queue_size = queue_size
+        self._lock = threading.Lock()
+        self._listeners = collections.defaultdict(set)
+        self._thread = None
+
+    def subscribe(self, jobid, last_event_id=None):
+        """
+        Registers a listener for the events of a job
+
+        The listener is registered before the log is read, so events sent
+        meanwhile may be both logged and queued, listeners should skip the
+        events numbered up to the last one they have received.
+
+        :param jobid: The job to listen to
+        :type jobid: str
+        :param last_event_id: (optional) The number of the last event the
+                              listener has already received
+        :type last_event_id: int
+
+        :returns: the logged events the listener has not seen yet and the
+                  queue future events will be delivered to, as
+                  (number, event name, JSON payload) tuples
+        :rtype: (list, queue.Queue)
+        """
+
+        self._start()
+
+        listener = queue.Queue(maxsize=self._queue_size)
+
+        with self._lock:
+            self._listeners[jobid].add(listener)
+
+        events = [
+            self._decode(payload)[1]
+            for payload in self._redis.lrange(get_log_key(jobid), 0, -1)
+        ]
+
+        if last_event_id is not None:
+            events = [e for e in events if e[0] > last_event_id]
+
+        return sorted(events, key=lambda e: e[0]), listener
+
+    def unsubscribe(self, jobid, listener):
+        """
+        Removes a listener registered with :meth:`subscribe`
+        """
+        with self._lock:
+            listeners = self._listeners.get(jobid)
+            if listeners is None:
+                return
+            listeners.discard(listener)
+            if not listeners:
+                del self._listeners[jobid]
+
+    def dispatch(self, payload):
+        """
+        Delivers a published event to the job's listeners
+
+        :param payload: The JSON-encoded event
+        :type payload: str
+        """
+
+        jobid, event = self._decode(payload)
+
+        if jobid is None:
+            return
+
+        with self._lock:
+            listeners = list(self._listeners.get(jobid, []))
+
+        for listener in listeners:
+            try:
+                listener.put_nowait(event)
+            except queue.Full:
+                self._drop(jobid, listener)
+
+    def _decode(self, payload):
+        """
+        Returns the job of an event and the event as delivered to listeners
+        """
+
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8')
+
+        data = json.loads(payload)
+
+        return data.get('jobid'), (data.get('id'), data['event'], payload)
+
+    def _drop(self, jobid, listener):
+        self.unsubscribe(jobid, listener)
+        # Make room to signal the listener it has been disconnected
+        try:
+            listener.get_nowait()
+        except queue.Empty:
+            pass
+        listener.put_nowait(None)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub()
+                pubsub.subscribe(self._channel)
+                for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    self.dispatch(message['data'])
+            except Exception:
+                log.exception('Status subscription failed, reconnecting')
+                time.sleep(1)
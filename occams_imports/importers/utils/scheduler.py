@@ -0,0 +1,253 @@
+"""
+Dependency-aware scheduling of mappings over a project frame
+
+Most mappings read disjoint source columns and write distinct target
+columns, so they can be computed independently of each other. Mappings are
+partitioned into components: mappings that write the same column (e.g. the
+collect date of a shared target schema) or that read a column another
+mapping writes end up in the same component and are applied in order.
+Components are then applied concurrently, each on its own copy of just the
+columns it needs, and their results are merged back into the project frame
+in a deterministic order.
+"""
+
+from multiprocessing.pool import ThreadPool
+
+from .pivot import DEFAULT_COLLECT_DATE_COLUMN
+
+
+WORKERS_SETTING = 'imports.mapping.workers'
+SHARDS_SETTING = 'imports.mapping.shards'
+
+
+def get_workers(settings):
+    """
+    Returns the configured number of concurrent mapping workers
+
+    :param settings: Application settings
+    :type settings: dict
+
+    :returns: the number of workers, defaults to applying mappings serially
+    :rtype: int
+    """
+    return int((settings or {}).get(WORKERS_SETTING) or 1)
+
+
+def get_shard_count(settings):
+    """
+    Returns the configured number of patient shards
+
+    When greater than one, the mapping pipeline is distributed across
+    workers, each applying the mappings to the patients of its own shard.
+
+    :param settings: Application settings
+    :type settings: dict
+
+    :returns: the number of shards, defaults to a single shard
+    :rtype: int
+    """
+    return int((settings or {}).get(SHARDS_SETTING) or 1)
+
+
+def get_columns(
+        mapping,
+        source_project_name,
+        target_project_name,
+        collect_date_column=DEFAULT_COLLECT_DATE_COLUMN,
+        ):
+    """
+    Determines the frame columns a mapping reads and writes
+
+    :param mapping: The mapping to inspect
+    :type mapping: occams_imports.models.Mapping
+    :param source_project_name: Source project the mapping belongs to
+    :type source_project_name: str
+    :param target_project_name: Target project to transfer the results
+    :type target_project_name: str
+
+    :returns: the columns read and the columns written by the mapping
+    :rtype: (set, set)
+    """
+
+    logic = mapping.logic or {}
+    reads = set()
+
+    target_schema_name = logic.get('target_schema')
+    writes = {
+        '_'.join([
+            target_project_name, target_schema_name,
+            logic.get('target_variable')
+        ]),
+        '_'.join([
+            target_project_name, target_schema_name, collect_date_column
+        ]),
+    }
+
+    if mapping.type == 'direct':
+        source_schema_name = logic.get('source_schema')
+        source_column = '_'.join([
+            source_project_name, source_schema_name,
+            logic.get('source_variable')
+        ])
+        reads.add(source_column)
+        reads.add('_'.join([
+            source_project_name, source_schema_name, collect_date_column
+        ]))
+        # Missing source columns are filled in by the mapper
+        writes.add(source_column)
+
+    else:
+        for group in (logic.get('groups') or []):
+            for conversion in (group.get('conversions') or []):
+                if not conversion.get('byVariable'):
+                    continue
+                value = conversion.get('value') or {}
+                reads.add('_'.join([
+                    mapping.study.name,
+                    (value.get('schema') or {}).get('name'),
+                    (value.get('attribute') or {}).get('name'),
+                ]))
+
+        for schema_name, __ in (logic.get('forms') or []):
+            reads.add('_'.join([
+                source_project_name, schema_name, collect_date_column
+            ]))
+
+    # Values already in the target columns are taken into account
+    reads |= writes
+
+    return reads, writes
+
+
+def plan(mappings, source_project_name, target_project_name):
+    """
+    Partitions mappings into independent components
+
+    :param mappings: The mappings in the order they are applied
+    :type mappings: list[occams_imports.models.Mapping]
+    :param source_project_name: Source project the mappings belong to
+    :type source_project_name: str
+    :param target_project_name: Target project to transfer the results
+    :type target_project_name: str
+
+    :returns: the components as (mappings, columns read, columns written)
+              tuples, ordered by the position of their first mapping. The
+              mappings of each component retain their original order.
+    :rtype: list[(list, set, set)]
+    """
+
+    columns = [
+        get_columns(m, source_project_name, target_project_name)
+        for m in mappings
+    ]
+
+    written = set()
+    for __, writes in columns:
+        written |= writes
+
+    # Union-find over mapping positions, joined by the columns they share
+    parents = list(range(len(mappings)))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    owners = {}
+
+    for i, (reads, writes) in enumerate(columns):
+        for column in writes | (reads & written):
+            if column in owners:
+                root_i, root_j = find(i), find(owners[column])
+                if root_i != root_j:
+                    parents[max(root_i, root_j)] = min(root_i, root_j)
+            else:
+                owners[column] = i
+
+    components = {}
+    order = []
+
+    for i, mapping in enumerate(mappings):
+        root = find(i)
+        if root not in components:
+            components[root] = ([], set(), set())
+            order.append(root)
+        component_mappings, reads, writes = components[root]
+        component_mappings.append(mapping)
+        reads |= columns[i][0]
+        writes |= columns[i][1]
+
+    return [components[root] for root in order]
+
+
+def run(
+        mappings,
+        frame,
+        apply,
+        source_project_name,
+        target_project_name,
+        workers=1,
+        cleanup=None,
+        ):
+    """
+    Applies mappings to the frame, concurrently where possible
+
+    :param mappings: The mappings in the order they are applied
+    :type mappings: list[occams_imports.models.Mapping]
+    :param frame: The project data frame, which will be updated in place
+    :type frame: pandas.DataFrame
+    :param apply: Callback that applies a single mapping to a frame,
+                  invoked as ``apply(frame, mapping)``
+    :type apply: callable
+    :param source_project_name: Source project the mappings belong to
+    :type source_project_name: str
+    :param target_project_name: Target project to transfer the results
+    :type target_project_name: str
+    :param workers: (optional) Number of concurrent workers, mappings are
+                    applied serially to the frame itself if less than two
+    :type workers: int
+    :param cleanup: (optional) Callback invoked by a worker thread once it
+                    has finished a component (e.g. to release its database
+                    session)
+    :type cleanup: callable
+
+    :returns: the updated frame
+    :rtype: pandas.DataFrame
+    """
+
+    mappings = list(mappings)
+
+    if workers < 2:
+        for mapping in mappings:
+            apply(frame, mapping)
+        return frame
+
+    components = plan(mappings, source_project_name, target_project_name)
+
+    def run_component(component):
+        component_mappings, reads, __ = component
+        columns = [c for c in frame.columns if c in reads]
+        subframe = frame.loc[:, columns].copy()
+        try:
+            for mapping in component_mappings:
+                apply(subframe, mapping)
+        finally:
+            if cleanup is not None:
+                cleanup()
+        return subframe
+
+    pool = ThreadPool(min(workers, len(components)) or 1)
+
+    try:
+        results = pool.map(run_component, components)
+    finally:
+        pool.close()
+        pool.join()
+
+    for (__, __, writes), subframe in zip(components, results):
+        for column in subframe.columns:
+            if column in writes or column not in frame:
+                frame[column] = subframe[column]
+
+    return frame
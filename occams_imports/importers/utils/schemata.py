@@ -0,0 +1,88 @@
+"""
+Bulk lookups of existing schemata for codebook imports and uploads
+
+Codebooks may describe many forms and uploads name the form of their data
+file, so the matching schemata are looked up in a single query rather than
+one query per form.
+"""
+
+import collections
+
+import sqlalchemy as sa
+
+from occams_datastore import models as datastore
+
+
+def find_existing_forms(db_session, forms):
+    """
+    Finds which of the given forms already exist, in a single query
+
+    :param db_session: Application database session
+    :type db_session: sqlalchemy.orm.Session
+    :param forms: (name, title, publish_date) of each candidate form
+    :type forms: iterable[tuple]
+
+    :returns: the candidates that match an existing schema
+    :rtype: set[tuple]
+    """
+
+    forms = set(forms)
+
+    if not forms:
+        return set()
+
+    key = sa.tuple_(
+        datastore.Schema.name,
+        datastore.Schema.title,
+        datastore.Schema.publish_date
+    )
+
+    query = (
+        db_session.query(
+            datastore.Schema.name,
+            datastore.Schema.title,
+            datastore.Schema.publish_date)
+        .filter(key.in_(list(forms)))
+    )
+
+    # Publish dates may be given as ISO strings, so match them in either form
+    existing = set()
+    for name, title, publish_date in query:
+        existing.add((name, title, publish_date))
+        existing.add((name, title, publish_date.isoformat()))
+
+    return forms & existing
+
+
+def get_schema_versions(db_session, names):
+    """
+    Loads all published versions of the given schemata, in a single query
+
+    :param db_session: Application database session
+    :type db_session: sqlalchemy.orm.Session
+    :param names: The names of the schemata
+    :type names: iterable[str]
+
+    :returns: the published versions of each schema that exists, by name,
+              ordered by publish date (oldest first), drafts are left out
+    :rtype: dict
+    """
+
+    names = set(names)
+    names.discard(None)
+
+    if not names:
+        return {}
+
+    query = (
+        db_session.query(datastore.Schema)
+        .filter(datastore.Schema.name.in_(names))
+        .filter(datastore.Schema.publish_date != sa.null())
+        .order_by(datastore.Schema.name, datastore.Schema.publish_date.asc())
+    )
+
+    versions = collections.defaultdict(list)
+    for schema in query:
+        versions[schema.name].append(schema)
+
+    return dict(versions)
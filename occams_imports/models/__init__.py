@@ -1,14 +1,17 @@
 from sqlalchemy.orm import configure_mappers
 
 from .import_ import ImportFactory, Import  # noqa
+from .job import Job  # noqa
 from .mapping import Mapping  # noqa
 from .sitedata import SiteData  # noqa
+from .snapshot import Snapshot  # noqa
 from .status import Status  # noqa
 from .upload import Upload  # noqa
 
 from .project import ProjectFactory, Project  # noqa
 from .table import TableFactory, Table  # noqa
 from .variable import VariableFactory, Variable, Choice  # noqa
+from .vocabulary import vocabulary  # noqa
 
 # run configure_mappers after defining all of the models to ensure
 # all relationships can be setup
@@ -0,0 +1,99 @@
+"""Model definitions to track mapping pipeline runs."""
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+from sqlalchemy.dialects.postgresql import JSONB
+
+from occams_datastore import models as datastore
+from occams_studies import models as studies
+
+from .meta import Base
+
+
+class Job(Base, datastore.Referenceable, datastore.Modifiable):
+    """Records a run of the mapping pipeline and its outcome.
+
+    :param Base: SQLAlchemy Base class
+    :param datastore.Referenceable: SQLAlchemy mixin...adds primary key id
+                                    columns to tables.
+    :param datastore.Modifiable: SQLAlchemy mixin...adds user edit
+                                 modification meta data for lifecycle tracking.
+    """
+
+    __tablename__ = 'job'
+
+    PENDING = u'pending'
+    RUNNING = u'running'
+    COMPLETE = u'complete'
+    FAILED = u'failed'
+
+    STATUSES = (PENDING, RUNNING, COMPLETE, FAILED)
+
+    # Jobs that have not finished yet
+    ACTIVE_STATUSES = (PENDING, RUNNING)
+
+    name = sa.Column(
+        sa.String,
+        nullable=False,
+        unique=True,
+        doc='The unique name the job was dispatched with'
+    )
+
+    study_id = sa.Column(
+        sa.ForeignKey(studies.Study.id, ondelete='CASCADE'),
+        nullable=False
+    )
+
+    study = orm.relationship(studies.Study, foreign_keys=[study_id])
+
+    target_study_id = sa.Column(
+        sa.ForeignKey(studies.Study.id, ondelete='CASCADE'),
+        nullable=False
+    )
+
+    target_study = orm.relationship(
+        studies.Study,
+        foreign_keys=[target_study_id]
+    )
+
+    status = sa.Column(sa.String, nullable=False, default=PENDING)
+
+    incremental = sa.Column(sa.Boolean, nullable=False, default=False)
+
+    shards = sa.Column(sa.Integer, nullable=False, default=1)
+
+    start_date = sa.Column(sa.DateTime)
+
+    end_date = sa.Column(sa.DateTime)
+
+    timings = sa.Column(
+        JSONB,
+        doc='Seconds spent in each phase of the pipeline, by phase name'
+    )
+
+    profile = sa.Column(
+        JSONB,
+        doc='Detailed measurements of each phase and of each mapping'
+    )
+
+    mapping_count = sa.Column(sa.Integer)
+
+    row_count = sa.Column(
+        sa.Integer,
+        doc='Number of rows in the project data frame'
+    )
+
+    entity_count = sa.Column(
+        sa.Integer,
+        doc='Number of entities written to the target project'
+    )
+
+    error = sa.Column(sa.UnicodeText)
+
+    __table_args__ = (
+        sa.CheckConstraint(
+            "status IN ('pending', 'running', 'complete', 'failed')",
+            name='ck_job_valid_status'
+        ),
+        sa.Index('ix_job_study_id_create_date', 'study_id', 'create_date'),
+    )
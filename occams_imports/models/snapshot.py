@@ -0,0 +1,41 @@
+"""Model definitions to track the mapped data applied to target projects."""
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from occams_datastore import models as datastore
+from occams_studies import models as studies
+
+from .meta import Base
+
+
+class Snapshot(Base, datastore.Referenceable, datastore.Modifiable):
+    """Records which mapping results a target project schema was built from.
+
+    The fingerprint identifies the mappings and source uploads that
+    generated the schema's entities, so that unchanged schemata can be
+    skipped when mappings are re-applied incrementally.
+
+    :param Base: SQLAlchemy Base class
+    :param datastore.Referenceable: SQLAlchemy mixin...adds primary key id
+                                    columns to tables.
+    :param datastore.Modifiable: SQLAlchemy mixin...adds user edit
+                                 modification meta data for lifecycle tracking.
+    """
+
+    __tablename__ = 'snapshot'
+
+    study_id = sa.Column(
+        sa.ForeignKey(studies.Study.id, ondelete='CASCADE'),
+        nullable=False
+    )
+
+    study = orm.relationship(studies.Study)
+
+    schema_name = sa.Column(sa.String, nullable=False)
+
+    fingerprint = sa.Column(sa.String, nullable=False)
+
+    __table_args__ = (
+        sa.UniqueConstraint(study_id, schema_name),
+    )
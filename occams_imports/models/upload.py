@@ -36,6 +36,18 @@ class Upload(Base, datastore.Referenceable, datastore.Modifiable):
 
     schema = orm.relationship(datastore.Schema)
 
-    project_file = sa.Column(BYTEA, nullable=False)
+    # Legacy in-database storage, uploads are now kept in the file store
+    # (see :mod:`occams_imports.storage`) when one is configured
+    project_file = sa.Column(BYTEA)
 
     filename = sa.Column(String, nullable=False)
+
+    checksum = sa.Column(
+        String,
+        doc='SHA-256 hex digest of the file contents'
+    )
+
+    size = sa.Column(
+        sa.BigInteger,
+        doc='Size of the file contents in bytes'
+    )
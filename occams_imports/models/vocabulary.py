@@ -0,0 +1,154 @@
+"""Searchable vocabulary of the schemata, attributes and choices.
+
+The mapping pages search the datastore's forms, variables and answer
+choices as users type. The vocabulary denormalizes them into a single
+materialized view in the imports schema, with the schema (and attribute)
+each term belongs to and a trigram-indexed search document, so that
+searches neither scan nor join the datastore tables.
+
+The view is refreshed in the background after codebooks are imported and
+periodically, so forms published by other applications are searchable
+after at most one refresh interval
+(see :func:`occams_imports.tasks.refresh_vocabulary`).
+"""
+
+import sqlalchemy as sa
+
+from occams_datastore import models as datastore
+from occams_studies import models as studies
+
+from .meta import Base
+
+
+SCHEMA = u'schema'
+ATTRIBUTE = u'attribute'
+CHOICE = u'choice'
+
+
+# Not part of Base.metadata, the view is managed by the events below
+vocabulary = sa.Table(
+    'vocabulary',
+    sa.MetaData(schema='imports'),
+    sa.Column('kind', sa.String),
+    sa.Column('object_id', sa.Integer),
+    sa.Column('schema_name', sa.String),
+    sa.Column('publish_date', sa.Date),
+    sa.Column('attribute_name', sa.String),
+    sa.Column('name', sa.String),
+    sa.Column('title', sa.String),
+    sa.Column('type', sa.String),
+    sa.Column('order', sa.Integer),
+    sa.Column('document', sa.String),
+)
+
+
+def _select_vocabulary():
+    """Returns the query of the vocabulary's terms."""
+
+    schema = datastore.Schema.__table__
+    attribute = datastore.Attribute.__table__
+    choice = datastore.Choice.__table__
+    study_schema = studies.Study.schemata.property.secondary
+
+    def kind(value):
+        return sa.literal_column(u"'{}'".format(value), sa.String)
+
+    def null(type_):
+        return sa.cast(sa.null(), type_)
+
+    def columns(*values):
+        return [
+            value.label(column.name)
+            for column, value in zip(vocabulary.columns, values)
+        ]
+
+    # mappings may only occur with schemas associated with a study
+    schemata = (
+        sa.select(columns(
+            kind(SCHEMA),
+            schema.c.id,
+            schema.c.name,
+            schema.c.publish_date,
+            null(sa.String),
+            schema.c.name,
+            schema.c.title,
+            null(sa.String),
+            null(sa.Integer),
+            sa.func.lower(schema.c.name)))
+        .where(sa.exists()
+               .where(study_schema.c.schema_id == schema.c.id)))
+
+    attributes = (
+        sa.select(columns(
+            kind(ATTRIBUTE),
+            attribute.c.id,
+            schema.c.name,
+            schema.c.publish_date,
+            attribute.c.name,
+            attribute.c.name,
+            attribute.c.title,
+            attribute.c.type,
+            attribute.c.order,
+            sa.func.lower(attribute.c.name)))
+        .select_from(attribute.join(
+            schema, schema.c.id == attribute.c.schema_id)))
+
+    choices = (
+        sa.select(columns(
+            kind(CHOICE),
+            choice.c.id,
+            schema.c.name,
+            schema.c.publish_date,
+            attribute.c.name,
+            choice.c.name,
+            choice.c.title,
+            null(sa.String),
+            choice.c.order,
+            sa.func.lower(
+                choice.c.name + u' ' +
+                sa.func.coalesce(choice.c.title, u''))))
+        .select_from(
+            choice
+            .join(attribute, attribute.c.id == choice.c.attribute_id)
+            .join(schema, schema.c.id == attribute.c.schema_id)))
+
+    return sa.union_all(schemata, attributes, choices)
+
+
+def create_vocabulary(target, connection, **kw):
+    """Creates the vocabulary view and its indexes."""
+
+    if connection.dialect.name != 'postgresql':
+        return
+
+    query = _select_vocabulary().compile(
+        dialect=connection.dialect,
+        compile_kwargs={'literal_binds': True})
+
+    connection.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    connection.execute(
+        'CREATE MATERIALIZED VIEW IF NOT EXISTS imports.vocabulary AS {}'
+        .format(query))
+    # Required to refresh the view without blocking searches
+    connection.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_vocabulary_kind_object_id '
+        'ON imports.vocabulary (kind, object_id)')
+    connection.execute(
+        'CREATE INDEX IF NOT EXISTS ix_vocabulary_scope '
+        'ON imports.vocabulary (kind, schema_name, attribute_name)')
+    connection.execute(
+        'CREATE INDEX IF NOT EXISTS ix_vocabulary_document '
+        'ON imports.vocabulary USING gin (document gin_trgm_ops)')
+
+
+def drop_vocabulary(target, connection, **kw):
+    """Drops the vocabulary view, as it depends on the datastore tables."""
+
+    if connection.dialect.name != 'postgresql':
+        return
+
+    connection.execute('DROP MATERIALIZED VIEW IF EXISTS imports.vocabulary')
+
+
+sa.event.listen(Base.metadata, 'after_create', create_vocabulary)
+sa.event.listen(Base.metadata, 'before_drop', drop_vocabulary)
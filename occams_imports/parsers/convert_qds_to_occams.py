@@ -3,13 +3,36 @@ Transform data from the QDS csv codebook format to the
 occams codebook format
 
 Per Remi...each input file shall contain only one form and one publish_date
+when converted row by row (``iter_rows``). The grouped conversion
+(``grouped_rows``) has no such restriction.
 
 """
-import six
-
+import pandas as pd
 import unicodecsv as csv
 
-from iform_json import output_headers, writerow, convert_choices
+from iform_json import \
+    CODEBOOK_HEADERS, convert_choices, write_rows, writerow
+
+
+# QDS codebook columns, by position
+QDS_COLUMNS = [
+    u'formTitle',
+    u'formDesc',
+    u'formPublishDate',
+    u'var1',
+    u'var2',
+    u'questionID',
+    u'questionText',
+    u'value',
+    u'responseText',
+    u'units',
+    u'varType'
+]
+
+# A QDS variable is identified by its form and question
+QDS_KEY = [u'formTitle', u'formDesc', u'formPublishDate', u'questionID']
+
+QDS_TYPE_MAP = {u'float': u'number', u'int': u'number'}
 
 
 def init_row(schema_name, schema_title, publish_date):
@@ -68,22 +91,35 @@ def flush_row(writer, row, schema_name, schema_title, publish_date):
     return last_order_number, last_row, row, first_choice_row
 
 
-def convert(codebook, delimiter=','):
+class _RowBuffer(object):
+    """
+    Collects the rows written by the flush functions until they are yielded
     """
-    Convert QDS file to occams format
 
-    :param codebook:
-    :param delimiter:
-    :return:
+    def __init__(self):
+        self.rows = []
+
+    def writerow(self, values):
+        self.rows.append(dict(zip(CODEBOOK_HEADERS, values)))
+
+    def drain(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+
+def iter_rows(codebook, delimiter=','):
     """
-    reader = csv.reader(codebook, encoding='utf-8', delimiter=delimiter)
+    Generate the rows of a QDS codebook in the occams codebook format
 
-    headers = reader.next()
+    :param codebook: open QDS csv file
+    :param delimiter: delimiter used in the codebook file
+    :return: generator of dictionaries keyed by the occams codebook headers
+    """
+    reader = csv.reader(codebook, encoding='utf-8', delimiter=delimiter)
 
-    output_csv = six.StringIO()
-    writer = csv.writer(output_csv, encoding='utf-8')
+    headers = next(reader)
 
-    output_headers(writer)
+    writer = _RowBuffer()
 
     first_row = True
     choices = []
@@ -149,6 +185,9 @@ def convert(codebook, delimiter=','):
 
                 choices = []
 
+        for converted in writer.drain():
+            yield converted
+
     if choices:
         row['choices_string'] = convert_choices(choices)
         row['field_type'] = u'choice'
@@ -157,7 +196,85 @@ def convert(codebook, delimiter=','):
 
     codebook.close()
 
-    output_csv.flush()
-    output_csv.seek(0)
+    for converted in writer.drain():
+        yield converted
+
+
+def convert(codebook, delimiter=','):
+    """
+    Convert QDS file to occams format
+
+    Prefer ``iter_rows`` which does not render the codebook in memory.
+
+    :param codebook: open QDS csv file
+    :param delimiter: delimiter used in the codebook file
+    :return: csv file object in the occams codebook format
+    """
+    return write_rows(iter_rows(codebook, delimiter=delimiter))
+
+
+def grouped_rows(codebook, delimiter=','):
+    """
+    Convert a QDS codebook to occams format in a single grouped pass
+
+    The codebook is read columnar and its rows are grouped by form and
+    question: the first row of a question describes the variable and its
+    rows with a response text are its choices. Files may contain multiple
+    forms and publish dates.
+
+    :param codebook: open QDS csv file
+    :param delimiter: delimiter used in the codebook file
+    :return: list of dictionaries keyed by the occams codebook headers
+    """
+    frame = pd.read_csv(
+        codebook,
+        sep=delimiter,
+        dtype=object,
+        encoding='utf-8',
+        na_filter=False
+    )
+    codebook.close()
 
-    return output_csv
+    frame = frame.iloc[:, :len(QDS_COLUMNS)]
+    frame.columns = QDS_COLUMNS
+    frame = frame.apply(lambda column: column.str.strip())
+
+    labelled = frame[frame[u'responseText'] != u'']
+    choices = (
+        (labelled[u'value'] + u'=' + labelled[u'responseText'])
+        .groupby([labelled[key] for key in QDS_KEY], sort=False)
+        .agg(u';'.join)
+        .to_dict()
+    )
+
+    variables = frame.drop_duplicates(QDS_KEY)
+    columns = [variables[column] for column in QDS_COLUMNS]
+
+    rows = []
+
+    for values in zip(*columns):
+        field = dict(zip(QDS_COLUMNS, values))
+        key = tuple(field[column] for column in QDS_KEY)
+
+        if key in choices:
+            field_type = u'choice'
+        else:
+            field_type = QDS_TYPE_MAP.get(field[u'varType'], field[u'varType'])
+
+        rows.append({
+            u'table': field[u'formTitle'],
+            u'form': field[u'formDesc'],
+            u'publish_date': field[u'formPublishDate'],
+            u'field': field[u'var1'],
+            u'title': field[u'questionText'],
+            u'description': u'',
+            u'is_required': u'False',
+            u'is_system': u'False',
+            u'is_collection': u'False',
+            u'is_private': u'False',
+            u'type': field_type,
+            u'choices': choices.get(key, u''),
+            u'order': field[u'questionID']
+        })
+
+    return rows
@@ -39,6 +39,11 @@ https://iformbuilder.zendesk.com/hc/en-us/articles/201702880?
 37: Location
 38: Socket Scanner
 39: Linea Pro
+
+Exports may bundle hundreds of page versions, so when ijson is installed the
+export is read incrementally: the option lists are read first into a compact
+lookup, then pages are read one at a time. Otherwise the export is loaded
+entirely with the json module.
 """
 
 import json
@@ -46,6 +51,11 @@ import six
 
 import unicodecsv as csv
 
+try:
+    import ijson
+except ImportError:  # pragma: no cover (optional dependency)
+    ijson = None
+
 # maps iFormBuilder data_type code to OCCAMS datastore datatype
 DATA_TYPE_MAP = {
     1: u'string',
@@ -58,6 +68,23 @@ DATA_TYPE_MAP = {
     19: u'text'
 }
 
+# headers of the occams codebook format
+CODEBOOK_HEADERS = [
+    u'table',
+    u'form',
+    u'publish_date',
+    u'field',
+    u'title',
+    u'description',
+    u'is_required',
+    u'is_system',
+    u'is_collection',
+    u'is_private',
+    u'type',
+    u'choices',
+    u'order'
+]
+
 
 def writerow(writer, row):
     """
@@ -90,22 +117,7 @@ def output_headers(writer):
     :param writer: python csv writer object
     :return: headers written to file
     """
-    output_headers = [
-        u'table',
-        u'form',
-        u'publish_date',
-        u'field',
-        u'title',
-        u'description',
-        u'is_required',
-        u'is_system',
-        u'is_collection',
-        u'is_private',
-        u'type',
-        u'choices',
-        u'order'
-    ]
-    writer.writerow(output_headers)
+    writer.writerow(CODEBOOK_HEADERS)
 
 
 def convert_choices(choices):
@@ -142,68 +154,165 @@ def populate_options(options, optionlist_id):
     return option_list
 
 
-def convert(codebook):
-    data = codebook.read()
-    jdata = json.loads(data)
+def to_codebook_row(row):
+    """
+    Convert a row to a row of the occams codebook format
+
+    :param row: dictionary of elements denoting a row of schema/attribute data
+    :return: dictionary keyed by the occams codebook headers
+    """
+    return {
+        u'table': row['schema_name'],
+        u'form': row['schema_title'],
+        u'publish_date': row['publish_date'],
+        u'field': row['variable'],
+        u'title': row['title'],
+        u'description': row['description'],
+        u'is_required': row['is_required'],
+        u'is_system': row['is_system'],
+        u'is_collection': row['is_collection'],
+        u'is_private': row['is_private'],
+        u'type': row['field_type'],
+        u'choices': row['choices_string'],
+        u'order': row['order']
+    }
+
+
+def build_option_lookup(option_lists):
+    """
+    Build the choices of every option list of the export at once
+
+    :param option_lists: iterable of option list id and option list pairs
+    :return: dict of option list id to list of lists of key and label
+    """
+    lookup = {}
+
+    for optionlist_id, option_list in option_lists:
+        lookup[six.text_type(optionlist_id)] = [
+            [option['key_value'], option['label']]
+            for option in option_list['options']
+        ]
+
+    return lookup
+
+
+def iter_assets(codebook):
+    """
+    Read the option lists and pages of an export
+
+    :param codebook: open JSON export file
+    :return: the option lookup (see ``build_option_lookup``) and a generator
+             of page id and page pairs
+    """
+    if ijson is not None and hasattr(ijson, 'kvitems'):
+        start = codebook.tell()
+        options = build_option_lookup(
+            ijson.kvitems(codebook, 'assets_map.option_list'))
+        codebook.seek(start)
+        pages = ijson.kvitems(codebook, 'assets_map.pages')
+
+    else:
+        assets_map = json.load(codebook)['assets_map']
+        options = build_option_lookup(six.iteritems(assets_map['option_list']))
+        pages = six.iteritems(assets_map['pages'])
+
+    return options, pages
+
 
+def iter_page_rows(page, options):
+    """
+    Generate the rows of a page in the occams codebook format
+
+    :param page: the page of the export
+    :param options: the option lookup of the export
+    :return: generator of dictionaries keyed by the occams codebook headers
+    """
+    raw_name = page['page_level']['name']
+    schema_name, __, __ = raw_name.rpartition('_')
+    base_name = '_'.join(raw_name.split('_')[2:-1])
+    publish_date = page['page_level']['created_date'][0:10]
+
+    for question in page['elements']:
+        row = {
+            u'schema_name': schema_name,
+            u'schema_title': raw_name,
+            u'publish_date': publish_date,
+            u'title': question[u'label'],
+            u'description': u'',
+            u'is_required': u'False',
+            u'is_system': u'False',
+            u'is_collection': u'False',
+            u'is_private': u'False'
+        }
+        # only question data with a sort order are valid
+        try:
+            row[u'order'] = question[u'sort_order']
+        except KeyError:
+            continue
+
+        # skip instructions (ijson reads numbers as decimals)
+        data_type = int(question[u'data_type'])
+        if data_type == 16:
+            continue
+
+        row['field_type'] = DATA_TYPE_MAP[data_type]
+        optionlist_id = question.get('optionlist_id')
+
+        # prepend schema name to variable
+        # excluding version number
+        # this provides meaningful var names as opposed to q1, etc.
+        row['variable'] = '{}_{}'.format(base_name, question[u'name'])
+
+        if optionlist_id:
+            choices = options.get(six.text_type(optionlist_id), [])
+            row['choices_string'] = convert_choices(choices)
+        else:
+            row['choices_string'] = u''
+
+        yield to_codebook_row(row)
+
+
+def iter_rows(codebook):
+    """
+    Generate the rows of an iFormBuilder export in the occams codebook format
+
+    :param codebook: open JSON export file
+    :return: generator of dictionaries keyed by the occams codebook headers
+    """
+    options, pages = iter_assets(codebook)
+
+    for __, page in pages:
+        for row in iter_page_rows(page, options):
+            yield row
+
+    codebook.close()
+
+
+def write_rows(rows):
+    """
+    Render rows of the occams codebook format as a csv codebook
+
+    :param rows: iterable of dictionaries keyed by the occams codebook headers
+    :return: csv file object
+    """
     output_csv = six.StringIO()
     writer = csv.writer(output_csv, encoding='utf-8')
 
     output_headers(writer)
 
-    options = jdata['assets_map']['option_list']
-
-    for pages in jdata['assets_map']['pages']:
-        page = jdata['assets_map']['pages'][pages]['elements']
-
-        raw_name = jdata['assets_map']['pages'][pages]['page_level']['name']
-        schema_name, __, __ = raw_name.rpartition('_')
-        base_name = '_'.join(raw_name.split('_')[2:-1])
-        publish_date = jdata['assets_map']['pages'][pages]['page_level']['created_date'][0:10]
-
-        for question in page:
-            row = {
-                u'schema_name': schema_name,
-                u'schema_title': raw_name,
-                u'publish_date': publish_date,
-                u'title': question[u'label'],
-                u'description': u'',
-                u'is_required': u'False',
-                u'is_system': u'False',
-                u'is_collection': u'False',
-                u'is_private': u'False'
-            }
-            # only question data with a sort order are valid
-            try:
-                row[u'order'] = question[u'sort_order']
-            except KeyError:
-                continue
-
-            # skip instructions
-            if question[u'data_type'] == 16:
-                continue
-
-            row['field_type'] = DATA_TYPE_MAP[question[u'data_type']]
-            try:
-                optionlist_id = question['optionlist_id']
-            except KeyError:
-                optionlist_id = None
-
-            # prepend schema name to variable
-            # excluding version number
-            # this provides meaningful var names as opposed to q1, etc.
-            row['variable'] = '{}_{}'.format(base_name, question[u'name'])
-
-            if optionlist_id:
-                choices = populate_options(options, optionlist_id)
-                row['choices_string'] = convert_choices(choices)
-            else:
-                row['choices_string'] = u''
-
-            writerow(writer, row)
+    for row in rows:
+        writer.writerow([row[header] for header in CODEBOOK_HEADERS])
 
-    codebook.close()
     output_csv.flush()
     output_csv.seek(0)
 
     return output_csv
+
+
+def convert(codebook):
+    """
+    Convert an iFormBuilder export to a csv codebook
+
+    Prefer ``iter_rows`` which does not render the codebook in memory.
+    """
+    return write_rows(iter_rows(codebook))
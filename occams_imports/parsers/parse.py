@@ -35,7 +35,20 @@ def remove_system_entries(records):
 
     :return:  Filtered list of non-system rows
     """
-    return [record for record in records if record['is_system'] is False]
+    return list(skip_system_entries(records))
+
+
+def skip_system_entries(records):
+    """
+    Generate the records where is_system is false
+
+    :param records:  an iterable of dictionaries denoting codebook rows
+
+    :return:  generator of non-system rows
+    """
+    for record in records:
+        if record['is_system'] is False:
+            yield record
 
 
 def parse_choice_string(row):
@@ -105,21 +118,38 @@ def parse_dispatch(codebook, codebook_format, delimiter):
 
     :return: list of dictionaries...a dictionary denotes a row from the csv
     """
+    return list(iter_dispatch(codebook, codebook_format, delimiter))
+
+
+def iter_dispatch(codebook, codebook_format, delimiter):
+    """
+    Dispatch to specific parser, generating records as they are parsed
+
+    Converted formats are normalized row by row, without rendering an
+    intermediate occams codebook.
+
+    :codebook: codebook file
+    :codebook_format: denotes type of codebook, i.e. 'occams'
+    :delimiter: delimiter used in the codebook file
+
+    :return: generator of dictionaries...a dictionary denotes a codebook row
+    """
     if delimiter == u'comma':
         delimiter = ','
     elif delimiter == u'tab':
         delimiter = '\t'
 
     if codebook_format == u'iform':
-        codebook = iform_json.convert(codebook)
+        rows = iform_json.iter_rows(codebook)
 
     elif codebook_format == u'qds':
-        codebook = convert_qds_to_occams.convert(
+        rows = convert_qds_to_occams.grouped_rows(
             codebook, delimiter=delimiter)
 
-    parsed = parse(codebook, delimiter=delimiter)
+    else:
+        return iter_parse(codebook, delimiter=delimiter)
 
-    return parsed
+    return (normalize(row) for row in rows)
 
 
 def convert_date(date_to_parse):
@@ -159,41 +189,64 @@ def choices_list(choices, field_type, row):
     return choices
 
 
-def parse(codebook, delimiter=','):
+def normalize(row):
     """
-    Parse codebook csv
+    Normalize a row of the occams codebook format into a record
 
-    :param codebook: path of csv codebook to parse
+    :param row: dictionary keyed by the occams codebook headers
 
-    :return: list of dictionaries...a dictionary denotes a row from the csv
+    :return: dictionary denoting the row
     """
-    records = []
-
     type_map = {'integer': u'number', 'boolean': u'choice'}
 
+    field_type = _text(row['type']).strip().lower()
+    field_type = type_map.get(field_type, field_type)
+    order = _text(row['order']).strip()
+
+    return {
+        'name': _text(row['field']).strip(),
+        'title': _text(row['title']).strip(),
+        'description': _text(row['description']).strip(),
+        'is_required': is_true(row['is_required']),
+        'is_system': is_true(row['is_system']),
+        'is_collection': is_true(row['is_collection']),
+        'is_private': is_true(row['is_private']),
+        'type': field_type,
+        'order': int(order) if order.isnumeric() else None,
+        'schema_name': _text(row['table']).strip(),
+        'schema_title': _text(row['form']).strip(),
+        'publish_date': convert_date(_text(row['publish_date']).strip()),
+        'choices': choices_list(row['choices'], field_type, row)
+    }
+
+
+def _text(value):
+    # Converted rows may hold numbers (e.g. sort orders) or nothing at all
+    return u'' if value is None else six.text_type(value)
+
+
+def iter_parse(codebook, delimiter=','):
+    """
+    Parse codebook csv, generating records as they are read
+
+    :param codebook: open csv codebook to parse
+
+    :return: generator of dictionaries...a dictionary denotes a row
+    """
     reader = csv.DictReader(codebook, encoding='utf-8', delimiter=delimiter)
 
     for row in reader:
-        field_type = row['type'].strip().lower()
-        field_type = type_map.get(field_type, field_type)
-
-        records.append({
-            'name': row['field'].strip(),
-            'title': row['title'].strip(),
-            'description': row['description'].strip(),
-            'is_required': is_true(row['is_required']),
-            'is_system': is_true(row['is_system']),
-            'is_collection': is_true(row['is_collection']),
-            'is_private': is_true(row['is_private']),
-            'type': field_type,
-            'order': int(row['order']) if row['order'].isnumeric() else None,
-            'schema_name': row['table'].strip(),
-            'schema_title': row['form'].strip(),
-            'publish_date': convert_date(row['publish_date'].strip()),
-            'choices': choices_list(row['choices'], field_type, row)
-        }
-        )
+        yield normalize(row)
 
     codebook.close()
 
-    return records
+
+def parse(codebook, delimiter=','):
+    """
+    Parse codebook csv
+
+    :param codebook: path of csv codebook to parse
+
+    :return: list of dictionaries...a dictionary denotes a row from the csv
+    """
+    return list(iter_parse(codebook, delimiter=delimiter))
@@ -24,17 +24,23 @@ def includeme(config):
     config.add_route('imports.codebooks_occams',            '/codebooks/occams',                                            factory=models.ImportFactory)
     config.add_route('imports.codebooks_qds',               '/codebooks/qds',                                               factory=models.ImportFactory)
     config.add_route('imports.codebooks_status',            '/codebooks/{format}/status',                                   factory=models.ImportFactory)
+    config.add_route('imports.codebook_jobs',               '/api/codebooks/{format}/jobs',                                 factory=models.ImportFactory)
+    config.add_route('imports.codebook_job',                '/api/codebooks/{format}/jobs/{job}',                           factory=models.ImportFactory)
 
     config.add_route('imports.mappings.direct',             '/mappings/direct',                                             factory=models.ImportFactory)
     config.add_route('imports.mappings.direct.map',         '/mappings/direct/map',                                         factory=models.ImportFactory)
     config.add_route('imports.mappings.imputation',         '/mappings/imputation',                                         factory=models.ImportFactory)
 
     config.add_route('imports.schemas',                     '/schemas',                                                     factory=models.ImportFactory)
+    config.add_route('imports.schema_catalog',              '/schemas/catalog',                                             factory=models.ImportFactory)
+    config.add_route('imports.schema_catalog_detail',       '/schemas/catalog/{schema}/{publish_date}',                     factory=models.ImportFactory)
 
     config.add_route('imports.mappings.view',               '/mappings/view',                                               factory=models.ImportFactory)
     config.add_route('imports.mappings.view_mapped',        '/mappings/view_mapped',                                        factory=models.ImportFactory)
     config.add_route('imports.mapping_detail',              '/api/mappings/{mapping}',                                      factory=models.ImportFactory)
     config.add_route('imports.mappings.delete',             '/mappings/delete',                                             factory=models.ImportFactory)
+    config.add_route('imports.mappings.status',             '/mappings/status',                                             factory=models.ImportFactory)
+    config.add_route('imports.mappings.notes',              '/mappings/notes',                                              factory=models.ImportFactory)
     config.add_route('imports.mapping.status',              '/mapping/status',                                              factory=models.ImportFactory)
     config.add_route('imports.mapping.notes',               '/mapping/notes',                                               factory=models.ImportFactory)
 
@@ -46,6 +52,10 @@ def includeme(config):
     config.add_route('imports.process_project',             '/api/process/{project}',                                                 factory=models.ProjectFactory)
     config.add_route('imports.process',                     '/api/process',                                                 factory=models.ProjectFactory)
 
+    config.add_route('imports.job_list',                    '/api/jobs',                                                    factory=models.ProjectFactory)
+    config.add_route('imports.job_detail',                  '/api/jobs/{job}',                                              factory=models.ProjectFactory)
+    config.add_route('imports.job_status',                  '/api/jobs/{job}/status',                                       factory=models.ProjectFactory)
+
     config.add_route('imports.project_app',                 '/projects',                                                    factory=models.ProjectFactory)
 
     config.add_route('imports.project_list',                '/api/projects',                                                factory=models.ProjectFactory, traverse='/')
@@ -0,0 +1,235 @@
+"""
+Ranked search of the schemata, attributes and choices vocabulary
+
+Searches run against the trigram-indexed vocabulary view
+(see :mod:`occams_imports.models.vocabulary`), matching terms anywhere in
+the names (and the titles of choices) and ranking the closest matches
+first.
+
+Autocomplete widgets search again on every keystroke, so results of
+recent searches are kept in a per-process least-recently used cache. The
+cache is keyed by the schema catalog's generation (see
+:mod:`occams_imports.catalog`), so results are discarded in every process
+once the vocabulary is refreshed.
+
+The vocabulary is refreshed in the background after codebooks are imported
+and every :data:`REFRESH_INTERVAL` seconds (see
+:func:`occams_imports.tasks.refresh_vocabulary`), as forms may also be
+published or added to studies by other applications. Searches may
+therefore miss such forms until the next refresh, and cached results are
+kept at most :data:`CACHE_TTL` seconds should the refresh not run.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+import sqlalchemy as sa
+
+from . import catalog
+from .models.vocabulary import vocabulary, SCHEMA, ATTRIBUTE, CHOICE
+
+
+# Maximum number of results of a search
+DEFAULT_LIMIT = 25
+
+# Maximum number of searches kept in the cache of each process
+CACHE_SIZE = 1024
+
+# Maximum number of seconds searches are kept in the cache
+CACHE_TTL = 5 * 60
+
+# Number of seconds between periodic refreshes of the vocabulary
+REFRESH_INTERVAL = 15 * 60
+
+
+class LRUCache(object):
+    """
+    A size-bounded least-recently used cache, safe to share across threads
+
+    Values expire once they have been cached for ``ttl`` seconds.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL, clock=time.time):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns a cached value, marking it as recently used
+        """
+        with self._lock:
+            try:
+                expires, value = self._entries.pop(key)
+            except KeyError:
+                return default
+            if expires <= self._clock():
+                return default
+            self._entries[key] = (expires, value)
+            return value
+
+    def put(self, key, value):
+        """
+        Caches a value, evicting the least-recently used one if full
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self._clock() + self._ttl, value)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = LRUCache()
+
+
+def refresh(db_session):
+    """
+    Updates the vocabulary with the current schemata
+
+    The vocabulary remains searchable while it is refreshed. Cached
+    searches are only discarded once the catalog is invalidated, which
+    callers should do after the refresh is committed.
+
+    :param db_session: Application database session
+    :type db_session: sqlalchemy.orm.Session
+    """
+    db_session.execute(
+        'REFRESH MATERIALIZED VIEW CONCURRENTLY imports.vocabulary')
+
+
+def cached(redis, key, search):
+    """
+    Returns the results of a search, searching only if they are not cached
+
+    :param redis: Redis connection, used to find the current generation
+    :type redis: redis.StrictRedis
+    :param key: Identifies the search (e.g. its vocabulary and term)
+    :type key: tuple
+    :param search: Runs the search
+    :type search: callable
+
+    :returns: the results of the search
+    :rtype: list
+    """
+    key = (catalog.get_generation(redis),) + tuple(key)
+    results = _cache.get(key)
+
+    if results is None:
+        results = search()
+        _cache.put(key, results)
+
+    return results
+
+
+def _escape(term):
+    return (
+        term
+        .replace(u'\\', u'\\\\')
+        .replace(u'%', u'\\%')
+        .replace(u'_', u'\\_'))
+
+
+def _search(db_session, kind, columns, term=None, limit=DEFAULT_LIMIT,
+            **scope):
+    """
+    Searches terms of a kind, closest matches first
+
+    :param db_session: Application database session
+    :type db_session: sqlalchemy.orm.Session
+    :param kind: The kind of terms to search (e.g. ``attribute``)
+    :type kind: str
+    :param columns: The vocabulary columns to list for each term
+    :type columns: list[str]
+    :param term: (optional) Text the terms must contain
+    :type term: str
+    :param limit: Maximum number of terms to list
+    :type limit: int
+    :param scope: Column values the terms must have (e.g. ``schema_name``)
+
+    :returns: the matching terms, as dictionaries of the listed columns
+    :rtype: list[dict]
+    """
+
+    query = (
+        db_session.query(*[vocabulary.c[column] for column in columns])
+        .filter(vocabulary.c.kind == kind))
+
+    for column, value in sorted(scope.items()):
+        query = query.filter(vocabulary.c[column] == value)
+
+    if term:
+        term = term.lower()
+        query = (
+            query
+            .filter(vocabulary.c.document.like(
+                u'%{}%'.format(_escape(term)), escape=u'\\'))
+            .order_by(
+                sa.func.similarity(vocabulary.c.document, term).desc(),
+                vocabulary.c.name))
+    else:
+        query = query.order_by(vocabulary.c.name)
+
+    return [
+        dict(zip(columns, row))
+        for row in query.limit(limit)
+    ]
+
+
+def search_schemata(db_session, term=None, limit=DEFAULT_LIMIT):
+    """
+    Searches the schemata associated with a study by name
+
+    :returns: the name and publish date of the matching schemata
+    :rtype: list[dict]
+    """
+    return _search(
+        db_session,
+        SCHEMA,
+        ['name', 'publish_date'],
+        term,
+        limit)
+
+
+def search_attributes(db_session, schema_name, term=None,
+                      limit=DEFAULT_LIMIT):
+    """
+    Searches the attributes of a schema by name
+
+    :returns: the name, title and type of the matching attributes
+    :rtype: list[dict]
+    """
+    return _search(
+        db_session,
+        ATTRIBUTE,
+        ['name', 'title', 'type'],
+        term,
+        limit,
+        schema_name=schema_name)
+
+
+def search_choices(db_session, schema_name, attribute_name, term=None,
+                   limit=DEFAULT_LIMIT):
+    """
+    Searches the choices of an attribute by name and title
+
+    :returns: the name, title and order of the matching choices
+    :rtype: list[dict]
+    """
+    return _search(
+        db_session,
+        CHOICE,
+        ['name', 'title', 'order'],
+        term,
+        limit,
+        schema_name=schema_name,
+        attribute_name=attribute_name)
@@ -0,0 +1,144 @@
+"""
+Content-addressed file storage for project data uploads
+
+Uploads are streamed in chunks into a configured directory (setting
+``imports.upload.dir``) and named after the SHA-256 checksum of their
+contents, so that identical files are only stored once and a file never
+has to be held in memory in its entirety. When no directory is configured
+uploads are kept in the database as before.
+"""
+
+import errno
+import hashlib
+import io
+import os
+import tempfile
+
+
+UPLOAD_DIR_SETTING = 'imports.upload.dir'
+
+# Number of bytes to read from/write to a stream at a time
+CHUNK_SIZE = 64 * 1024
+
+
+def get_upload_dir(settings):
+    """
+    Returns the configured upload directory
+
+    :param settings: Application settings
+    :type settings: dict
+
+    :returns: the upload directory path, otherwise `None` if uploads
+              should be stored in the database
+    :rtype: str
+    """
+    return (settings or {}).get(UPLOAD_DIR_SETTING) or None
+
+
+def get_path(upload_dir, checksum):
+    """
+    Returns the file path for the given content checksum
+
+    Files are sharded into sub-directories by the first characters of
+    their checksum to avoid enormous directory listings.
+
+    :param upload_dir: Root directory of the file store
+    :type upload_dir: str
+    :param checksum: SHA-256 hex digest of the file contents
+    :type checksum: str
+
+    :returns: the path to the stored file
+    :rtype: str
+    """
+    return os.path.join(upload_dir, checksum[:2], checksum[2:4], checksum)
+
+
+def store(upload_dir, stream, chunk_size=CHUNK_SIZE):
+    """
+    Streams the contents of a file into the file store
+
+    The stream is written to a temporary file in chunks while its checksum
+    is being computed, then moved into its content-addressed location.
+
+    :param upload_dir: Root directory of the file store
+    :type upload_dir: str
+    :param stream: The file contents to store
+    :type stream: File-like object
+    :param chunk_size: (optional) Number of bytes to process at a time
+    :type chunk_size: int
+
+    :returns: the SHA-256 hex digest of the contents and their size in bytes
+    :rtype: (str, int)
+    """
+
+    _makedirs(upload_dir)
+
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, temp_path = tempfile.mkstemp(dir=upload_dir, suffix='.part')
+
+    try:
+        with io.open(fd, 'wb') as fp:
+            for chunk in iter(lambda: stream.read(chunk_size), b''):
+                digest.update(chunk)
+                size += len(chunk)
+                fp.write(chunk)
+
+        checksum = digest.hexdigest()
+        path = get_path(upload_dir, checksum)
+
+        if os.path.exists(path):
+            os.unlink(temp_path)
+        else:
+            _makedirs(os.path.dirname(path))
+            os.rename(temp_path, path)
+    except:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+    return checksum, size
+
+
+def open_upload(upload_dir, upload):
+    """
+    Opens the contents of an upload for reading
+
+    :param upload_dir: Root directory of the file store
+    :type upload_dir: str
+    :param upload: The upload to open
+    :type upload: occams_imports.models.Upload
+
+    :returns: a readable binary stream of the upload contents
+    :rtype: File-like object
+    """
+
+    if upload.project_file is not None:
+        return io.BytesIO(upload.project_file)
+
+    return io.open(get_path(upload_dir, upload.checksum), 'rb')
+
+
+def remove(upload_dir, checksum):
+    """
+    Removes a file from the file store if it is still present
+
+    :param upload_dir: Root directory of the file store
+    :type upload_dir: str
+    :param checksum: SHA-256 hex digest of the file contents
+    :type checksum: str
+    """
+    try:
+        os.unlink(get_path(upload_dir, checksum))
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
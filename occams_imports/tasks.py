@@ -6,13 +6,37 @@ can continue to use the application and view the mapping results at a
 later time.
 """
 
+import collections
+import datetime
+import io
+import itertools
+import json
+
+from celery import chain, chord
+from pyramid.request import Request
+from pyramid.threadlocal import get_current_registry
+from sqlalchemy import orm
+
 from occams.celery import app, Session, with_transaction
+from occams_datastore import models as datastore
+from occams_studies import models as studies
 
-from . import models
+from . import catalog, models, search
 from .importers import imputation, direct
-from .importers.utils.pubsub import ImportStatusChannel
+from .importers.utils import incremental, scheduler
+from .importers.utils.cache import FrameCache
+from .importers.utils.metadata import MetadataSnapshot, get_schema_names
+from .importers.utils.profiling import Profiler, describe_frame
+from .importers.utils.pubsub import BufferedImportStatusChannel
 from .importers.utils.pivot import \
-    load_project_frame, populate_project, truncate_project
+    DEFAULT_PID_COLUMN, DEFAULT_VISIT_COLUMN, DEFAULT_COLLECT_DATE_COLUMN, \
+    get_uploads, load_project_frame, populate_project, truncate_project, \
+    truncate_schema
+from .parsers import parse
+
+
+# Number of codebook rows validated at a time
+CODEBOOK_BATCH_SIZE = 1000
 
 
 def _query_mappings(db_session, project_name):
@@ -29,7 +53,12 @@ def _query_mappings(db_session, project_name):
     """
     query = (
         db_session.query(models.Mapping)
+        .options(
+            orm.joinedload(models.Mapping.study),
+            orm.joinedload(models.Mapping.status)
+        )
         .filter(models.Mapping.study.has(name=project_name))
+        .order_by(models.Mapping.id)
     )
     return query
 
@@ -40,9 +69,395 @@ def _count_mappings(mappings):
     return mappings.count()
 
 
-@app.task(name='apply_mappings', ignore_result=True, bind=True)
+def _query_snapshots(db_session, project_name):
+    """
+    Generates a listing of the target schema snapshots of a project
+
+    :param db_session: Application database session
+    :type db_session: sqlalchemy.orm.Session
+    :param project_name: Project Name
+    :type project_name: str
+
+    :returns: An iterable query object of the project's snapshots
+    :rtype: sqlalchemy.orm.query.Query[ occams_imports.models.Snapshot ]
+    """
+    query = (
+        db_session.query(models.Snapshot)
+        .filter(models.Snapshot.study.has(name=project_name))
+    )
+    return query
+
+
+def _get_job(db_session, jobid):
+    """
+    Returns the record of a job, if it was dispatched with one
+    """
+    return db_session.query(models.Job).filter_by(name=jobid).first()
+
+
+def _finish_job(db_session, jobid, timings, **values):
+    """
+    Records the successful outcome of a job
+
+    :param db_session: Application database session
+    :type db_session: sqlalchemy.orm.Session
+    :param jobid: A unique name for the job
+    :type jobid: str
+    :param timings: Seconds spent in each phase, added to those recorded
+    :type timings: dict
+    :param values: The job's counts and measurements (e.g. ``row_count``)
+    """
+
+    job = _get_job(db_session, jobid)
+
+    if job is None:
+        return
+
+    _add_timings(job, timings)
+
+    for name, value in values.items():
+        setattr(job, name, value)
+
+    job.status = models.Job.COMPLETE
+    job.end_date = datetime.datetime.now()
+
+
+def _add_timings(job, timings):
+    merged = dict(job.timings or {})
+    for phase, seconds in timings.items():
+        merged[phase] = merged.get(phase, 0) + seconds
+    job.timings = merged
+
+
+class JobTask(app.Task):
+    """
+    Keeps the record of the job a task belongs to up to date
+
+    The job's name must be the task's first argument.
+    """
+
+    def before_start(self, task_id, args, kwargs):
+        _start_job(self, args[0])
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        _fail_job(self, args[0], exc)
+
+
+@with_transaction
+def _start_job(task, jobid):
+    job = _get_job(Session, jobid)
+
+    if job is None or job.status != models.Job.PENDING:
+        return
+
+    job.status = models.Job.RUNNING
+    job.start_date = datetime.datetime.now()
+
+
 @with_transaction
-def apply_mappings(task, jobid, source_project_name, target_project_name):
+def _fail_job(task, jobid, exc):
+    job = _get_job(Session, jobid)
+
+    if job is None:
+        return
+
+    job.status = models.Job.FAILED
+    job.end_date = datetime.datetime.now()
+    job.error = u'{}: {}'.format(type(exc).__name__, exc)
+
+
+def _open_channel(db_session, jobid):
+    """
+    Opens the status channel of a job, batched according to the settings
+
+    :param db_session: Application database session
+    :type db_session: sqlalchemy.orm.Session
+    :param jobid: A unique name for the job
+    :type jobid: str
+
+    :rtype: occams_imports.importers.utils.pubsub.BufferedImportStatusChannel
+    """
+    return BufferedImportStatusChannel.from_settings(
+        app.redis,
+        jobid,
+        db_session.info.get('settings')
+    )
+
+
+def _apply_mapping(
+        db_session,
+        channel,
+        source_project_name,
+        target_project_name,
+        frame,
+        mapping,
+        metadata=None,
+        profiler=None
+        ):
+    """
+    Applies a single mapping to the frame and reports the outcome
+
+    :param db_session: Application database session
+    :type db_session: sqlalchemy.orm.Session
+    :param channel: Application redis session for broadcasting events
+    :type channel: occams_imports.importers.utils.pubsub.ImportStatusChannel
+    :param source_project_name: Source project the mapping belongs to
+    :type source_project_name: str
+    :param target_project_name: Target project to transfer the results
+    :type target_project_name: str
+    :param frame: The current data frame for the project
+    :type frame: pandas.DataFrame
+    :param mapping: The mapping to apply
+    :type mapping: occams_imports.models.Mapping
+    :param metadata: (optional) Prefetched form metadata
+    :type metadata: occams_imports.importers.utils.metadata.MetadataSnapshot
+    :param profiler: (optional) Collects the time spent on the mapping
+    :type profiler: occams_imports.importers.utils.profiling.Profiler
+    """
+
+    if profiler is None:
+        profiler = Profiler()
+
+    if mapping.status.name != 'approved':
+        channel.send_message(mapping, 'Not in approved state')
+        return
+
+    if mapping.type == 'direct':
+        mapper = direct.apply_mapping
+    elif mapping.type == 'imputation':
+        mapper = imputation.apply_mapping
+    else:
+        message = 'Unsupported mapping type: %s' % mapping.type
+        channel.send_message(mapping, message)
+        return
+
+    with profiler.mapping(mapping):
+        mapper(
+            db_session,
+            channel,
+            source_project_name,
+            target_project_name,
+            frame,
+            mapping,
+            metadata=metadata
+        )
+
+    channel.send_progress()
+    channel.send_message(mapping, 'Mapping complete')
+
+
+def _run_mappings(
+        db_session,
+        channel,
+        source_project_name,
+        target_project_name,
+        frame,
+        mappings,
+        metadata=None,
+        profiler=None
+        ):
+    """
+    Applies mappings to the frame, concurrently if configured
+
+    The number of concurrent workers is set by ``imports.mapping.workers``.
+    Worker threads use their own database session when ``db_session`` is a
+    thread-local scoped session.
+
+    .. seealso:: :mod:`occams_imports.importers.utils.scheduler`
+    """
+
+    workers = scheduler.get_workers(db_session.info.get('settings'))
+
+    def apply(subframe, mapping):
+        _apply_mapping(
+            db_session,
+            channel,
+            source_project_name,
+            target_project_name,
+            subframe,
+            mapping,
+            metadata=metadata,
+            profiler=profiler
+        )
+
+    scheduler.run(
+        mappings,
+        frame,
+        apply,
+        source_project_name,
+        target_project_name,
+        workers=workers,
+        cleanup=getattr(db_session, 'remove', None)
+    )
+
+    channel.flush()
+
+
+def _apply_mappings_incremental(
+        db_session,
+        channel,
+        cache,
+        source_project_name,
+        target_project_name,
+        frame,
+        mappings,
+        metadata=None,
+        profiler=None
+        ):
+    """
+    Applies only the mappings whose logic, status or inputs have changed
+
+    Mappings are processed per target schema. A target schema whose
+    mappings have the same fingerprint as the last time they were applied
+    is skipped entirely. Otherwise its mappings are recomputed and only the
+    entities of the patients whose values differ from the previously
+    applied values are rewritten.
+
+    :param cache: Storage for the computed target schema data
+    :type cache: occams_imports.importers.utils.cache.FrameCache
+    :param profiler: (optional) Collects the time spent in each phase
+    :type profiler: occams_imports.importers.utils.profiling.Profiler
+
+    :returns: the number of entities written
+    :rtype: int
+
+    .. seealso:: :mod:`occams_imports.importers.utils.incremental`
+    """
+
+    pid_column = DEFAULT_PID_COLUMN
+    keys = [DEFAULT_PID_COLUMN, DEFAULT_VISIT_COLUMN]
+    profiler = Profiler() if profiler is None else profiler
+    entity_count = 0
+
+    target_project = (
+        db_session.query(studies.Study)
+        .filter_by(name=target_project_name)
+        .one()
+    )
+
+    input_keys = collections.defaultdict(list)
+
+    for upload in get_uploads(db_session, source_project_name):
+        input_keys[upload.schema.name].append(cache.make_key(
+            upload,
+            DEFAULT_PID_COLUMN,
+            DEFAULT_VISIT_COLUMN,
+            DEFAULT_COLLECT_DATE_COLUMN
+        ))
+
+    snapshots = {
+        snapshot.schema_name: snapshot
+        for snapshot in _query_snapshots(db_session, target_project_name)
+    }
+
+    groups = incremental.group_by_target_schema(mappings)
+    changed_groups = []
+
+    for schema_name, group in groups.items():
+
+        fingerprint = incremental.fingerprint(group, input_keys)
+        snapshot = snapshots.pop(schema_name, None)
+        previous = None
+
+        if snapshot is not None:
+            previous = cache.get('snapshot-' + snapshot.fingerprint)
+
+        if previous is not None and snapshot.fingerprint == fingerprint:
+            for mapping in group:
+                if mapping.status.name != 'approved':
+                    channel.send_message(mapping, 'Not in approved state')
+                    continue
+                channel.send_progress()
+                channel.send_message(mapping, 'Mapping unchanged')
+            continue
+
+        changed_groups.append((schema_name, fingerprint, snapshot, previous))
+
+    changed_mappings = [
+        mapping
+        for schema_name, __, __, __ in changed_groups
+        for mapping in groups[schema_name]
+    ]
+
+    with profiler.phase('map') as details:
+        _run_mappings(
+            db_session,
+            channel,
+            source_project_name,
+            target_project_name,
+            frame,
+            changed_mappings,
+            metadata=metadata,
+            profiler=profiler
+        )
+        details['frame'] = describe_frame(frame)
+
+    for schema_name, fingerprint, snapshot, previous in changed_groups:
+
+        columns = [
+            column
+            for column in incremental.get_target_columns(
+                target_project, schema_name, DEFAULT_COLLECT_DATE_COLUMN)
+            if column in frame
+        ]
+        current = frame.loc[:, keys + columns]
+        cache.put('snapshot-' + fingerprint, current)
+
+        with profiler.phase('truncate'):
+            if previous is None:
+                truncate_schema(db_session, target_project_name, schema_name)
+                changed = current
+            else:
+                pids = incremental.get_changed_pids(
+                    previous, current, keys, pid_column)
+                if pids:
+                    truncate_schema(
+                        db_session,
+                        target_project_name,
+                        schema_name,
+                        pids=pids
+                    )
+                changed = current[current[pid_column].isin(pids)]
+
+        if len(changed):
+            with profiler.phase('populate'):
+                entity_count += populate_project(
+                    db_session,
+                    target_project_name,
+                    changed,
+                    schema_names={schema_name}
+                )
+
+        if snapshot is None:
+            snapshot = models.Snapshot(
+                study=target_project,
+                schema_name=schema_name
+            )
+            db_session.add(snapshot)
+
+        snapshot.fingerprint = fingerprint
+
+    # Target schemata that no longer have any mappings
+    with profiler.phase('truncate'):
+        for schema_name, snapshot in snapshots.items():
+            truncate_schema(db_session, target_project_name, schema_name)
+            db_session.delete(snapshot)
+
+        db_session.flush()
+
+    return entity_count
+
+
+@app.task(
+    name='apply_mappings', ignore_result=True, bind=True, base=JobTask)
+@with_transaction
+def apply_mappings(
+        task,
+        jobid,
+        source_project_name,
+        target_project_name,
+        incremental=False
+        ):
     """
     Applies source project mappings and stores results in the target project
 
@@ -64,46 +479,646 @@ def apply_mappings(task, jobid, source_project_name, target_project_name):
     :type source_project_name: str
     :param target_project_name: Target project to transfer the results
     :type target_project_name: str
+    :param incremental: (optional) Only re-apply mappings that changed since
+                        the last run (requires ``imports.cache.dir``),
+                        otherwise the target project is rebuilt entirely
+    :type incremental: bool
 
     """
 
-    redis = app.redis
     db_session = Session
+    settings = db_session.info.get('settings')
 
-    frame = load_project_frame(db_session, source_project_name)
+    channel = _open_channel(db_session, jobid)
+    profiler = Profiler.from_settings(settings, jobid, channel)
+
+    with profiler.phase('load') as details:
+        frame = load_project_frame(db_session, source_project_name)
+        details['frame'] = describe_frame(frame)
+
+    mappings = _query_mappings(db_session, source_project_name).all()
+    mappings_count = len(mappings)
+
+    metadata = MetadataSnapshot.load(
+        db_session, get_schema_names(mappings))
+
+    channel.send_reset(mappings_count)
+
+    cache = FrameCache.from_settings(settings)
+
+    if incremental and cache:
+        entity_count = _apply_mappings_incremental(
+            db_session,
+            channel,
+            cache,
+            source_project_name,
+            target_project_name,
+            frame,
+            mappings,
+            metadata=metadata,
+            profiler=profiler
+        )
+
+    else:
+        with profiler.phase('map') as details:
+            _run_mappings(
+                Session,
+                channel,
+                source_project_name,
+                target_project_name,
+                frame,
+                mappings,
+                metadata=metadata,
+                profiler=profiler
+            )
+            details['frame'] = describe_frame(frame)
+
+        with profiler.phase('truncate'):
+            truncate_project(Session, target_project_name)
+
+            # The rebuilt project no longer matches any recorded snapshots
+            (
+                _query_snapshots(db_session, target_project_name)
+                .delete(synchronize_session=False)
+            )
+
+        with profiler.phase('populate'):
+            entity_count = populate_project(
+                Session, target_project_name, frame)
+
+    channel.flush()
+
+    _finish_job(
+        db_session,
+        jobid,
+        profiler.timings(),
+        profile=profiler.summary(),
+        mapping_count=mappings_count,
+        row_count=len(frame),
+        entity_count=entity_count
+    )
+
+
+@app.task(
+    name='prepare_mappings', ignore_result=True, bind=True, base=JobTask)
+@with_transaction
+def prepare_mappings(task, jobid, source_project_name, target_project_name,
+                     shard_count):
+    """
+    Clears the target project before the mapping shards are applied
+
+    :param task: The anonymously-bound celery task instance
+    :type task: celery.Task
+    :param jobid: A unique name for this task
+    :type jobid: str
+    :param source_project_name: Source project to load mappings for
+    :type source_project_name: str
+    :param target_project_name: Target project to transfer the results
+    :type target_project_name: str
+    :param shard_count: The number of shards the mappings are applied in
+    :type shard_count: int
+    """
+
+    db_session = Session
 
     mappings = _query_mappings(db_session, source_project_name)
     mappings_count = _count_mappings(mappings)
 
-    channel = ImportStatusChannel(redis, jobid)
-    channel.send_reset(mappings_count)
+    # Every shard reports progress for each of the mappings
+    channel = _open_channel(db_session, jobid)
+    channel.send_reset(mappings_count * shard_count)
 
-    for mapping in mappings:
+    profiler = Profiler.from_settings(
+        db_session.info.get('settings'), jobid, channel)
 
-        if mapping.status.name != 'approved':
-            channel.send_message(mapping, 'Not in approved state')
-            continue
+    with profiler.phase('truncate'):
+        truncate_project(db_session, target_project_name)
 
-        if mapping.type == 'direct':
-            mapper = direct.apply_mapping
-        elif mapping.type == 'imputation':
-            mapper = imputation.apply_mapping
-        else:
-            message = 'Unsupported mapping type: %s' % mapping.type
-            channel.send_message(mapping, message)
-            continue
+        (
+            _query_snapshots(db_session, target_project_name)
+            .delete(synchronize_session=False)
+        )
 
-        mapper(
-            Session,
+    job = _get_job(db_session, jobid)
+
+    if job is not None:
+        _add_timings(job, profiler.timings())
+
+    channel.flush()
+
+
+@app.task(name='apply_mappings_shard', bind=True, base=JobTask)
+@with_transaction
+def apply_mappings_shard(task, jobid, source_project_name,
+                         target_project_name, shard, shard_count):
+    """
+    Applies source project mappings to the patients of a single shard
+
+    Patients are assigned to shards by a checksum of their PID, so each
+    shard processes a disjoint set of patients and shards can be applied
+    concurrently on separate workers.
+
+    :param task: The anonymously-bound celery task instance
+    :type task: celery.Task
+    :param jobid: A unique name for this task
+    :type jobid: str
+    :param source_project_name: Source project to load mappings for
+    :type source_project_name: str
+    :param target_project_name: Target project to transfer the results
+    :type target_project_name: str
+    :param shard: The shard number to process
+    :type shard: int
+    :param shard_count: The total number of shards
+    :type shard_count: int
+
+    :returns: a summary of the shard that was processed
+    :rtype: dict
+    """
+
+    db_session = Session
+
+    channel = _open_channel(db_session, jobid)
+    profiler = Profiler.from_settings(
+        db_session.info.get('settings'),
+        '{}-shard{}'.format(jobid, shard),
+        channel
+    )
+
+    with profiler.phase('load') as details:
+        frame = load_project_frame(
+            db_session,
+            source_project_name,
+            shard=(shard, shard_count)
+        )
+        details['frame'] = describe_frame(frame)
+
+    mappings = _query_mappings(db_session, source_project_name).all()
+
+    metadata = MetadataSnapshot.load(
+        db_session, get_schema_names(mappings))
+
+    with profiler.phase('map') as details:
+        _run_mappings(
+            db_session,
             channel,
             source_project_name,
             target_project_name,
             frame,
-            mapping
+            mappings,
+            metadata=metadata,
+            profiler=profiler
+        )
+        details['frame'] = describe_frame(frame)
+
+    with profiler.phase('populate'):
+        entity_count = populate_project(
+            db_session, target_project_name, frame)
+
+    channel.flush()
+
+    return {
+        'shard': shard,
+        'mappings': len(mappings),
+        'rows': len(frame),
+        'entities': entity_count,
+        'timings': profiler.timings(),
+        'profile': profiler.summary(),
+    }
+
+
+@app.task(name='finalize_mappings', ignore_result=True, bind=True)
+@with_transaction
+def finalize_mappings(task, results, jobid, target_project_name):
+    """
+    Records and reports the completion of all mapping shards
+
+    Phase timings are summed across shards, so they reflect the total time
+    spent by all workers rather than the elapsed time of the job.
+
+    :param task: The anonymously-bound celery task instance
+    :type task: celery.Task
+    :param results: The summaries returned by each shard
+    :type results: list[dict]
+    :param jobid: A unique name for this task
+    :type jobid: str
+    :param target_project_name: Target project the results were stored in
+    :type target_project_name: str
+    """
+
+    db_session = Session
+
+    timings = {}
+    for result in results:
+        for phase, seconds in result['timings'].items():
+            timings[phase] = timings.get(phase, 0) + seconds
+
+    row_count = sum(result['rows'] for result in results)
+    entity_count = sum(result['entities'] for result in results)
+
+    _finish_job(
+        db_session,
+        jobid,
+        timings,
+        profile={'shards': [result['profile'] for result in results]},
+        mapping_count=max(result['mappings'] for result in results),
+        row_count=row_count,
+        entity_count=entity_count
+    )
+
+    channel = _open_channel(db_session, jobid)
+    channel.send_complete(
+        project=target_project_name,
+        shards=len(results),
+        rows=row_count,
+        entities=entity_count
+    )
+
+
+@app.task(name='fail_mappings', ignore_result=True, bind=True)
+def fail_mappings(task, request, exc, traceback, jobid, target_project_name):
+    """
+    Records and reports a distributed mapping run that failed
+
+    The target project is cleared before the shards are applied, so it is
+    left incomplete until the mappings are applied again.
+
+    :param task: The anonymously-bound celery task instance
+    :type task: celery.Task
+    :param request: The request of the task that failed
+    :type request: celery.app.task.Context
+    :param exc: The error raised by the task that failed
+    :type exc: Exception
+    :param traceback: The traceback of the error
+    :type traceback: str
+    :param jobid: A unique name for this task
+    :type jobid: str
+    :param target_project_name: Target project to transfer the results
+    :type target_project_name: str
+    """
+
+    _fail_job(task, jobid, exc)
+
+    with _open_channel(Session, jobid) as channel:
+        channel.send_error(
+            u'Mappings could not be applied, {} is incomplete until they '
+            u'are applied again ({}: {})'.format(
+                target_project_name, type(exc).__name__, exc))
+
+
+def distribute_mappings(
+        jobid,
+        source_project_name,
+        target_project_name,
+        shard_count
+        ):
+    """
+    Builds a workflow that applies mappings in parallel patient shards
+
+    The target project is cleared first, then each shard is applied by its
+    own task and a final task reports once all of them have completed.
+
+    If clearing the target project or any of the shards fails, the job is
+    marked as failed and an error is sent to its status channel (see
+    :func:`fail_mappings`). Shards that completed are not rolled back, so
+    the target project must be rebuilt by applying the mappings again.
+
+    .. note:: The target project is always rebuilt entirely, shards do not
+              support the incremental mode of :func:`apply_mappings`.
+
+    :param jobid: A unique name for this job
+    :type jobid: str
+    :param source_project_name: Source project to load mappings for
+    :type source_project_name: str
+    :param target_project_name: Target project to transfer the results
+    :type target_project_name: str
+    :param shard_count: The number of shards to distribute patients across
+    :type shard_count: int
+
+    :returns: the workflow, ready to be dispatched with ``apply_async()``
+    :rtype: celery.canvas.Signature
+    """
+
+    on_error = fail_mappings.s(jobid, target_project_name)
+
+    shards = [
+        apply_mappings_shard.si(
+            jobid,
+            source_project_name,
+            target_project_name,
+            shard,
+            shard_count
         )
+        for shard in range(shard_count)
+    ]
 
-        channel.send_progress()
-        channel.send_message(mapping, 'Mapping complete')
+    return chain(
+        prepare_mappings.si(
+            jobid,
+            source_project_name,
+            target_project_name,
+            shard_count
+        ).on_error(on_error),
+        chord(
+            shards,
+            finalize_mappings.s(jobid, target_project_name).on_error(on_error)
+        )
+    )
+
+
+class VocabularyTask(app.Task):
+    """
+    Discards cached searches once the refreshed vocabulary is committed
+    """
+
+    def on_success(self, retval, task_id, args, kwargs):
+        catalog.invalidate(app.redis)
+
+
+@app.task(
+    name='refresh_vocabulary', ignore_result=True, bind=True,
+    base=VocabularyTask)
+@with_transaction
+def refresh_vocabulary(task):
+    """
+    Refreshes the searchable vocabulary with the current schemata
+
+    Runs after codebooks are imported and every ``search.REFRESH_INTERVAL``
+    seconds (given a running celery beat), as forms may also be published
+    or added to studies by other applications.
+
+    :param task: The anonymously-bound celery task instance
+    :type task: celery.Task
+    """
+    search.refresh(Session)
+
+
+app.add_periodic_task(
+    search.REFRESH_INTERVAL, refresh_vocabulary.s(), name='refresh_vocabulary')
+
+
+class CodebookTask(app.Task):
+    """
+    Keeps the state of the codebook import job a task runs up to date
+
+    The job's name must be the task's first argument.
+    """
+
+    def before_start(self, task_id, args, kwargs):
+        _update_codebook_job(args[0], status=u'running')
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        _update_codebook_job(
+            args[0],
+            status=u'failed',
+            error=u'{}: {}'.format(type(exc).__name__, exc)
+        )
+
+    def on_success(self, retval, task_id, args, kwargs):
+        # Runs once the imported forms are committed
+        if not kwargs.get('dry'):
+            catalog.invalidate(app.redis)
+            refresh_vocabulary.apply_async()
+
+
+def _update_codebook_job(jobid, **values):
+    """
+    Updates the state of a codebook import job, keeping its expiration
+    """
+    from .views import codebook
+
+    redis = app.redis
+    key = codebook.get_job_key(jobid)
+
+    state = redis.get(key)
+    state = json.loads(state) if state is not None else {}
+    state.update(values)
+
+    ttl = redis.ttl(key)
+    if not ttl or ttl < 0:
+        ttl = codebook.DEFAULT_CODEBOOK_TTL
+
+    redis.setex(key, ttl, json.dumps(state))
+
+
+def _make_request(db_session):
+    """
+    Creates a request for the form validators, which expect one
+    """
+    request = Request.blank('/')
+    request.registry = get_current_registry()
+    request.db_session = db_session
+    return request
+
+
+def _validate_codebook(
+        request,
+        channel,
+        records,
+        batch_size=CODEBOOK_BATCH_SIZE
+        ):
+    """
+    Validates codebook rows in batches, reporting errors as they are found
+
+    Rows are consumed as they are generated, only the rows of a valid
+    codebook are kept (in serialized form) so that it can be imported.
+
+    :param request: Request for the form validators
+    :type request: pyramid.request.Request
+    :param channel: Application redis session for broadcasting events
+    :type channel: occams_imports.importers.utils.pubsub.ImportStatusChannel
+    :param records: The codebook rows
+    :type records: iterable[dict]
+    :param batch_size: Number of rows to validate at a time
+    :type batch_size: int
+
+    :returns: the number of rows evaluated, the errors, the forms and the
+              serialized rows of the codebook (if it is valid)
+    :rtype: (int, list, list, list)
+    """
+    from .views import codebook
+
+    count = 0
+    errors, forms, valid = [], [], []
+    schemata = {}
+    records = iter(records)
+
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+
+        if not batch:
+            break
+
+        batch_errors, __, batch_forms = \
+            codebook.validate_populate_imports(request, batch, schemata)
+
+        batch_errors = codebook.dump_errors(batch_errors)
+
+        for error in batch_errors:
+            channel.send_error(error)
+
+        count += len(batch)
+        errors.extend(batch_errors)
+        forms.extend(codebook.dump_forms(batch_forms))
+
+        # An invalid codebook is not imported, so its rows are not needed
+        if errors:
+            del valid[:]
+        else:
+            valid.extend(codebook.dump_records(batch))
+
+        channel.send_progress(len(batch))
+
+    return count, errors, forms, valid
+
+
+def _make_imports(forms, records):
+    """
+    Builds the attributes of validated codebook rows with their schemata
+
+    :param forms: The serialized forms of the codebook
+    :type forms: list[dict]
+    :param records: The serialized rows of the codebook
+    :type records: list[dict]
+
+    :returns: the attributes to import with their schema
+    :rtype: list[tuple]
+    """
+    from .views import codebook
+
+    schemata = {
+        (form['name'], form['title'], form['publish_date']):
+            datastore.Schema.from_json(form)
+        for form in forms
+    }
+
+    return [
+        (codebook.make_attribute(record), schemata[(
+            record['schema_name'],
+            record['schema_title'],
+            record['publish_date'].isoformat()
+        )])
+        for record in codebook.load_records(records)
+    ]
+
+
+@app.task(
+    name='import_codebook', ignore_result=True, bind=True, base=CodebookTask)
+@with_transaction
+def import_codebook(
+        task,
+        jobid,
+        study_name,
+        codebook_format,
+        delimiter,
+        checksum,
+        dry=False
+        ):
+    """
+    Validates a codebook and inserts its forms into a study
+
+    The codebook is parsed and validated as a stream of rows. The
+    validation result is cached by the contents, format and delimiter of
+    the codebook, so that a codebook that was checked by a dry run is
+    imported without being parsed and validated again.
+
+    Progress is reported as rows are validated (the total is unknown until
+    the codebook has been read entirely) and then as attributes are
+    inserted.
+
+    :param task: The anonymously-bound celery task instance
+    :type task: celery.Task
+    :param jobid: A unique name for this task
+    :type jobid: str
+    :param study_name: The study to import the forms into
+    :type study_name: str
+    :param codebook_format: denotes type of codebook, i.e. 'occams'
+    :type codebook_format: str
+    :param delimiter: delimiter used in the codebook file
+    :type delimiter: str
+    :param checksum: SHA-256 hex digest of the codebook, as stored in redis
+    :type checksum: str
+    :param dry: (optional) Only validate the codebook
+    :type dry: bool
+    """
+
+    # Imported here as the views dispatch this task
+    from .views import codebook
+
+    db_session = Session
+    redis = app.redis
+    settings = db_session.info.get('settings')
+    ttl = codebook.get_codebook_ttl(settings)
+    result_key = codebook.get_result_key(checksum, codebook_format, delimiter)
+
+    study = db_session.query(studies.Study).filter_by(name=study_name).one()
+
+    with _open_channel(db_session, jobid) as channel:
+        cached = redis.get(result_key)
+
+        if cached is not None:
+            cached = json.loads(cached)
+
+            for error in cached['errors']:
+                channel.send_error(error)
+
+        else:
+            contents = redis.get(codebook.get_codebook_key(checksum))
+
+            if contents is None:
+                raise ValueError('Codebook {} has expired'.format(checksum))
+
+            records = parse.skip_system_entries(parse.iter_dispatch(
+                io.BytesIO(contents), codebook_format, delimiter))
+
+            channel.send_reset(0)
+
+            fields_evaluated, errors, forms, valid = _validate_codebook(
+                _make_request(db_session), channel, records)
+
+            cached = {
+                'fields_evaluated': fields_evaluated,
+                'errors': errors,
+                'forms': forms,
+                'records': valid,
+            }
+
+            redis.setex(result_key, ttl, json.dumps(cached))
+
+        forms = cached['forms']
+        validation_errors = cached['errors']
+        errors = codebook.is_duplicate_schema(
+            forms, list(validation_errors), db_session)
+
+        for error in errors[len(validation_errors):]:
+            channel.send_error(error)
+
+        fields_inserted = 0
+
+        if not dry and not errors:
+            channel.send_reset(len(cached['records']))
+            fields_inserted = codebook.group_imports_by_schema(
+                _make_imports(forms, cached['records']),
+                study,
+                db_session,
+                batch_size=codebook.INSERT_BATCH_SIZE,
+                progress=channel.send_progress
+            )
+
+        result = {
+            'status': u'complete',
+            'dry': dry,
+            'fields_evaluated': cached['fields_evaluated'],
+            'errors': errors,
+            'error_count': len(errors),
+            'fields_inserted': fields_inserted,
+            'forms_inserted': len(forms) if not dry and not errors else 0,
+            'forms': forms,
+        }
+
+        channel.send_complete(
+            error_count=result['error_count'],
+            fields_inserted=result['fields_inserted'],
+            forms_inserted=result['forms_inserted']
+        )
 
-    truncate_project(Session, target_project_name)
-    populate_project(Session, target_project_name, frame)
+    redis.setex(codebook.get_job_key(jobid), ttl, json.dumps(result))
@@ -0,0 +1,35 @@
+"""Add file store columns to uploads
+
+Revision ID: 3c1b2a9d7e40
+Revises: dd6e5a287320
+Create Date: 2026-10-18 09:12:31.204118
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3c1b2a9d7e40'
+down_revision = 'dd6e5a287320'
+branch_labels = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column(
+        'upload', sa.Column('checksum', sa.String()), schema='imports')
+    op.add_column(
+        'upload', sa.Column('size', sa.BigInteger()), schema='imports')
+    op.execute(
+        'UPDATE imports.upload '
+        'SET size = octet_length(project_file) '
+        'WHERE project_file IS NOT NULL')
+    op.alter_column(
+        'upload', 'project_file', schema='imports', nullable=True)
+
+
+def downgrade():
+    op.alter_column(
+        'upload', 'project_file', schema='imports', nullable=False)
+    op.drop_column('upload', 'size', schema='imports')
+    op.drop_column('upload', 'checksum', schema='imports')
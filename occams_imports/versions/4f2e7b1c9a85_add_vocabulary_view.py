@@ -0,0 +1,27 @@
+"""Add vocabulary view.
+
+Revision ID: 4f2e7b1c9a85
+Revises: e8d3a60f91c7
+Create Date: 2026-10-18 19:22:41.306518
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4f2e7b1c9a85'
+down_revision = 'e8d3a60f91c7'
+branch_labels = None
+
+from alembic import op
+
+from occams_imports.models.vocabulary import \
+    create_vocabulary, drop_vocabulary
+
+
+def upgrade():
+    """Create trigram-indexed view to search schemata, attributes and choices."""
+    create_vocabulary(None, op.get_bind())
+
+
+def downgrade():
+    """Drop view on downgrade."""
+    drop_vocabulary(None, op.get_bind())
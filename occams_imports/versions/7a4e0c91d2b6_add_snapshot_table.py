@@ -0,0 +1,69 @@
+"""Add snapshot table.
+
+Revision ID: 7a4e0c91d2b6
+Revises: 3c1b2a9d7e40
+Create Date: 2026-10-18 10:41:07.918362
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7a4e0c91d2b6'
+down_revision = '3c1b2a9d7e40'
+branch_labels = None
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import sql
+
+
+def upgrade():
+    """Create table to track mapped data applied to target projects."""
+    op.create_table(
+        'snapshot',
+        sa.Column(
+            'id',
+            sa.Integer,
+            primary_key=True,
+            autoincrement=True,
+            nullable=False),
+        sa.Column('study_id', sa.Integer, nullable=False),
+        sa.Column('schema_name', sa.String, nullable=False),
+        sa.Column('fingerprint', sa.String, nullable=False),
+        sa.Column('create_user_id', sa.Integer, nullable=False),
+        sa.Column('create_date',
+                  sa.DateTime,
+                  nullable=False,
+                  server_default=sql.func.now()),
+        sa.Column('modify_user_id', sa.Integer, nullable=False),
+        sa.Column('modify_date',
+                  sa.DateTime,
+                  nullable=False,
+                  server_default=sql.func.now()),
+        sa.Index('ix_snapshot_create_user_id', 'create_user_id'),
+        sa.Index('ix_snapshot_modify_user_id', 'modify_user_id'),
+        sa.UniqueConstraint(
+            'study_id', 'schema_name',
+            name='uq_snapshot_study_id_schema_name'),
+        # Both main/audit tables keep the same check constraint names
+        sa.CheckConstraint('create_date <= modify_date',
+                           name='ck_snapshot_valid_timeline'),
+        schema='imports'
+    )
+
+    op.create_foreign_key(
+        'fk_snapshot_create_user_id', 'snapshot',
+        'user', ['create_user_id'], ['id'], ondelete='RESTRICT',
+        source_schema='imports')
+    op.create_foreign_key(
+        'fk_snapshot_modify_user_id', 'snapshot',
+        'user', ['modify_user_id'], ['id'], ondelete='RESTRICT',
+        source_schema='imports')
+    op.create_foreign_key(
+        'fk_snapshot_study_id', 'snapshot',
+        'study', ['study_id'], ['id'], ondelete='CASCADE',
+        source_schema='imports')
+
+
+def downgrade():
+    """Drop table on downgrade."""
+    op.drop_table('snapshot', schema='imports')
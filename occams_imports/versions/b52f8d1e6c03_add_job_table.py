@@ -0,0 +1,86 @@
+"""Add job table.
+
+Revision ID: b52f8d1e6c03
+Revises: 7a4e0c91d2b6
+Create Date: 2026-10-18 14:12:45.301126
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b52f8d1e6c03'
+down_revision = '7a4e0c91d2b6'
+branch_labels = None
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import sql
+from sqlalchemy.dialects.postgresql import JSONB
+
+
+def upgrade():
+    """Create table to track mapping pipeline runs."""
+    op.create_table(
+        'job',
+        sa.Column(
+            'id',
+            sa.Integer,
+            primary_key=True,
+            autoincrement=True,
+            nullable=False),
+        sa.Column('name', sa.String, nullable=False),
+        sa.Column('study_id', sa.Integer, nullable=False),
+        sa.Column('target_study_id', sa.Integer, nullable=False),
+        sa.Column('status', sa.String, nullable=False),
+        sa.Column('incremental', sa.Boolean, nullable=False),
+        sa.Column('shards', sa.Integer, nullable=False),
+        sa.Column('start_date', sa.DateTime),
+        sa.Column('end_date', sa.DateTime),
+        sa.Column('timings', JSONB),
+        sa.Column('mapping_count', sa.Integer),
+        sa.Column('row_count', sa.Integer),
+        sa.Column('entity_count', sa.Integer),
+        sa.Column('error', sa.UnicodeText),
+        sa.Column('create_user_id', sa.Integer, nullable=False),
+        sa.Column('create_date',
+                  sa.DateTime,
+                  nullable=False,
+                  server_default=sql.func.now()),
+        sa.Column('modify_user_id', sa.Integer, nullable=False),
+        sa.Column('modify_date',
+                  sa.DateTime,
+                  nullable=False,
+                  server_default=sql.func.now()),
+        sa.Index('ix_job_create_user_id', 'create_user_id'),
+        sa.Index('ix_job_modify_user_id', 'modify_user_id'),
+        sa.Index('ix_job_study_id_create_date', 'study_id', 'create_date'),
+        sa.UniqueConstraint('name', name='uq_job_name'),
+        sa.CheckConstraint(
+            "status IN ('pending', 'running', 'complete', 'failed')",
+            name='ck_job_valid_status'),
+        # Both main/audit tables keep the same check constraint names
+        sa.CheckConstraint('create_date <= modify_date',
+                           name='ck_job_valid_timeline'),
+        schema='imports'
+    )
+
+    op.create_foreign_key(
+        'fk_job_create_user_id', 'job',
+        'user', ['create_user_id'], ['id'], ondelete='RESTRICT',
+        source_schema='imports')
+    op.create_foreign_key(
+        'fk_job_modify_user_id', 'job',
+        'user', ['modify_user_id'], ['id'], ondelete='RESTRICT',
+        source_schema='imports')
+    op.create_foreign_key(
+        'fk_job_study_id', 'job',
+        'study', ['study_id'], ['id'], ondelete='CASCADE',
+        source_schema='imports')
+    op.create_foreign_key(
+        'fk_job_target_study_id', 'job',
+        'study', ['target_study_id'], ['id'], ondelete='CASCADE',
+        source_schema='imports')
+
+
+def downgrade():
+    """Drop table on downgrade."""
+    op.drop_table('job', schema='imports')
@@ -0,0 +1,30 @@
+"""Add job profile.
+
+Revision ID: e8d3a60f91c7
+Revises: b52f8d1e6c03
+Create Date: 2026-10-18 16:03:12.554218
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e8d3a60f91c7'
+down_revision = 'b52f8d1e6c03'
+branch_labels = None
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+
+
+def upgrade():
+    """Add column for the detailed measurements of a job."""
+    op.add_column(
+        'job',
+        sa.Column('profile', JSONB),
+        schema='imports'
+    )
+
+
+def downgrade():
+    """Drop column on downgrade."""
+    op.drop_column('job', 'profile', schema='imports')
@@ -5,22 +5,53 @@ This data is the structure of the schemas and attributes for forms not the
 collected data
 """
 
+from cgi import FieldStorage
+from collections import OrderedDict
+import datetime
+import hashlib
+import json
+import keyword
+import re
+import uuid
+
+import numpy as np
+import pandas as pd
+import six
+from pyramid.httpexceptions import HTTPNotFound
 from pyramid.view import view_config
 from pyramid.session import check_csrf_token
+import transaction
 
-from sqlalchemy.sql import exists
 import unicodecsv as csv
 
 from occams.utils.forms import wtferrors
 from occams_datastore import models as datastore
 from occams_studies import models as studies
-from occams_forms.views.field import FieldFormFactory
 from occams_forms.views.form import FormFormFactory
 
-from .. import models
+from .. import catalog, models, tasks
+from ..importers.utils.schemata import find_existing_forms
 from ..parsers import parse
 
 
+# Field rules of the forms application, see ``validate_fields``
+RE_VALID_NAME = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]+$')
+RE_VALID_CODE = re.compile(r'^-?[0-9]+$')
+NAME_MAX_LENGTH = 100
+RESERVED_NAMES = frozenset(keyword.kwlist)
+FIELD_TYPES = frozenset([
+    u'blob', u'choice', u'date', u'datetime', u'number', u'section',
+    u'string', u'text',
+])
+
+# Seconds uploaded codebooks, dry-run results and job results are kept
+CODEBOOK_TTL_SETTING = 'imports.codebook.ttl'
+DEFAULT_CODEBOOK_TTL = 86400
+
+# Number of attributes inserted between flushes
+INSERT_BATCH_SIZE = 1000
+
+
 def log_errors(errors, record):
     """
     Return error template dict
@@ -41,7 +72,7 @@ def log_errors(errors, record):
     return output
 
 
-def process_import(schema, attr_dict, study, db_session):
+def process_import(schema, attr_dict, study, db_session, flush=True):
     """
     Insert import, schema, and attrs to datastore
 
@@ -49,6 +80,7 @@ def process_import(schema, attr_dict, study, db_session):
     :attr_dict: dict of attributes to be bound to schema
     :study: study object
     :db_session: required for db inserts
+    :flush: whether to flush the inserts right away
 
     :return: None
     """
@@ -61,20 +93,119 @@ def process_import(schema, attr_dict, study, db_session):
     )
 
     db_session.add(imported)
-    db_session.flush()
+
+    if flush:
+        db_session.flush()
+
+
+def validate_fields(records):
+    """
+    Validate the attribute fields of all records at once
+
+    Applies the rules of the field editor of the forms application as
+    column-wise operations over the whole codebook, instead of building
+    a form for every row.
+
+    :records: a list of csv row data
+
+    :return: a list of error dicts (or None if valid), in record order
+    """
+    if not records:
+        return []
+
+    frame = pd.DataFrame({
+        'name': [record['name'] or u'' for record in records],
+        'title': [record['title'] or u'' for record in records],
+        'type': [record['type'] or u'' for record in records],
+    })
+
+    # Rules of a field are checked in order, only its first error is kept
+    checks = [
+        ('name', frame['name'] == u'', u'This field is required.'),
+        ('name',
+            frame['name'].str.len() > NAME_MAX_LENGTH,
+            u'Field cannot be longer than {} characters.'.format(
+                NAME_MAX_LENGTH)),
+        ('name',
+            ~frame['name'].str.contains(RE_VALID_NAME.pattern),
+            u'Not a valid variable name'),
+        ('name',
+            frame['name'].isin(sorted(RESERVED_NAMES)),
+            u'Can not use a reserved word'),
+        ('title', frame['title'] == u'', u'This field is required.'),
+        ('type',
+            ~frame['type'].isin(sorted(FIELD_TYPES)),
+            u'Not a valid choice'),
+    ]
+
+    results = [None] * len(records)
+
+    for field, invalid, message in checks:
+        for i in np.flatnonzero(invalid.values):
+            results[i] = results[i] or {}
+            results[i].setdefault(field, message)
+
+    # Only choice fields carry choices, so check them individually
+    for i in np.flatnonzero((frame['type'] == u'choice').values):
+        codes = set()
+        for position, (code, label) in enumerate(records[i]['choices']):
+            if not RE_VALID_CODE.match(code):
+                results[i] = results[i] or {}
+                results[i]['choices-{}-name'.format(position)] = \
+                    u'Not a valid numeric code'
+            elif code in codes:
+                results[i] = results[i] or {}
+                results[i]['choices-{}-name'.format(position)] = \
+                    u'Duplicate code'
+            codes.add(code)
+
+    return results
+
+
+def make_attribute(record):
+    """
+    Return the attribute described by a codebook row
+
+    :record: a dict of csv row data
+
+    :return: datastore attribute object
+    """
+    return datastore.Attribute(
+        name=record['name'],
+        title=record['title'],
+        description=record['description'],
+        is_required=record['is_required'],
+        is_collection=record['is_collection'],
+        is_private=record['is_private'],
+        type=record['type'],
+        order=record['order'],
+        choices=parse.get_choices(record['choices'])
+    )
 
 
-def validate_populate_imports(request, records):
+def validate_populate_imports(request, records, schemata=None):
     """
     Return list of errors, imports and forms
 
+    Each distinct schema is validated only once and its attributes are
+    validated in bulk (see ``validate_fields``).
+
     :request: request obj
     :records: a list of csv row data
+    :schemata: (optional) validated schemata by key, to share schema
+               validation between batches of the same codebook. Forms are
+               only returned by the batch that first validated them.
 
     :return: errors, imports, and forms for template rendering
     """
-    errors, imports, forms = ([], [], [])
-    for record in records:
+    errors, imports = ([], [])
+    forms = OrderedDict()
+    schemata = {} if schemata is None else schemata
+
+    FormForm = FormFormFactory(context=None, request=request)
+    field_errors = validate_fields(records)
+
+    for record, field_error in zip(records, field_errors):
         if record['publish_date'] is None:
             publish_date = None
             publish_date_error = {}
@@ -88,85 +219,83 @@ def validate_populate_imports(request, records):
         else:
             publish_date = record['publish_date'].strftime('%Y-%m-%d')
 
-        schema_dict = {
-            'name': record['schema_name'],
-            'title': record['schema_title'],
-            'publish_date': publish_date
-        }
+        key = (record['schema_name'], record['schema_title'], publish_date)
+
+        if key not in schemata:
+            schema_dict = {
+                'name': record['schema_name'],
+                'title': record['schema_title'],
+                'publish_date': publish_date
+            }
+            form_form = FormForm.from_json(schema_dict)
+            if not form_form.validate():
+                schemata[key] = (None, wtferrors(form_form))
+            else:
+                schema = datastore.Schema.from_json(schema_dict)
+                forms[key] = schema.to_json()
+                schemata[key] = (schema, None)
 
-        FormForm = FormFormFactory(context=None, request=request)
-        form_form = FormForm.from_json(schema_dict)
+        schema, schema_errors = schemata[key]
 
-        if not form_form.validate():
+        if schema is None:
             schema_error = {}
-            schema_error['errors'] = wtferrors(form_form)
-            schema_error['schema_name'] = schema_dict['name']
-            schema_error['schema_title'] = schema_dict['title']
+            schema_error['errors'] = schema_errors
+            schema_error['schema_name'] = record['schema_name']
+            schema_error['schema_title'] = record['schema_title']
             schema_error['schema_publish_date'] = record['publish_date']
             schema_error['name'] = record['name']
             schema_error['title'] = record['title']
             errors.append(schema_error)
 
-        else:
-            schema = datastore.Schema.from_json(schema_dict)
-
-            if schema.to_json() not in forms:
-                forms.append(schema.to_json())
-
-            choices = parse.get_choices(record['choices'])
-            # below needed because we are calling from_json on record
-            record['choices'] = choices
-            FieldForm = FieldFormFactory(context=schema, request=request)
-            form = FieldForm.from_json(record)
+        elif field_error:
+            errors.append(log_errors(field_error, record))
 
-            if not form.validate():
-                output = log_errors(wtferrors(form), record)
-                errors.append(output)
-
-            else:
-                imports.append((datastore.Attribute(
-                    name=record['name'],
-                    title=record['title'],
-                    description=record['description'],
-                    is_required=record['is_required'],
-                    is_collection=record['is_collection'],
-                    is_private=record['is_private'],
-                    type=record['type'],
-                    order=record['order'],
-                    choices=choices
-                ), schema))
+        else:
+            imports.append((make_attribute(record), schema))
 
-    return errors, imports, forms
+    return errors, imports, list(forms.values())
 
 
-def group_imports_by_schema(imports, study, db_session):
+def group_imports_by_schema(imports, study, db_session, batch_size=None,
+                            progress=None):
     """
     Group attributes by schema and process
 
     :imports: list of tuples, 1st element is an attribute, 2nd is a schema
     :study: study of the import
     :db_session: required for db inserts
+    :batch_size: (optional) number of attributes to insert per flush,
+                 otherwise each schema is flushed as it is processed
+    :progress: (optional) called with the number of attributes of each
+               flushed batch
 
     :return: count of fields inserted
     """
-    current_schema = imports[0][1]
-    fields_inserted = 0
-    attr_dict = {}
+    grouped = OrderedDict()
     for attribute, schema in imports:
-        if schema.name == current_schema.name and schema.publish_date == current_schema.publish_date:
-            attr_dict[attribute.name] = attribute
-            fields_inserted += 1
+        key = (schema.name, schema.publish_date)
+        __, attr_dict = grouped.setdefault(key, (schema, {}))
+        attr_dict[attribute.name] = attribute
+
+    pending = 0
+
+    for schema, attr_dict in grouped.values():
+        pending += len(attr_dict)
+
+        if batch_size is None or pending >= batch_size:
+            process_import(schema, attr_dict, study, db_session)
+            if progress is not None:
+                progress(pending)
+            pending = 0
         else:
-            process_import(current_schema, attr_dict, study, db_session)
-            current_schema = schema
-            attr_dict = {}
-            attr_dict[attribute.name] = attribute
-            fields_inserted += 1
+            process_import(schema, attr_dict, study, db_session, flush=False)
 
-    if attr_dict:
-        process_import(current_schema, attr_dict, study, db_session)
+    if pending:
+        db_session.flush()
+        if progress is not None:
+            progress(pending)
 
-    return fields_inserted
+    return len(imports)
 
 
 def is_duplicate_schema(forms, errors, db_session):
@@ -180,20 +309,10 @@ def is_duplicate_schema(forms, errors, db_session):
     :return: updated error list
     """
     forms = get_unique_forms(forms)
+    existing = find_existing_forms(db_session, forms)
 
-    for form in forms:
-        name = form[0]
-        title = form[1]
-        publish_date = form[2]
-        form_exists = (
-            db_session.query(
-                exists()
-                .where(datastore.Schema.name == name)
-                .where(datastore.Schema.title == title)
-                .where(datastore.Schema.publish_date == publish_date)).scalar()
-        )
-
-        if form_exists:
+    for name, title, publish_date in forms:
+        if (name, title, publish_date) in existing:
             errors.append(
                 {
                     'schema_name': name,
@@ -285,6 +404,132 @@ def validate_delimiter(delimiter, codebook):
     return delimiter_mismatch, errors
 
 
+def invalidate_catalog_on_commit(redis):
+    """
+    Discard the schema catalog and refresh the searchable vocabulary once
+    the imported forms are committed
+
+    :redis: redis connection
+    """
+    def invalidate(success):
+        if success:
+            catalog.invalidate(redis)
+            tasks.refresh_vocabulary.apply_async()
+
+    transaction.get().addAfterCommitHook(invalidate)
+
+
+def get_codebook_ttl(settings):
+    """
+    Return the number of seconds codebook imports are kept in redis
+
+    :settings: application settings
+
+    :return: the configured time to live, a day by default
+    """
+    return int((settings or {}).get(CODEBOOK_TTL_SETTING) or
+               DEFAULT_CODEBOOK_TTL)
+
+
+def get_codebook_key(checksum):
+    """
+    Return the redis key of an uploaded codebook
+
+    :checksum: SHA-256 hex digest of the codebook contents
+    """
+    return 'imports:codebook:{}'.format(checksum)
+
+
+def get_result_key(checksum, codebook_format, delimiter):
+    """
+    Return the redis key of a codebook's validation result
+
+    :checksum: SHA-256 hex digest of the codebook contents
+    :codebook_format: denotes type of codebook, i.e. 'occams'
+    :delimiter: delimiter used in the codebook file
+    """
+    return 'imports:codebook-result:{}:{}:{}'.format(
+        checksum, codebook_format, delimiter)
+
+
+def get_job_key(jobid):
+    """
+    Return the redis key of a codebook import job's state
+
+    :jobid: unique name of the job
+    """
+    return 'imports:codebook-job:{}'.format(jobid)
+
+
+def dump_records(records):
+    """
+    Return codebook rows in a JSON-serializable form
+
+    :records: a list of csv row data
+
+    :return: list of rows with ISO formatted publish dates
+    """
+    return [
+        dict(record, publish_date=(
+            record['publish_date'] and record['publish_date'].isoformat()))
+        for record in records
+    ]
+
+
+def dump_errors(errors):
+    """
+    Return errors in a JSON-serializable form
+
+    :errors: A list of dictionaries of error data
+
+    :return: list of errors with ISO formatted publish dates
+    """
+    return [
+        dict(error, schema_publish_date=(
+            error['schema_publish_date'].isoformat()
+            if isinstance(error['schema_publish_date'], datetime.date)
+            else error['schema_publish_date']))
+        for error in errors
+    ]
+
+
+def dump_forms(forms):
+    """
+    Return forms in a JSON-serializable form
+
+    :forms: A list of forms represented by dictionaries
+
+    :return: list of the name, title and ISO formatted publish date of forms
+    """
+    return [
+        {
+            'name': form['name'],
+            'title': form['title'],
+            'publish_date': (
+                form['publish_date'].isoformat()
+                if isinstance(form['publish_date'], datetime.date)
+                else form['publish_date']),
+        }
+        for form in forms
+    ]
+
+
+def load_records(records):
+    """
+    Return codebook rows from their JSON-serializable form
+
+    :records: rows as returned by ``dump_records``
+
+    :return: a list of csv row data
+    """
+    return [
+        dict(record, publish_date=(
+            record['publish_date'] and datetime.datetime.strptime(
+                record['publish_date'], '%Y-%m-%d').date()))
+        for record in records
+    ]
+
+
 @view_config(
     route_name='imports.codebooks_occams',
     permission='import',
@@ -351,8 +596,8 @@ def insert_codebooks(context, request):
         forms = []
 
     else:
-        records = parse.parse_dispatch(codebook, codebook_format, delimiter)
-        records = parse.remove_system_entries(records)
+        records = list(parse.skip_system_entries(
+            parse.iter_dispatch(codebook, codebook_format, delimiter)))
 
         errors, imports, forms = validate_populate_imports(request, records)
         errors = is_duplicate_schema(forms, errors, db_session)
@@ -360,6 +605,7 @@ def insert_codebooks(context, request):
         fields_inserted = 0
         if not dry and not errors:
             fields_inserted = group_imports_by_schema(imports, study, db_session)
+            invalidate_catalog_on_commit(request.redis)
 
     return {
         'fields_evaluated': len(records),
@@ -369,3 +615,96 @@ def insert_codebooks(context, request):
         'forms_inserted': len(forms) if not dry and not errors else 0,
         'forms': forms
     }
+
+
+@view_config(
+    route_name='imports.codebook_jobs',
+    permission='import',
+    request_method='POST',
+    renderer='json'
+)
+def add_codebook_job(context, request):
+    """
+    Dispatch the import of a codebook as a background job
+
+    The codebook is kept in redis for the worker. Progress and errors are
+    published on the job's status stream and its outcome is available from
+    the job's detail url once complete.
+    """
+    check_csrf_token(request)
+    db_session = request.db_session
+    settings = request.registry.settings
+
+    codebook_format = request.matchdict['format']
+
+    study = (
+        db_session.query(studies.Study)
+        .filter(studies.Study.title == request.POST.get('study'))
+        .first())
+
+    if study is None:
+        request.response.status = 400
+        return {'errors': ['No study found']}
+
+    upload = request.POST.get('codebook')
+
+    if not isinstance(upload, FieldStorage):
+        request.response.status = 400
+        return {'errors': ['No file found in the request']}
+
+    codebook = upload.file
+    delimiter = convert_delimiter(request.POST.get('delimiter', ','))
+
+    if codebook_format != u'iform':
+        delimiter_mismatch, errors = validate_delimiter(delimiter, codebook)
+        if delimiter_mismatch:
+            request.response.status = 400
+            return {'errors': errors}
+
+    codebook.seek(0)
+    contents = codebook.read()
+    checksum = hashlib.sha256(contents).hexdigest()
+    dry = request.POST.get('mode') == u'dry'
+    jobid = six.text_type(uuid.uuid4())
+    ttl = get_codebook_ttl(settings)
+
+    pipeline = request.redis.pipeline()
+    pipeline.setex(get_codebook_key(checksum), ttl, contents)
+    pipeline.setex(get_job_key(jobid), ttl, json.dumps({
+        'status': u'pending',
+        'dry': dry,
+    }))
+    pipeline.execute()
+
+    tasks.import_codebook.apply_async(
+        args=[jobid, study.name, codebook_format, delimiter, checksum],
+        kwargs={'dry': dry},
+        task_id=jobid
+    )
+
+    return {
+        'jobid': jobid,
+        '$url': request.route_path(
+            'imports.codebook_job', format=codebook_format, job=jobid),
+        '$statusUrl': request.route_path('imports.job_status', job=jobid),
+    }
+
+
+@view_config(
+    route_name='imports.codebook_job',
+    permission='import',
+    request_method='GET',
+    renderer='json'
+)
+def codebook_job(context, request):
+    """
+    Return the state of a codebook import job
+
+    Once complete, contains the same results as the status page.
+    """
+    state = request.redis.get(get_job_key(request.matchdict['job']))
+
+    if state is None:
+        raise HTTPNotFound()
+
+    return json.loads(state)
@@ -0,0 +1,125 @@
+"""
+Job views
+
+Each run of the mapping pipeline is recorded as a job so that its outcome
+and performance can be reviewed later.
+
+"""
+
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.view import view_config
+from sqlalchemy import orm
+
+from .. import models
+
+
+# Number of jobs listed when no limit is requested
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+@view_config(
+    route_name='imports.job_list',
+    permission='view',
+    request_method='GET',
+    renderer='json'
+)
+def list_(context, request):
+    """
+    Lists the most recent jobs, optionally only those of a project
+    """
+
+    db_session = request.db_session
+
+    try:
+        limit = int(request.params.get('limit') or DEFAULT_LIMIT)
+    except ValueError:
+        limit = DEFAULT_LIMIT
+
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    query = (
+        db_session.query(models.Job)
+        .options(
+            orm.joinedload(models.Job.study),
+            orm.joinedload(models.Job.target_study)
+        )
+        .order_by(models.Job.create_date.desc(), models.Job.id.desc())
+    )
+
+    project_name = request.params.get('project')
+
+    if project_name:
+        query = query.filter(models.Job.study.has(name=project_name))
+
+    status = request.params.get('status')
+
+    if status:
+        query = query.filter_by(status=status)
+
+    return {
+        'items': [serialize(request, job) for job in query.limit(limit)]
+    }
+
+
+@view_config(
+    route_name='imports.job_detail',
+    permission='view',
+    request_method='GET',
+    renderer='json'
+)
+def get(context, request):
+    """
+    Returns the details of a single job, including its measurements
+    """
+
+    db_session = request.db_session
+
+    job = (
+        db_session.query(models.Job)
+        .filter_by(name=request.matchdict['job'])
+        .first()
+    )
+
+    if job is None:
+        raise HTTPNotFound()
+
+    result = serialize(request, job)
+    result['profile'] = job.profile or {}
+
+    return result
+
+
+def serialize(request, job):
+    """
+    Serializes a job record for the JSON API
+    """
+
+    duration = None
+
+    if job.start_date and job.end_date:
+        duration = (job.end_date - job.start_date).total_seconds()
+
+    return {
+        '$url': request.route_path('imports.job_detail', job=job.name),
+        '$statusUrl': request.route_path('imports.job_status', job=job.name),
+        'id': job.name,
+        'project': job.study.name,
+        'target': job.target_study.name,
+        'status': job.status,
+        'incremental': job.incremental,
+        'shards': job.shards,
+        'create_date': _isoformat(job.create_date),
+        'start_date': _isoformat(job.start_date),
+        'end_date': _isoformat(job.end_date),
+        'duration': duration,
+        'timings': job.timings or {},
+        'mapping_count': job.mapping_count,
+        'row_count': job.row_count,
+        'entity_count': job.entity_count,
+        'error': job.error,
+    }
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
@@ -2,96 +2,180 @@
 Perform direct and imputation mappings of Target variables
 """
 
+import base64
+import datetime
 import json
-from operator import itemgetter
 
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.response import Response
 from pyramid.view import view_config
 from pyramid.session import check_csrf_token
 from pyramid.renderers import render_to_response
+import sqlalchemy as sa
 from sqlalchemy import asc
-from sqlalchemy.orm import joinedload
-from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
+from sqlalchemy.orm import contains_eager
 import wtforms
+from webob.etag import ETagMatcher
 
 from occams_datastore import models as datastore
 from occams_studies import models as studies
 
-from .. import models
-
-
-def update_schema_data(data, schemas, drsc):
-    """Converts sql alchemy schema objects to dictionary for rendering"""
-
-    site = u'DRSC' if drsc else u''
-
-    for schema in schemas:
-        attributes = []
-        for attr in sorted(schema.attributes):
-            attribute = {}
-            attribute['variable'] = schema.attributes[attr].name
-            attribute['label'] = schema.attributes[attr].title
-            attribute['datatype'] = schema.attributes[attr].type
-            if schema.attributes[attr].type == u'choice':
-                choices = []
-                for choice in schema.attributes[attr].choices:
-                    name = schema.attributes[attr].choices[choice].name
-                    title = schema.attributes[attr].choices[choice].title
-                    order = schema.attributes[attr].choices[choice].order
-                    choices.append(
-                        {u'name': name, u'label': title, u'order': order}
-                    )
-                    # choices need to be sorted for display in mappings table
-                    choices = sorted(choices, key=itemgetter('order'))
-
-            else:
-                choices = []
-
-            attribute['choices'] = choices
-            attributes.append(attribute)
-
-        data['forms'].append({
-            u'name': schema.name,
-            u'publish_date': schema.publish_date.strftime('%Y-%m-%d'),
-            u'attributes': attributes,
-            u'site': site
-        })
+from .. import catalog, models, search
+
+
+# Number of mappings listed when no limit is requested
+MAPPINGS_DEFAULT_LIMIT = 100
+MAPPINGS_MAX_LIMIT = 1000
+
+# Columns mappings can be listed by, never null so that they can be
+# compared with the cursor of a page
+MAPPING_SORT_COLUMNS = {
+    u'id': models.Mapping.id,
+    u'status': models.Status.name,
+    u'study': sa.func.coalesce(studies.Study.title, u''),
+    u'target_form': sa.func.coalesce(
+        models.Mapping.logic['target_schema'].astext, u''),
+}
+
+
+def accepts_gzip(request):
+    """
+    Checks if the client accepts gzip-compressed responses
+
+    Clients that do not send an Accept-Encoding header are served
+    uncompressed responses.
+
+    :request: the current request
+
+    :return: whether the response may be gzip-compressed
+    """
+    return (
+        'Accept-Encoding' in request.headers and
+        request.accept_encoding.best_match(['gzip']) == 'gzip')
+
 
-    return data
+def catalog_response(request, entry):
+    """
+    Serves a catalog entry, honoring conditional and compressed requests
+
+    :request: the current request
+    :entry: the ETag and gzip-compressed body of the entry
+
+    :return: the response, not modified if the client has the entry already
+    """
+    etag, body = entry
+
+    response = Response(content_type='application/json', charset='utf-8')
+    response.headers['ETag'] = 'W/"{}"'.format(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Clients may keep the entry but must check it is still current
+    response.headers['Cache-Control'] = 'private, no-cache'
+
+    if_none_match = ETagMatcher.parse(
+        request.headers.get('If-None-Match', ''), strong=False)
+
+    if etag in if_none_match:
+        response.status = 304
+    elif accepts_gzip(request):
+        response.content_encoding = 'gzip'
+        response.body = body
+    else:
+        response.body = catalog.decompress(body)
+
+    return response
 
 
 @view_config(
     route_name='imports.schemas',
     permission='add',
     request_method='GET',
-    xhr=True,
-    renderer='json')
+    xhr=True)
 def get_all_schemas(context, request):
+    """
+    Serves all forms available for mapping, with their attributes
+    """
     db_session = request.db_session
 
-    # mappings may only occur with schemas associated with a study
-    schemas = (
-        db_session.query(datastore.Schema)
-        .options(joinedload('attributes').joinedload('choices'))
-        .select_from(studies.Study)
-        .join(studies.Study.schemata)
-        .filter(studies.Study.name != u'drsc')
-        .distinct().order_by(datastore.Schema.name).all())
+    entry = catalog.get_entry(
+        request.redis,
+        request.registry.settings,
+        ('forms',),
+        lambda: {'forms': catalog.query_forms(db_session)})
 
-    drsc_schemas = (
-        db_session.query(datastore.Schema)
-        .options(joinedload('attributes').joinedload('choices'))
-        .select_from(studies.Study)
-        .join(studies.Study.schemata)
-        .filter(studies.Study.name == u'drsc')
-        .distinct().order_by(datastore.Schema.name).all())
+    return catalog_response(request, entry)
 
-    data = {}
-    data['forms'] = []
 
-    data = update_schema_data(data, schemas, drsc=False)
-    data = update_schema_data(data, drsc_schemas, drsc=True)
+@view_config(
+    route_name='imports.schema_catalog',
+    permission='add',
+    request_method='GET',
+    xhr=True)
+def schema_catalog(context, request):
+    """
+    Serves an index of the forms available for mapping
+
+    Attributes are not listed, clients fetch them form by form as needed
+    (see ``schema_catalog_detail``). The index can be limited to the forms
+    of a study with the ``study`` parameter.
+    """
+    db_session = request.db_session
+    study_name = request.GET.get('study') or None
+
+    def build():
+        return {
+            'forms': catalog.query_forms(
+                db_session, study_name=study_name, attributes=False)
+        }
 
-    return data
+    entry = catalog.get_entry(
+        request.redis,
+        request.registry.settings,
+        ('index', study_name),
+        build)
+
+    return catalog_response(request, entry)
+
+
+@view_config(
+    route_name='imports.schema_catalog_detail',
+    permission='add',
+    request_method='GET',
+    xhr=True)
+def schema_catalog_detail(context, request):
+    """
+    Serves the attributes of a single form
+    """
+    db_session = request.db_session
+    schema_name = request.matchdict['schema']
+    publish_date = request.matchdict['publish_date']
+
+    try:
+        datetime.datetime.strptime(publish_date, '%Y-%m-%d')
+    except ValueError:
+        raise HTTPNotFound()
+
+    def build():
+        forms = catalog.query_forms(
+            db_session, schema_name=schema_name, publish_date=publish_date)
+        if not forms:
+            return None
+        form = forms[0]
+        return {
+            'name': form['name'],
+            'publish_date': form['publish_date'],
+            'attributes': form['attributes']
+        }
+
+    entry = catalog.get_entry(
+        request.redis,
+        request.registry.settings,
+        ('schema', schema_name, publish_date),
+        build)
+
+    if entry is None:
+        raise HTTPNotFound()
+
+    return catalog_response(request, entry)
 
 
 @view_config(
@@ -131,33 +215,20 @@ def schemas(context, request):
 
     data = search_form.data
 
-    # mappings may only occur with schemas associated with a study
-    schemata_query = (
-        db_session.query(datastore.Schema)
-        .select_from(studies.Study)
-        .join(studies.Study.schemata)
-        .distinct())
-
-    if data['term']:
-        schemata_query = (
-            schemata_query
-            .filter(datastore.Schema.name.ilike('%{}%'.format(data['term']))))
-
-    schemata_query = (
-        schemata_query
-        .order_by(datastore.Schema.name)
-        .limit(25)
-    )
+    schemata = search.cached(
+        request.redis,
+        ('schemata', data['term']),
+        lambda: search.search_schemata(db_session, data['term']))
 
     def schema2json(schema):
         return {
-            u'name': schema.name,
-            u'publish_date': schema.publish_date,
+            u'name': schema['name'],
+            u'publish_date': schema['publish_date'],
             u'attributes': [],
         }
 
     return {
-        'schemata': [schema2json(schema) for schema in schemata_query]
+        'schemata': [schema2json(schema) for schema in schemata]
     }
 
 
@@ -184,41 +255,14 @@ def get_attributes(context, request):
 
     data = search_form.data
 
-    attributes_query = (
-        db_session.query(datastore.Attribute)
-        .options(joinedload('choices'))
-        .join(datastore.Schema)
-        .filter(datastore.Schema.name == data['schema'])
-    )
-
-    if data['term']:
-        attributes_query = (
-            attributes_query
-            .filter(datastore.Attribute.name.ilike(
-                '%{}%'.format(data['term']))))
-
-    attributes_query = (
-        attributes_query
-        .order_by(datastore.Attribute.name)
-        .limit(25)
-    )
-
-    def choice2json(choice):
-        return {
-            u'name': choice.name,
-            u'label': choice.title,
-            u'order': choice.order
-        }
-
-    def attribute2json(attribute):
-        return {
-            'name': attribute.name,
-            'title': attribute.title,
-            'type': attribute.type,
-        }
+    attributes = search.cached(
+        request.redis,
+        ('attributes', data['schema'], data['term']),
+        lambda: search.search_attributes(
+            db_session, data['schema'], data['term']))
 
     return {
-        'attributes': [attribute2json(schema) for schema in attributes_query]
+        'attributes': attributes
     }
 
 
@@ -247,37 +291,14 @@ def get_choices(context, request):
 
     data = search_form.data
 
-    choices_query = (
-        db_session.query(datastore.Choice)
-        .join(datastore.Attribute)
-        .join(datastore.Schema)
-        .filter(datastore.Schema.name == data['schema'])
-        .filter(datastore.Attribute.name == data['attribute'])
-    )
-
-    if data['term']:
-        pattern = '%{}%'.format(data['term'])
-        choices_query = (
-            choices_query
-            .filter(
-                datastore.Choice.name.ilike(pattern)
-                | datastore.Choice.title.ilike(pattern)))
-
-    choices_query = (
-        choices_query
-        .order_by(datastore.Choice.name)
-        .limit(25)
-    )
-
-    def choice2json(choice):
-        return {
-            u'name': choice.name,
-            u'title': choice.title,
-            u'order': choice.order
-        }
+    choices = search.cached(
+        request.redis,
+        ('choices', data['schema'], data['attribute'], data['term']),
+        lambda: search.search_choices(
+            db_session, data['schema'], data['attribute'], data['term']))
 
     return {
-        'choices': [choice2json(choice) for choice in choices_query]
+        'choices': choices
     }
 
 
@@ -456,6 +477,79 @@ def update_notes(context, request):
     return {}
 
 
+def encode_cursor(values):
+    """
+    Encode the sort values of the last listed row as an opaque cursor
+    """
+    token = json.dumps(values).encode('utf-8')
+    return base64.urlsafe_b64encode(token).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor created by ``encode_cursor``
+
+    :return: the sort value and id of the last listed row, otherwise `None`
+             if the cursor is invalid
+    """
+    try:
+        values = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError, UnicodeError):
+        return None
+
+    if not isinstance(values, list) or len(values) != 2:
+        return None
+
+    return values
+
+
+def mapping2json(mapping):
+    """Converts a mapping to a listing row"""
+
+    row = {}
+
+    row['target_form'] = mapping.logic['target_schema']
+    row['target_variable'] = mapping.logic['target_variable']
+
+    # imputation mappings may have multiple forms and variables
+    if mapping.type == 'imputation':
+        row['forms'] = mapping.logic['forms']
+
+    else:
+        row['study_form'] = mapping.logic['source_schema']
+        row['study_variable'] = mapping.logic['source_variable']
+
+    row['study'] = mapping.study.title
+    row['date_mapped'] = mapping.create_date.date().isoformat()
+    row['mapped_id'] = mapping.id
+
+    row['status'] = mapping.status.name
+    row['note'] = mapping.notes
+
+    return row
+
+
+def iter_json(data, rows):
+    """
+    Encode a listing as JSON, one row at a time
+
+    :data: the listing's properties, may not be empty
+    :rows: the listing's rows
+
+    :return: chunks of the encoded listing
+    """
+    yield json.dumps(data)[:-1].encode('utf-8')
+    yield b', "rows": ['
+
+    for i, row in enumerate(rows):
+        if i:
+            yield b', '
+        yield json.dumps(row).encode('utf-8')
+
+    yield b']}'
+
+
 @view_config(
     route_name='imports.mappings.view',
     permission='view',
@@ -464,11 +558,85 @@ def update_notes(context, request):
     renderer='json'
 )
 def mappings(context, request):
+    """
+    Lists mappings a page at a time
+
+    Mappings can be filtered by ``status``, ``study`` (name) and
+    ``target_form`` and sorted (``sort``) by any of these or ``id``, in
+    descending order if prefixed with ``-``. Pages are requested with the
+    ``cursor`` of the previous page, listed as ``$next`` while there are
+    more mappings. Every page lists the number of matching mappings
+    (``count``) and of their distinct target variables
+    (``variable_count``).
+    """
     db_session = request.db_session
+    params = request.GET
+
+    try:
+        limit = int(params.get('limit') or MAPPINGS_DEFAULT_LIMIT)
+    except ValueError:
+        limit = MAPPINGS_DEFAULT_LIMIT
+
+    limit = max(1, min(limit, MAPPINGS_MAX_LIMIT))
+
+    sort = params.get('sort') or u'id'
+    descending = sort.startswith(u'-')
+    sort_column = MAPPING_SORT_COLUMNS.get(sort.lstrip(u'-'))
+
+    if sort_column is None:
+        request.response.status = 400
+        return {'errors': ['Invalid sort: ' + sort]}
 
-    mappings = (
+    query = (
         db_session.query(models.Mapping)
-        .order_by(models.Mapping.id))
+        .join(models.Mapping.study)
+        .join(models.Mapping.status))
+
+    if params.get('status'):
+        query = query.filter(models.Status.name == params['status'])
+
+    if params.get('study'):
+        query = query.filter(studies.Study.name == params['study'])
+
+    if params.get('target_form'):
+        query = query.filter(
+            MAPPING_SORT_COLUMNS['target_form'] == params['target_form'])
+
+    count, variable_count = query.with_entities(
+        sa.func.count(models.Mapping.id),
+        sa.func.count(sa.distinct(
+            models.Mapping.logic['target_variable'].astext))).one()
+
+    query = (
+        query
+        .add_columns(sort_column)
+        .options(
+            contains_eager(models.Mapping.study),
+            contains_eager(models.Mapping.status)))
+
+    # rows with equal sort values are ordered by id, which makes
+    # (sort value, id) a unique key to resume the listing from
+    key = sa.tuple_(sort_column, models.Mapping.id)
+
+    if params.get('cursor'):
+        cursor = decode_cursor(params['cursor'])
+        if cursor is None:
+            request.response.status = 400
+            return {'errors': ['Invalid cursor']}
+        if descending:
+            query = query.filter(key < sa.tuple_(*cursor))
+        else:
+            query = query.filter(key > sa.tuple_(*cursor))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), models.Mapping.id.desc())
+    else:
+        query = query.order_by(sort_column, models.Mapping.id)
+
+    # Fetch one more row to find out if there is another page
+    page = query.limit(limit + 1).all()
+    more = len(page) > limit
+    page = page[:limit]
 
     data = {}
 
@@ -481,32 +649,113 @@ def mappings(context, request):
     if request.has_permission('delete'):
         data['$deleteUrl'] = request.current_route_path()
 
-    data['rows'] = []
+    data['count'] = count
+    data['variable_count'] = variable_count
+    data['$next'] = None
 
-    for mapping in mappings:
-        row = {}
+    if more:
+        last, sort_value = page[-1]
+        data['$next'] = request.route_path(
+            'imports.mappings.view',
+            _query=dict(params, cursor=encode_cursor([sort_value, last.id])))
 
-        row['target_form'] = mapping.logic['target_schema']
-        row['target_variable'] = mapping.logic['target_variable']
+    # Rows are serialized before the response is sent, while the database
+    # session is still open, and encoded as they are sent
+    rows = [mapping2json(mapping) for mapping, __ in page]
 
-        # imputation mappings may have multiple forms and variables
-        if mapping.type == 'imputation':
-            row['forms'] = mapping.logic['forms']
+    return Response(
+        content_type='application/json',
+        charset='utf-8',
+        app_iter=iter_json(data, rows))
 
-        else:
-            row['study_form'] = mapping.logic['source_schema']
-            row['study_variable'] = mapping.logic['source_variable']
 
-        row['study'] = mapping.study.title
-        row['date_mapped'] = mapping.create_date.date()
-        row['mapped_id'] = mapping.id
+def get_mapping_ids(ids):
+    """
+    Parses the mapping ids of a bulk request
+
+    :ids: list of mapping ids
+
+    :return: the distinct ids, otherwise `None` if they are not valid
+    """
+    if not isinstance(ids, list):
+        return None
+
+    try:
+        return sorted({int(mapping_id) for mapping_id in ids})
+    except (TypeError, ValueError):
+        return None
+
 
-        row['status'] = mapping.status.name
-        row['note'] = mapping.notes
+def get_blame_id(db_session):
+    """Returns the id of the user changes are attributed to"""
 
-        data['rows'].append(row)
+    blame = db_session.info['blame']
 
-    return data
+    if isinstance(blame, datastore.User):
+        return blame.id
+
+    return (
+        db_session.query(datastore.User.id)
+        .filter_by(key=blame)
+        .scalar())
+
+
+def bulk_change(request, ids, change):
+    """
+    Applies a single statement to mappings, only if all of them exist
+
+    :request: the current request
+    :ids: the distinct ids of the mappings to change
+    :change: applies the statement to a query of the mappings, returns the
+             number of rows affected
+
+    :return: the number of mappings changed, otherwise an error response
+             listing the mappings that do not exist
+    """
+    db_session = request.db_session
+
+    if not ids:
+        return {'count': 0}
+
+    query = (
+        db_session.query(models.Mapping)
+        .filter(models.Mapping.id.in_(ids)))
+
+    savepoint = db_session.begin_nested()
+    count = change(query)
+
+    if count == len(ids):
+        savepoint.commit()
+        return {'count': count}
+
+    savepoint.rollback()
+
+    found = {mapping_id for mapping_id, in query.with_entities(
+        models.Mapping.id)}
+    missing = [mapping_id for mapping_id in ids if mapping_id not in found]
+
+    request.response.status = 400
+    return {
+        'error': u'No record found for ids: {}'.format(
+            u', '.join(str(mapping_id) for mapping_id in missing))
+    }
+
+
+def bulk_update(request, ids, values):
+    """
+    Updates mappings with a single statement, only if all of them exist
+    """
+    db_session = request.db_session
+
+    values = dict(
+        values,
+        modify_date=sa.func.now(),
+        modify_user_id=get_blame_id(db_session))
+
+    return bulk_change(
+        request,
+        ids,
+        lambda query: query.update(values, synchronize_session=False))
 
 
 @view_config(
@@ -516,39 +765,89 @@ def mappings(context, request):
     xhr=True,
     renderer='json')
 def delete_mappings(context, request):
+    """
+    Deletes mappings with a single statement
+
+    Mappings are selected either by ``ids`` or, as listed by the mappings
+    page, by ``mapped_delete`` rows marked with ``deleteRow``. No mapping
+    is deleted if any of them does not exist.
+    """
+    check_csrf_token(request)
+
+    if 'mapped_delete' in request.json:
+        ids = [
+            mapping['mappedId']
+            for mapping in request.json['mapped_delete']
+            if mapping['deleteRow'] is True
+        ]
+    else:
+        ids = request.json.get('ids')
+
+    ids = get_mapping_ids(ids)
+
+    if ids is None:
+        request.response.status = 400
+        return {'error': u'Invalid mapping ids'}
+
+    result = bulk_change(
+        request,
+        ids,
+        lambda query: query.delete(synchronize_session=False))
+
+    # The mappings page only expects a result on failure
+    return result if 'error' in result else {}
+
+
+@view_config(
+    route_name='imports.mappings.status',
+    permission='approve',
+    request_method='PUT',
+    xhr=True,
+    renderer='json')
+def bulk_update_status(context, request):
+    """
+    Sets the status of multiple mappings with a single statement
+    """
     check_csrf_token(request)
     db_session = request.db_session
 
-    mappings = request.json['mapped_delete']
+    ids = get_mapping_ids(request.json.get('ids'))
 
-    records = []
+    if ids is None:
+        request.response.status = 400
+        return {'error': u'Invalid mapping ids'}
 
-    # only delete if all records can be deleted
-    for mapping in mappings:
-        if mapping['deleteRow'] is True:
-            try:
-                mapped = db_session.query(models.Mapping).filter(
-                    models.Mapping.id == mapping['mappedId']).one()
+    status = (
+        db_session.query(models.Status)
+        .filter_by(name=request.json.get('status'))
+        .first())
 
-            except NoResultFound:
-                request.response.status = 400
-                return json.dumps(
-                    {'error': 'No record found for id: '.format(
-                        mapping['mappedId'])})
+    if status is None:
+        request.response.status = 400
+        return {'error': u'Invalid status'}
 
-            except MultipleResultsFound:
-                request.response.status = 400
-                return json.dumps(
-                    {'error': 'Multiple records found for id: '.format(
-                        mapping['mappedId'])})
+    return bulk_update(request, ids, {'status_id': status.id})
 
-            else:
-                records.append(mapped)
 
-    for record in records:
-        db_session.delete(record)
+@view_config(
+    route_name='imports.mappings.notes',
+    permission='approve',
+    request_method='PUT',
+    xhr=True,
+    renderer='json')
+def bulk_update_notes(context, request):
+    """
+    Sets the notes of multiple mappings with a single statement
+    """
+    check_csrf_token(request)
 
-    return {}
+    ids = get_mapping_ids(request.json.get('ids'))
+
+    if ids is None:
+        request.response.status = 400
+        return {'error': u'Invalid mapping ids'}
+
+    return bulk_update(request, ids, {'notes': request.json.get('notes')})
 
 
 def convert_logic(db_session, logic):
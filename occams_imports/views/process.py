@@ -6,16 +6,30 @@ import six
 import uuid
 import json
 import datetime
+import hashlib
 from cgi import FieldStorage
+from six.moves import queue
 
-from pyramid.httpexceptions import HTTPOk
+import transaction
+from pyramid.httpexceptions import HTTPConflict, HTTPOk
 from pyramid.view import view_config
 from pyramid.session import check_csrf_token
+from pyramid.settings import asbool
 from sqlalchemy import orm
 
 from occams_studies import models as studies
-from occams_datastore import models as datastore
-from occams_imports import models as models, tasks, log
+from occams_imports import models as models, storage, tasks, log
+from occams_imports.importers.utils import scheduler
+from occams_imports.importers.utils.cache import FrameCache, get_checksum
+from occams_imports.importers.utils.schemata import get_schema_versions
+from occams_imports.importers.utils.pubsub import StatusBroadcaster
+
+
+# Seconds of inactivity after which a comment is sent to status streams
+KEEPALIVE_INTERVAL = 15
+
+JOB_TIMEOUT_SETTING = 'imports.job.timeout'
+DEFAULT_JOB_TIMEOUT = 24 * 60 * 60  # seconds
 
 
 @view_config(
@@ -102,21 +116,14 @@ def upload_add(context, request):
         study = None
 
     schema_name = request.POST.get('schema')
-    try:
+    versions = get_schema_versions(db_session, [schema_name])
+
+    if schema_name in versions:
         # we need the schema with most recent publish date
-        schema = (
-            db_session.query(datastore.Schema)
-            .filter_by(name=schema_name)
-            .order_by(datastore.Schema.publish_date.asc())
-        ).limit(1).one()
-    except orm.exc.MultipleResultsFound:
-        msg = 'Multiple schema found with same publish date found for: {}' \
-            .format(schema)
-        errors.append(msg)
-        study = None
-    except orm.exc.NoResultFound:
-        msg = 'No schema found in the db for: {}'.format(schema)
-        errors.append(msg)
+        schema = versions[schema_name][-1]
+    else:
+        errors.append('No schema found in the db for: {}'.format(schema_name))
+        schema = None
         study = None
 
     upload = request.POST.get('uploadFile')
@@ -124,13 +131,26 @@ def upload_add(context, request):
 
     if isinstance(upload, FieldStorage):
         filename = upload.filename
-        upload_file = upload.file.read()
+        upload_file = upload.file
 
     if study and upload_file and schema:
+        upload_dir = storage.get_upload_dir(request.registry.settings)
+
+        if upload_dir:
+            # Stream into the file store so the file is never fully in memory
+            checksum, size = storage.store(upload_dir, upload_file)
+            project_file = None
+        else:
+            project_file = upload_file.read()
+            checksum = hashlib.sha256(project_file).hexdigest()
+            size = len(project_file)
+
         upload = models.Upload(
             study=study,
             schema=schema,
-            project_file=upload_file,
+            project_file=project_file,
+            checksum=checksum,
+            size=size,
             filename=filename
         )
         db_session.add(upload)
@@ -169,7 +189,37 @@ def upload_delete(context, request):
     db_session = request.db_session
     upload_id = request.matchdict['upload']
 
-    db_session.query(models.Upload).filter_by(id=upload_id).delete()
+    upload = db_session.query(models.Upload).filter_by(id=upload_id).first()
+
+    if upload is None:
+        return HTTPOk()
+
+    checksum = get_checksum(upload)
+    db_session.delete(upload)
+    db_session.flush()
+
+    settings = request.registry.settings
+    upload_dir = storage.get_upload_dir(settings)
+    cache = FrameCache.from_settings(settings)
+
+    # Identical files are only stored once, so only remove the file if no
+    # other upload refers to it and only once the deletion is committed
+    shared = (
+        db_session.query(models.Upload)
+        .filter_by(checksum=checksum)
+        .count()
+    )
+
+    if not shared:
+        def remove_file(success):
+            if not success:
+                return
+            if upload_dir:
+                storage.remove(upload_dir, checksum)
+            if cache:
+                cache.invalidate(checksum)
+
+        transaction.get().addAfterCommitHook(remove_file)
 
     return HTTPOk()
 
@@ -185,16 +235,101 @@ def process(context, request):
     Dispatches mapping pipeline for the target project
     """
 
+    db_session = request.db_session
+    settings = request.registry.settings
+
     source_project_name = request.matchdict['project']
     target_project_name = 'drsc'
+    incremental = asbool(request.params.get('incremental'))
     jobid = six.text_type(str(uuid.uuid4()))
 
-    tasks.apply_mappings.apply_async(
-        args=[jobid, source_project_name, target_project_name],
-        task_id=jobid
+    # Lock the project so that concurrent requests cannot both start a job
+    source_project = (
+        db_session.query(studies.Study)
+        .filter_by(name=source_project_name)
+        .with_for_update()
+        .one()
+    )
+    target_project = (
+        db_session.query(studies.Study)
+        .filter_by(name=target_project_name)
+        .one()
     )
 
-    return HTTPOk()
+    active_job = get_active_job(db_session, source_project, settings)
+
+    if active_job is not None:
+        return HTTPConflict(json={
+            'errors': ['Mappings are already being applied'],
+            'jobid': active_job.name
+        })
+
+    shard_count = scheduler.get_shard_count(settings)
+    distributed = shard_count > 1 and not incremental
+
+    db_session.add(models.Job(
+        name=jobid,
+        study=source_project,
+        target_study=target_project,
+        incremental=incremental,
+        shards=shard_count if distributed else 1
+    ))
+
+    # Only dispatch once the job record is visible to the workers
+    def dispatch(success):
+        if not success:
+            return
+        if distributed:
+            tasks.distribute_mappings(
+                jobid,
+                source_project_name,
+                target_project_name,
+                shard_count
+            ).apply_async()
+        else:
+            tasks.apply_mappings.apply_async(
+                args=[jobid, source_project_name, target_project_name],
+                kwargs={'incremental': incremental},
+                task_id=jobid
+            )
+
+    transaction.get().addAfterCommitHook(dispatch)
+
+    # Allows clients to follow the job's status stream
+    return HTTPOk(json={'jobid': jobid})
+
+
+def get_active_job(db_session, project, settings):
+    """
+    Returns the job currently applying the mappings of a project
+
+    Jobs that have been active for longer than ``imports.job.timeout``
+    seconds (a day by default) are assumed to have been lost, e.g. because
+    their worker was terminated, and no longer block new jobs.
+
+    :param db_session: Application database session
+    :type db_session: sqlalchemy.orm.Session
+    :param project: The source project of the job
+    :type project: occams_studies.models.Study
+    :param settings: Application settings
+    :type settings: dict
+
+    :returns: the active job, otherwise `None`
+    :rtype: occams_imports.models.Job
+    """
+
+    timeout = int(settings.get(JOB_TIMEOUT_SETTING) or DEFAULT_JOB_TIMEOUT)
+    cutoff = datetime.datetime.now() - datetime.timedelta(seconds=timeout)
+
+    query = (
+        db_session.query(models.Job)
+        .filter(models.Job.study == project)
+        .filter(models.Job.status.in_(models.Job.ACTIVE_STATUSES))
+        .filter(models.Job.create_date >= cutoff)
+        .order_by(models.Job.create_date.desc())
+    )
+
+    return query.first()
 
 
 @view_config(
@@ -238,3 +373,84 @@ def status(context, request):
     response.app_iter = listener()
 
     return response
+
+
+def _get_broadcaster(request):
+    """
+    Returns the status broadcaster shared by all requests of this process
+    """
+    registry = request.registry
+    broadcaster = getattr(registry, 'imports_status_broadcaster', None)
+    if broadcaster is None:
+        broadcaster = StatusBroadcaster(request.redis)
+        registry.imports_status_broadcaster = broadcaster
+    return broadcaster
+
+
+@view_config(
+    route_name='imports.job_status',
+    permission='view'
+)
+def job_status(context, request):
+    """
+    Mapping status notifications of a single job
+
+    Yields server-sent events containing the status updates of the job.
+    Clients that reconnect with a ``Last-Event-ID`` header receive the
+    events they have missed first.
+    REQUIRES GUNICORN WITH GEVENT WORKER
+    """
+
+    # Close DB connections so we don't hog them while polling
+    request.db_session.close()
+
+    jobid = request.matchdict['job']
+
+    try:
+        last_event_id = int(
+            request.headers.get('Last-Event-ID') or
+            request.params.get('lastEventId'))
+    except (TypeError, ValueError):
+        last_event_id = None
+
+    broadcaster = _get_broadcaster(request)
+    backlog, listener = broadcaster.subscribe(jobid, last_event_id)
+
+    sse_payload = 'id:{0}\nevent: {1}\ndata:{2}\n\n'
+
+    def listener_iter():
+        last_id = last_event_id
+
+        try:
+            for event in backlog:
+                last_id = event[0]
+                yield sse_payload.format(*event)
+
+            while True:
+                try:
+                    event = listener.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    # Detect disconnected clients
+                    yield ':keepalive\n\n'
+                    continue
+
+                # Fell too far behind, the client will reconnect and resume
+                if event is None:
+                    return
+
+                # Events sent while subscribing may also be in the backlog
+                if last_id is not None and event[0] <= last_id:
+                    continue
+
+                last_id = event[0]
+                yield sse_payload.format(*event)
+        finally:
+            broadcaster.unsubscribe(jobid, listener)
+
+    response = request.response
+    response.content_type = 'text/event-stream'
+    response.cache_control = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Tell NGINX not to buffer
+    response.app_iter = listener_iter()
+
+    return response
@@ -229,6 +229,27 @@ def req(db_session):
     return dummy_request
 
 
+@pytest.yield_fixture
+def redis(req):
+    """
+    (Integration Testing) Attaches a redis connection to the dummy request
+
+    The testing database is emptied once the test is done.
+
+    :param req: The dummy request
+
+    :returns: the redis connection
+    """
+    from redis import StrictRedis
+
+    connection = StrictRedis.from_url(REDIS_URL)
+    req.redis = connection
+
+    yield connection
+
+    connection.flushdb()
+
+
 @pytest.fixture(scope='session')
 def wsgi(request):
     """
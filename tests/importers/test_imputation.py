@@ -336,7 +336,8 @@ def test_apply_mapping_with_target_choice(
     })
 
     module._get_attribute = mock.Mock(return_value=target_attribute)
-    module._compile_imputation = mock.Mock(return_value=lambda r: r['source'])
+    module._compile_vectorized_imputation = mock.Mock(
+        return_value=lambda f: f['source'])
 
     frame = pd.DataFrame({'source': [1]})
     redis = None
@@ -353,7 +354,7 @@ def test_apply_mapping_with_target_choice(
         target_project_name
     )
 
-    module._compile_imputation.assert_called_with(
+    module._compile_vectorized_imputation.assert_called_with(
         source_project_name,
         operator,
         '_'.join([
@@ -393,7 +394,8 @@ def test_apply_mapping_with_computed_scalar(
     })
 
     module._get_attribute = mock.Mock(return_value=target_attribute)
-    module._compile_imputation = mock.Mock(return_value=lambda r: r['source'])
+    module._compile_vectorized_imputation = mock.Mock(
+        return_value=lambda f: f['source'])
 
     frame = pd.DataFrame({'source': [1]})
     redis = None
@@ -411,11 +413,135 @@ def test_apply_mapping_with_computed_scalar(
         target_project_name
     )
 
-    module._compile_imputation.assert_called_with(
+    module._compile_vectorized_imputation.assert_called_with(
         mapping.study.name,
         'ID',
         '_'.join([
             target_project_name, target_schema.name, target_attribute.name]),
         None,
-        group_1
+        [group_1]
     )
+
+
+def _variable_conversion(name, operator=None):
+    conversion = {
+        'byVariable': True,
+        'value': {
+            'schema': {'name': 'some_schema'},
+            'attribute': {'name': name}
+        }
+    }
+    if operator:
+        conversion['operator'] = operator
+    return conversion
+
+
+@pytest.mark.parametrize('condition', ['ANY', 'ALL'])
+def test_compile_vectorized_imputation_matches_row_wise(condition):
+    """
+    It should generate the same column as the row-by-row imputation
+    """
+
+    import pandas as pd
+    import numpy as np
+    from occams_imports.importers.imputation import \
+        _compile_imputation, _compile_vectorized_imputation
+
+    project_name = 'some_project'
+    groups = [
+        {
+            'conversions': [_variable_conversion('foo')],
+            'logic': {
+                'operator': 'ANY',
+                'imputations': [
+                    {'operator': 'EQ', 'value': 1},
+                    {'operator': 'GT', 'value': 5},
+                ]
+            }
+        },
+        {
+            'conversions': [
+                _variable_conversion('foo'),
+                _variable_conversion('bar', operator='ADD'),
+            ],
+            'logic': {
+                'operator': 'ALL',
+                'imputations': [{'operator': 'LT', 'value': 10}]
+            }
+        },
+    ]
+
+    frame = pd.DataFrame({
+        project_name + '_some_schema_foo': [1, 2, 6, np.nan, 1, 2],
+        project_name + '_some_schema_bar': [1, 3, 8, 1, np.nan, np.nan],
+    })
+
+    args = (project_name, condition, 'target', '003', groups)
+    expected = frame.apply(_compile_imputation(*args), axis=1)
+    result = _compile_vectorized_imputation(*args)(frame)
+
+    assert result.fillna('').tolist() == expected.fillna('').tolist()
+
+
+def test_compile_vectorized_imputation_computed():
+    """
+    It should compute a value only for rows that have all operands
+    """
+
+    import pandas as pd
+    import numpy as np
+    from occams_imports.importers.imputation import \
+        _compile_vectorized_imputation
+
+    project_name = 'some_project'
+    groups = [{
+        'conversions': [
+            _variable_conversion('foo'),
+            {'byValue': True, 'value': 2, 'operator': 'MUL'}
+        ]
+    }]
+
+    frame = pd.DataFrame({
+        project_name + '_some_schema_foo': [1, np.nan, 3],
+    })
+
+    imputation = _compile_vectorized_imputation(
+        project_name, 'ID', 'target', None, groups)
+    result = imputation(frame)
+
+    assert result[0] == 2
+    assert np.isnan(result[1])
+    assert result[2] == 6
+
+
+def test_compile_vectorized_imputation_keeps_existing():
+    """
+    It should not overwrite values already computed in the target column
+    """
+
+    import pandas as pd
+    import numpy as np
+    from occams_imports.importers.imputation import \
+        _compile_vectorized_imputation
+
+    project_name = 'some_project'
+    groups = [{
+        'conversions': [_variable_conversion('foo')],
+        'logic': {
+            'operator': 'ALL',
+            'imputations': [{'operator': 'EQ', 'value': 1}]
+        }
+    }]
+
+    frame = pd.DataFrame({
+        project_name + '_some_schema_foo': [1, 0, 0],
+        'target': ['001', '002', np.nan],
+    })
+
+    imputation = _compile_vectorized_imputation(
+        project_name, 'ALL', 'target', '003', groups)
+    result = imputation(frame)
+
+    assert result[0] == '001'
+    assert result[1] == '002'
+    assert pd.isnull(result[2])
@@ -0,0 +1,142 @@
+import pytest
+
+
+@pytest.fixture
+def upload():
+    import datetime
+    import mock
+
+    attribute = mock.Mock(type='number')
+    attribute.name = 'foo'
+
+    schema = mock.Mock(id=1, publish_date=datetime.date(2017, 1, 1))
+    schema.name = 'some_schema'
+    schema.iterleafs.return_value = [attribute]
+
+    study = mock.Mock()
+    study.name = 'some_project'
+
+    return mock.Mock(
+        checksum='abc123', project_file=None, schema=schema, study=study)
+
+
+def test_get_put(tmpdir, upload):
+    """
+    It should return previously stored frames
+    """
+
+    import pandas as pd
+    from occams_imports.importers.utils.cache import FrameCache
+
+    cache = FrameCache(str(tmpdir))
+    key = cache.make_key(upload, 'pid', 'visit', 'collect_date')
+
+    assert cache.get(key) is None
+
+    frame = pd.DataFrame({'pid': ['P1'], 'foo': pd.Categorical(['001'])})
+    cache.put(key, frame)
+
+    cached = cache.get(key)
+    assert cached['pid'].tolist() == ['P1']
+    assert cached['foo'].dtype.name == 'category'
+
+
+def test_key_schema_change(tmpdir, upload):
+    """
+    It should generate a different key when the schema parsing changes
+    """
+
+    import mock
+    from occams_imports.importers.utils.cache import FrameCache
+
+    cache = FrameCache(str(tmpdir))
+    key = cache.make_key(upload)
+
+    attribute = mock.Mock(type='date')
+    attribute.name = 'foo'
+    upload.schema.iterleafs.return_value = [attribute]
+
+    assert cache.make_key(upload) != key
+
+
+def test_key_legacy_upload(tmpdir, upload):
+    """
+    It should hash the contents of uploads without a checksum
+    """
+
+    import hashlib
+    from occams_imports.importers.utils.cache import FrameCache
+
+    upload.checksum = None
+    upload.project_file = b'foo'
+
+    cache = FrameCache(str(tmpdir))
+    key = cache.make_key(upload)
+
+    assert key.startswith(hashlib.sha256(b'foo').hexdigest() + '-')
+
+
+def test_invalidate(tmpdir, upload):
+    """
+    It should remove every cached frame of a file
+    """
+
+    import pandas as pd
+    from occams_imports.importers.utils.cache import FrameCache
+
+    cache = FrameCache(str(tmpdir))
+    key = cache.make_key(upload)
+    cache.put(key, pd.DataFrame({'pid': ['P1']}))
+
+    cache.invalidate(upload.checksum)
+
+    assert cache.get(key) is None
+
+
+def test_evict(tmpdir):
+    """
+    It should evict the least-recently used frames past the size limit
+    """
+
+    import os
+    import pandas as pd
+    from occams_imports.importers.utils.cache import FrameCache
+
+    cache = FrameCache(str(tmpdir), max_size=0)
+    cache.put('a-1', pd.DataFrame({'pid': ['P1']}))
+
+    assert cache.get('a-1') is None
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_get_corrupt(tmpdir, upload):
+    """
+    It should discard entries that cannot be read
+    """
+
+    import os
+    import pandas as pd
+    from occams_imports.importers.utils.cache import FrameCache
+
+    cache = FrameCache(str(tmpdir))
+    key = cache.make_key(upload)
+    cache.put(key, pd.DataFrame({'pid': ['P1']}))
+
+    path = str(tmpdir.join(key + '.pickle'))
+
+    with open(path, 'rb') as fp:
+        data = fp.read()
+
+    # Partially written entry
+    with open(path, 'wb') as fp:
+        fp.write(data[:len(data) // 2])
+
+    assert cache.get(key) is None
+    assert not os.path.exists(path)
+
+    # Not a pickle at all
+    with open(path, 'wb') as fp:
+        fp.write(b'garbage')
+
+    assert cache.get(key) is None
+    assert not os.path.exists(path)
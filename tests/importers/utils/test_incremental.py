@@ -0,0 +1,98 @@
+import pytest
+
+
+def _mapping(id_, target_schema, source_schema, status='approved'):
+    import mock
+
+    mapping = mock.Mock(id=id_, type='direct', logic={
+        'target_schema': target_schema,
+        'target_variable': 'foo',
+        'source_schema': source_schema,
+        'source_variable': 'bar',
+    })
+    mapping.status.name = status
+    return mapping
+
+
+def test_group_by_target_schema():
+    """
+    It should group mappings by target schema retaining their order
+    """
+
+    from occams_imports.importers.utils.incremental import \
+        group_by_target_schema
+
+    m1 = _mapping(1, 'a', 'x')
+    m2 = _mapping(2, 'b', 'x')
+    m3 = _mapping(3, 'a', 'y')
+
+    groups = group_by_target_schema([m1, m2, m3])
+
+    assert list(groups.keys()) == ['a', 'b']
+    assert groups['a'] == [m1, m3]
+    assert groups['b'] == [m2]
+
+
+@pytest.mark.parametrize('change', ['logic', 'status', 'inputs'])
+def test_fingerprint_changes(change):
+    """
+    It should generate a new fingerprint if the logic, status or inputs change
+    """
+
+    from occams_imports.importers.utils.incremental import fingerprint
+
+    mapping = _mapping(1, 'a', 'x')
+    input_keys = {'x': ['key1']}
+    original = fingerprint([mapping], input_keys)
+
+    assert fingerprint([mapping], {'x': ['key1']}) == original
+
+    if change == 'logic':
+        mapping.logic['source_variable'] = 'baz'
+    elif change == 'status':
+        mapping.status.name = 'rejected'
+    elif change == 'inputs':
+        input_keys = {'x': ['key2']}
+
+    assert fingerprint([mapping], input_keys) != original
+
+
+def test_fingerprint_ignores_unrelated_inputs():
+    """
+    It should only depend on the uploads the mappings read from
+    """
+
+    from occams_imports.importers.utils.incremental import fingerprint
+
+    mapping = _mapping(1, 'a', 'x')
+
+    assert fingerprint([mapping], {'x': ['key1'], 'y': ['key2']}) == \
+        fingerprint([mapping], {'x': ['key1'], 'y': ['key3']})
+
+
+def test_get_changed_pids():
+    """
+    It should only report patients with differing values
+    """
+
+    import numpy as np
+    import pandas as pd
+    from occams_imports.importers.utils.incremental import get_changed_pids
+
+    keys = ['pid', 'visit']
+
+    previous = pd.DataFrame({
+        'pid': ['P1', 'P2', 'P3', 'P4'],
+        'visit': ['wk1', 'wk1', 'wk1', 'wk1'],
+        'foo': [1, np.nan, 3, 4],
+    })
+
+    current = pd.DataFrame({
+        'pid': ['P1', 'P2', 'P3', 'P5'],
+        'visit': ['wk1', 'wk1', 'wk1', 'wk1'],
+        'foo': [1, np.nan, 5, 6],
+    })
+
+    pids = get_changed_pids(previous, current, keys, 'pid')
+
+    assert pids == {'P3', 'P4', 'P5'}
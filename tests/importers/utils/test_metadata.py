@@ -0,0 +1,158 @@
+import pytest
+
+
+def test_get_schema_names():
+    """
+    It should collect the schemata mappers look up metadata for
+    """
+
+    import mock
+    from occams_imports.importers.utils.metadata import get_schema_names
+
+    direct = mock.Mock(type='direct', logic={
+        'source_schema': 'source_form',
+        'target_schema': 'target_a',
+    })
+    imputation = mock.Mock(type='imputation', logic={
+        'target_schema': 'target_b',
+        'forms': [['other_form', 'other_form']],
+    })
+
+    names = get_schema_names([direct, imputation])
+
+    assert names == {'source_form', 'target_a', 'target_b'}
+
+
+def test_metadata_snapshot(db_session):
+    """
+    It should look up the latest attributes and choices of every version
+    """
+
+    from datetime import date
+
+    from sqlalchemy import orm
+    from occams_datastore import models as datastore
+    from occams_imports.importers.utils.metadata import MetadataSnapshot
+
+    def choice(name, title):
+        return datastore.Choice(name=name, title=title, order=int(name))
+
+    latest = datastore.Schema(
+        name=u'demographics',
+        title=u'demographics',
+        publish_date=date(2016, 1, 1),
+        attributes={
+            'question': datastore.Attribute(
+                name=u'question',
+                title=u'question',
+                type=u'choice',
+                order=0,
+                choices={
+                    u'0': choice(u'0', u'usually'),
+                })})
+
+    db_session.add_all([
+        datastore.Schema(
+            name=u'demographics',
+            title=u'demographics',
+            publish_date=date(2015, 1, 1),
+            attributes={
+                'question': datastore.Attribute(
+                    name=u'question',
+                    title=u'question',
+                    type=u'choice',
+                    order=0,
+                    choices={
+                        u'0': choice(u'0', u'always'),
+                        u'1': choice(u'1', u'never'),
+                    })}),
+        latest,
+        datastore.Schema(
+            name=u'ucsd_demographics',
+            title=u'ucsd_demographics',
+            publish_date=date(2015, 1, 1),
+            attributes={
+                'ucsd_question': datastore.Attribute(
+                    name=u'ucsd_question',
+                    title=u'ucsd_question',
+                    type=u'string',
+                    order=0)}),
+    ])
+    db_session.flush()
+
+    metadata = MetadataSnapshot.load(
+        db_session, ['demographics', 'ucsd_demographics'])
+
+    assert metadata.is_choice('demographics', 'question')
+    assert not metadata.is_choice('ucsd_demographics', 'ucsd_question')
+
+    attribute = metadata.get_attribute('demographics', 'question')
+    assert attribute.schema_id == latest.id
+
+    choices = metadata.get_choices('demographics', 'question')
+    assert {c.name: c.title for c in choices} == \
+        {u'0': u'usually', u'1': u'never'}
+
+    with pytest.raises(orm.exc.NoResultFound):
+        metadata.get_attribute('demographics', 'missing')
+
+
+def test_metadata_snapshot_populate(
+        db_session,
+        study_factory,
+        schema_factory,
+        site_factory):
+    """
+    It should leave the session's attributes intact for populating entities
+    """
+
+    import pandas as pd
+
+    from occams_datastore import models as datastore
+    from occams_studies import models as studies
+    from occams_imports.importers.utils.metadata import MetadataSnapshot
+    from occams_imports.importers.utils.pivot import populate_project
+
+    target_project = study_factory()
+    site_factory(name=target_project.name)
+
+    target_schema = schema_factory.create(
+        attributes={
+            'gender': datastore.Attribute(
+                name=u'gender',
+                title=u'gender',
+                type=u'choice',
+                order=0,
+                choices={
+                    u'0': datastore.Choice(
+                        name=u'0', title=u'male', order=0),
+                    u'1': datastore.Choice(
+                        name=u'1', title=u'female', order=1),
+                })})
+
+    target_project.schemata.add(target_schema)
+    db_session.flush()
+
+    # Attributes are reloaded by the snapshot, as in a worker's session
+    db_session.expire_all()
+
+    metadata = MetadataSnapshot.load(db_session, [target_schema.name])
+
+    assert metadata.is_choice(target_schema.name, 'gender')
+
+    prefix = '{}_{}_'.format(target_project.name, target_schema.name)
+
+    populate_project(
+        db_session,
+        target_project.name,
+        pd.DataFrame({
+            'pid': ['P1'],
+            'visit': ['week1'],
+            prefix + 'gender': ['1'],
+            prefix + 'collect_date': ['2017-01-01'],
+        })
+    )
+
+    patient = db_session.query(studies.Patient).filter_by(pid='P1').one()
+
+    assert [e['gender'] for e in patient.entities] == [u'1']
@@ -86,6 +86,7 @@ def test_dummy(
 
 
 def test_populate_project(
+        monkeypatch,
         db_session,
         study_factory,
         schema_factory,
@@ -93,6 +94,7 @@ def test_populate_project(
         attribute_factory,
         site_factory):
 
+    import mock
     import pandas as pd
     import numpy as np
 
@@ -137,6 +139,13 @@ def test_populate_project(
 
     consolidated_frame = pd.DataFrame(data_dict)
 
+    # Schemata without files are inserted in bulk, bypassing the forms
+    # application and its upload directories
+    for name in ('apply_data', 'tempfile.mkdtemp'):
+        monkeypatch.setattr(
+            'occams_imports.importers.utils.pivot.' + name,
+            mock.Mock(side_effect=AssertionError(name + ' called')))
+
     populate_project(
         db_session,
         target_project.name,
@@ -164,14 +173,205 @@ def test_populate_project(
     assert len(patient1.entities) == 1
     for entity in patient1.entities:
         assert entity['gender'] == 0
-        assert entity['collect_date'] == '2017-01-01'
+        assert pd.Timestamp(entity['collect_date']) == \
+            pd.Timestamp('2017-01-01')
 
     assert len(patient2.entities) == 1
     for entity in patient2.entities:
         assert entity['gender'] == 1
-        assert entity['collect_date'] == '2017-01-02'
+        assert pd.Timestamp(entity['collect_date']) == \
+            pd.Timestamp('2017-01-02')
 
     assert len(patient3.entities) == 1
     for entity in patient3.entities:
         assert entity['gender'] is None
-        assert entity['collect_date'] == '2017-01-01'
+        assert pd.Timestamp(entity['collect_date']) == \
+            pd.Timestamp('2017-01-01')
+
+
+def test_populate_project_new_patients(
+        db_session,
+        study_factory,
+        schema_factory,
+        attribute_factory,
+        site_factory):
+    """
+    It should create missing patients and skip rows without schema data
+    """
+
+    import pandas as pd
+    import numpy as np
+
+    from occams_studies import models as studies
+    from occams_imports.importers.utils.pivot import populate_project
+
+    target_project = study_factory()
+    site_factory(name=target_project.name)
+
+    target_schema = schema_factory.create(
+        attributes={
+            'gender': attribute_factory.create(name='gender', type='number'),
+        }
+    )
+
+    target_project.schemata.add(target_schema)
+
+    target_gender = '{}_{}_gender'.format(
+        target_project.name, target_schema.name)
+    target_collect_date = '{}_{}_collect_date'.format(
+        target_project.name, target_schema.name)
+
+    consolidated_frame = pd.DataFrame({
+        'pid': ['new-1', 'new-1', 'new-2'],
+        'visit': ['week1', 'week2', 'week1'],
+        target_gender: [0, 1, np.nan],
+        target_collect_date: ['2017-01-01', '2017-01-02', '2017-01-03'],
+    })
+
+    populate_project(
+        db_session,
+        target_project.name,
+        consolidated_frame,
+        batch_size=1
+    )
+
+    patient1 = db_session.query(studies.Patient).filter_by(pid='new-1').one()
+    patient2 = db_session.query(studies.Patient).filter_by(pid='new-2').one()
+
+    assert sorted(e['gender'] for e in patient1.entities) == [0, 1]
+    assert len(patient2.entities) == 0
+
+
+def test_load_schema_frame_types(
+        db_session,
+        study_factory,
+        schema_factory,
+        attribute_factory):
+    """
+    It should parse columns according to the codebook attribute types
+    """
+
+    import io
+    from occams_imports.importers.utils.pivot import load_schema_frame
+
+    study = study_factory()
+    schema = schema_factory.create(
+        attributes={
+            'foo': attribute_factory.create(name='foo', type='string'),
+            'bar': attribute_factory.create(name='bar', type='number'),
+            'baz': attribute_factory.create(name='baz', type='date'),
+            'caz': attribute_factory.create(name='caz', type='choice'),
+            'daz': attribute_factory.create(name='daz', type='number'),
+        }
+    )
+    db_session.flush()
+
+    buffer_ = io.BytesIO(
+        b'pid,visit,collect_date,foo,bar,baz,caz,extra\n'
+        b'P1,wk1,2017-01-01,hello,12,2016-05-01,001,ignored\n'
+        b'P2,wk1,2017-01-02,world,junk,notadate,002,ignored\n'
+    )
+
+    frame = load_schema_frame(study, schema, buffer_)
+
+    def column(name):
+        return '_'.join([study.name, schema.name, name])
+
+    assert 'extra' not in frame
+    assert frame[column('collect_date')].dtype.kind == 'M'
+    assert frame[column('bar')].tolist()[0] == 12
+    assert frame[column('bar')].isnull().tolist() == [False, True]
+    assert frame[column('baz')].isnull().tolist() == [False, True]
+    assert frame[column('caz')].dtype.name == 'category'
+    assert frame[column('caz')].tolist() == ['001', '002']
+    assert frame[column('daz')].isnull().all()
+
+
+def test_load_schema_frame_shard(
+        db_session,
+        study_factory,
+        schema_factory,
+        attribute_factory):
+    """
+    It should only keep the rows of a shard's patients while reading
+    """
+
+    import io
+    import mock
+    from occams_imports.importers.utils.pivot import load_schema_frame
+
+    study = study_factory()
+    schema = schema_factory.create(
+        attributes={
+            'bar': attribute_factory.create(name='bar', type='number'),
+        }
+    )
+    db_session.flush()
+
+    contents = (
+        b'pid,visit,collect_date,bar\n' +
+        b''.join(
+            u'P{0},wk1,2017-01-0{0},{0}\n'.format(i).encode('utf-8')
+            for i in range(1, 7))
+    )
+
+    # Read the file a few rows at a time
+    with mock.patch(
+            'occams_imports.importers.utils.pivot.READ_CHUNK_SIZE', 2):
+        shards = [
+            load_schema_frame(
+                study, schema, io.BytesIO(contents), shard=(shard, 2))
+            for shard in range(2)
+        ]
+
+    frame = load_schema_frame(study, schema, io.BytesIO(contents))
+
+    assert sorted(shards[0]['pid'].tolist()) == ['P4', 'P5', 'P6']
+    assert sorted(shards[1]['pid'].tolist()) == ['P1', 'P2', 'P3']
+    assert shards[0].dtypes.tolist() == frame.dtypes.tolist()
+
+
+def test_join_frames():
+    """
+    It should outer join all frames on the key columns at once
+    """
+
+    import pandas as pd
+    from occams_imports.importers.utils.pivot import join_frames
+
+    frame_a = pd.DataFrame({
+        'pid': ['P1', 'P2'], 'visit': ['wk1', 'wk1'], 'a': [1, 2]})
+    frame_b = pd.DataFrame({
+        'pid': ['P2', 'P3'], 'visit': ['wk1', 'wk2'], 'b': [3, 4]})
+    frame_c = pd.DataFrame({
+        'pid': ['P1', 'P1'], 'visit': ['wk1', 'wk1'], 'c': [5, 6]})
+
+    frame = join_frames([frame_a, frame_b, frame_c], ['pid', 'visit'])
+
+    assert set(frame.columns) == {'pid', 'visit', 'a', 'b', 'c'}
+    assert len(frame) == 4
+
+    p2 = frame[frame['pid'] == 'P2'].iloc[0]
+    assert p2['a'] == 2
+    assert p2['b'] == 3
+
+    # Duplicate keys retain the merge semantics
+    assert sorted(frame[frame['pid'] == 'P1']['c'].tolist()) == [5, 6]
+
+
+def test_get_shards():
+    """
+    It should assign each PID to a single, stable shard
+    """
+
+    import pandas as pd
+    from occams_imports.importers.utils.pivot import get_shards
+
+    pids = pd.Series(['P%03d' % i for i in range(100)] + ['P001'])
+
+    shards = get_shards(pids, 4)
+
+    assert set(shards.unique()) <= {0, 1, 2, 3}
+    assert len(shards.unique()) > 1
+    assert shards.iloc[1] == shards.iloc[-1]
+    assert get_shards(pids, 4).tolist() == shards.tolist()
@@ -0,0 +1,102 @@
+import pytest
+
+
+def test_phase():
+    """
+    It should measure and publish each phase, accumulating repeated phases
+    """
+
+    import mock
+    from occams_imports.importers.utils.profiling import Profiler
+
+    channel = mock.Mock()
+    profiler = Profiler('job-1', channel)
+
+    with profiler.phase('load') as details:
+        details['frame'] = {'rows': 2, 'columns': 3, 'bytes': 48}
+
+    with profiler.phase('truncate'):
+        pass
+
+    with profiler.phase('truncate'):
+        pass
+
+    summary = profiler.summary()
+
+    assert set(summary['phases']) == {'load', 'truncate'}
+    assert summary['phases']['load']['frame']['rows'] == 2
+    assert summary['phases']['load']['wall'] >= 0
+    assert summary['phases']['load']['cpu'] >= 0
+    assert set(profiler.timings()) == {'load', 'truncate'}
+    assert channel.send_timing.call_count == 3
+    assert channel.send_timing.call_args[1] == {'phase': 'truncate'}
+
+
+def test_phase_failed():
+    """
+    It should still measure phases that raise
+    """
+
+    from occams_imports.importers.utils.profiling import Profiler
+
+    profiler = Profiler()
+
+    with pytest.raises(ValueError):
+        with profiler.phase('map'):
+            raise ValueError
+
+    assert 'map' in profiler.timings()
+
+
+def test_mapping():
+    """
+    It should measure each mapping by its id
+    """
+
+    import mock
+    from occams_imports.importers.utils.profiling import Profiler
+
+    channel = mock.Mock()
+    profiler = Profiler('job-1', channel)
+
+    with profiler.mapping(mock.Mock(id=7)):
+        pass
+
+    assert list(profiler.summary()['mappings']) == ['7']
+    channel.send_timing.assert_called_once_with(mock.ANY, mapping=7)
+
+
+def test_profile_dir(tmpdir):
+    """
+    It should write cProfile statistics of each phase when configured
+    """
+
+    import pstats
+    from occams_imports.importers.utils.profiling import Profiler
+
+    profiler = Profiler.from_settings(
+        {'imports.profile.dir': str(tmpdir)}, 'job-1')
+
+    with profiler.phase('load'):
+        sorted(range(1000))
+
+    path = tmpdir.join('job-1-load.prof')
+    assert path.check()
+    assert pstats.Stats(str(path)).total_calls > 0
+
+
+def test_describe_frame():
+    """
+    It should report the size of a frame
+    """
+
+    import pandas as pd
+    from occams_imports.importers.utils.profiling import describe_frame
+
+    frame = pd.DataFrame({'a': [1, 2], 'b': [3.0, 4.0]})
+
+    description = describe_frame(frame)
+
+    assert description['rows'] == 2
+    assert description['columns'] == 2
+    assert description['bytes'] > 0
@@ -0,0 +1,262 @@
+import json
+
+
+def _mapping():
+    import mock
+
+    return mock.Mock(logic={
+        'target_schema': 'target_form',
+        'target_variable': 'foo',
+    })
+
+
+def _published(redis):
+    return [
+        json.loads(c[0][1])
+        for c in redis.pipeline.return_value.publish.call_args_list
+    ]
+
+
+def test_send_message_jobid():
+    """
+    It should stamp events with the job id
+    """
+
+    import mock
+    from occams_imports.importers.utils.pubsub import ImportStatusChannel
+
+    redis = mock.Mock()
+    redis.incrby.return_value = 1
+    channel = ImportStatusChannel(redis, 'job-1')
+
+    channel.send_message(_mapping(), 'Mapping complete')
+
+    event, = _published(redis)
+    assert event['jobid'] == 'job-1'
+    assert event['event'] == 'message'
+    assert event['schema'] == 'target_form'
+
+
+def test_send_numbered():
+    """
+    It should number events with the job's shared counter and log them
+    """
+
+    import mock
+    from occams_imports.importers.utils.pubsub import \
+        ImportStatusChannel, get_log_key, get_sequence_key
+
+    redis = mock.Mock()
+    pipeline = redis.pipeline.return_value
+
+    # Another worker of the job already sent 6 events
+    redis.incrby.return_value = 7
+    channel = ImportStatusChannel(redis, 'job-1', log_size=100)
+
+    channel.send_error({'name': u'1_invalid'})
+
+    redis.incrby.assert_called_once_with(get_sequence_key('job-1'), 1)
+    event, = _published(redis)
+    assert event['id'] == 7
+    pipeline.rpush.assert_called_once_with(
+        get_log_key('job-1'), json.dumps(event))
+    pipeline.ltrim.assert_called_once_with(get_log_key('job-1'), -100, -1)
+
+
+def test_buffered_coalesces_progress():
+    """
+    It should send buffered events in a single pipeline once the buffer fills
+    """
+
+    import mock
+    from occams_imports.importers.utils.pubsub import \
+        BufferedImportStatusChannel
+
+    redis = mock.Mock()
+    pipeline = redis.pipeline.return_value
+    pipeline.execute.side_effect = [[3, 2, '10'], []]
+
+    channel = BufferedImportStatusChannel(
+        redis, 'job-1', flush_interval=3600, flush_size=4)
+
+    channel.send_progress()
+    channel.send_message(_mapping(), 'Mapping complete')
+    channel.send_progress()
+
+    assert not pipeline.execute.called
+
+    channel.send_message(_mapping(), 'Mapping complete')
+
+    assert pipeline.execute.call_count == 2
+    pipeline.hincrby.assert_called_once_with('job-1', 'count', 2)
+
+    events = _published(redis)
+    assert [e['event'] for e in events] == ['message', 'message', 'progress']
+    assert [e['id'] for e in events] == [1, 2, 3]
+    assert events[2] == {
+        'event': 'progress', 'jobid': 'job-1', 'count': 2, 'total': 10,
+        'id': 3}
+
+
+def test_buffered_flush():
+    """
+    It should send the remaining events when flushed
+    """
+
+    import mock
+    from occams_imports.importers.utils.pubsub import \
+        BufferedImportStatusChannel
+
+    redis = mock.Mock()
+    pipeline = redis.pipeline.return_value
+    pipeline.execute.side_effect = [[1], []]
+
+    with BufferedImportStatusChannel(
+            redis, 'job-1', flush_interval=3600, flush_size=100) as channel:
+        channel.send_message(_mapping(), 'Not in approved state')
+        assert not pipeline.execute.called
+
+    assert pipeline.execute.call_count == 2
+    assert not pipeline.hincrby.called
+
+    channel.flush()
+
+    assert pipeline.execute.call_count == 2
+
+
+def test_buffered_flush_timer():
+    """
+    It should send buffered events once the interval passes, even if no
+    other event follows
+    """
+
+    import time
+
+    import mock
+    from occams_imports.importers.utils.pubsub import \
+        BufferedImportStatusChannel
+
+    redis = mock.Mock()
+    pipeline = redis.pipeline.return_value
+    pipeline.execute.side_effect = [[1, 1, '10'], []]
+
+    channel = BufferedImportStatusChannel(
+        redis, 'job-1', flush_interval=0.05, flush_size=100)
+
+    channel.send_progress()
+    assert not pipeline.execute.called
+
+    deadline = time.time() + 5
+    while pipeline.execute.call_count < 2 and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert pipeline.execute.call_count == 2
+    assert [e['event'] for e in _published(redis)] == ['progress']
+
+
+def test_buffered_errors():
+    """
+    It should buffer error events and progress increments of any size
+    """
+
+    import mock
+    from occams_imports.importers.utils.pubsub import \
+        BufferedImportStatusChannel
+
+    redis = mock.Mock()
+    pipeline = redis.pipeline.return_value
+    pipeline.execute.side_effect = [[2, 1000, '5000'], []]
+
+    with BufferedImportStatusChannel(
+            redis, 'job-1', flush_interval=3600, flush_size=10000) as channel:
+        channel.send_error({'name': u'1_invalid'})
+        channel.send_progress(1000)
+
+    pipeline.hincrby.assert_called_once_with('job-1', 'count', 1000)
+
+    events = _published(redis)
+    assert [e['event'] for e in events] == ['error', 'progress']
+    assert events[0]['error'] == {'name': u'1_invalid'}
+
+
+def _event(number, event='progress', jobid='job-1'):
+    return json.dumps({'id': number, 'event': event, 'jobid': jobid})
+
+
+def test_broadcaster_fan_out():
+    """
+    It should only deliver a job's events to the listeners of that job
+    """
+
+    import mock
+    from occams_imports.importers.utils.pubsub import StatusBroadcaster
+
+    redis = mock.Mock()
+    redis.lrange.return_value = []
+    broadcaster = StatusBroadcaster(redis)
+    broadcaster._start = mock.Mock()
+
+    __, listener1 = broadcaster.subscribe('job-1')
+    __, listener2 = broadcaster.subscribe('job-1')
+    __, other = broadcaster.subscribe('job-2')
+
+    broadcaster.dispatch(_event(1))
+
+    assert listener1.get_nowait()[:2] == (1, 'progress')
+    assert listener2.get_nowait()[:2] == (1, 'progress')
+    assert other.empty()
+
+    broadcaster.unsubscribe('job-1', listener2)
+    broadcaster.dispatch(_event(2, 'message'))
+
+    assert listener1.get_nowait()[:2] == (2, 'message')
+    assert listener2.empty()
+
+
+def test_broadcaster_replay():
+    """
+    It should replay the logged events a reconnecting listener has missed,
+    in whichever process it reconnects to
+    """
+
+    import mock
+    from occams_imports.importers.utils.pubsub import \
+        StatusBroadcaster, get_log_key
+
+    redis = mock.Mock()
+    redis.lrange.return_value = [
+        _event(n).encode('utf-8') for n in [3, 5, 4]]
+
+    for __ in range(2):
+        broadcaster = StatusBroadcaster(redis)
+        broadcaster._start = mock.Mock()
+
+        backlog, __ = broadcaster.subscribe('job-1')
+        assert [e[0] for e in backlog] == [3, 4, 5]
+
+        backlog, __ = broadcaster.subscribe('job-1', last_event_id=4)
+        assert [e[0] for e in backlog] == [5]
+
+    redis.lrange.assert_called_with(get_log_key('job-1'), 0, -1)
+
+
+def test_broadcaster_drops_slow_listeners():
+    """
+    It should disconnect listeners that fall too far behind
+    """
+
+    import mock
+    from occams_imports.importers.utils.pubsub import StatusBroadcaster
+
+    redis = mock.Mock()
+    redis.lrange.return_value = []
+    broadcaster = StatusBroadcaster(redis, queue_size=2)
+    broadcaster._start = mock.Mock()
+
+    __, listener = broadcaster.subscribe('job-1')
+
+    for number in range(1, 4):
+        broadcaster.dispatch(_event(number))
+
+    assert listener.get_nowait()[0] == 2
+    assert listener.get_nowait() is None
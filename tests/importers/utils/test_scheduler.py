@@ -0,0 +1,88 @@
+import pytest
+
+
+def _direct(id_, target_schema, target_variable, source_variable):
+    import mock
+
+    return mock.Mock(id=id_, type='direct', logic={
+        'source_schema': 'source_form',
+        'source_variable': source_variable,
+        'target_schema': target_schema,
+        'target_variable': target_variable,
+    })
+
+
+def test_plan_independent():
+    """
+    It should keep mappings into different target schemata apart
+    """
+
+    from occams_imports.importers.utils.scheduler import plan
+
+    m1 = _direct(1, 'form_a', 'foo', 'x')
+    m2 = _direct(2, 'form_b', 'bar', 'y')
+
+    components = plan([m1, m2], 'src', 'tgt')
+
+    assert [c[0] for c in components] == [[m1], [m2]]
+
+
+def test_plan_shared_target_schema():
+    """
+    It should keep mappings sharing a target collect date together in order
+    """
+
+    from occams_imports.importers.utils.scheduler import plan
+
+    m1 = _direct(1, 'form_a', 'foo', 'x')
+    m2 = _direct(2, 'form_b', 'bar', 'y')
+    m3 = _direct(3, 'form_a', 'baz', 'z')
+
+    components = plan([m1, m2, m3], 'src', 'tgt')
+
+    assert [c[0] for c in components] == [[m1, m3], [m2]]
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_run(workers):
+    """
+    It should produce the same frame regardless of the number of workers
+    """
+
+    import pandas as pd
+    from occams_imports.importers.utils.scheduler import run
+
+    mappings = [
+        _direct(i, 'form_{}'.format(i % 3), 'var_{}'.format(i), 'x')
+        for i in range(10)
+    ]
+
+    frame = pd.DataFrame({'src_source_form_x': [1, 2, 3]})
+
+    def apply(subframe, mapping):
+        target_column = '_'.join([
+            'tgt', mapping.logic['target_schema'],
+            mapping.logic['target_variable']
+        ])
+        subframe[target_column] = subframe['src_source_form_x'] * mapping.id
+
+    result = run(mappings, frame, apply, 'src', 'tgt', workers=workers)
+
+    for i in range(10):
+        column = 'tgt_form_{}_var_{}'.format(i % 3, i)
+        assert result[column].tolist() == [1 * i, 2 * i, 3 * i]
+
+
+@pytest.mark.parametrize('settings,expected', [
+    (None, 1),
+    ({}, 1),
+    ({'imports.mapping.shards': '4'}, 4),
+])
+def test_get_shard_count(settings, expected):
+    """
+    It should default to a single shard
+    """
+
+    from occams_imports.importers.utils.scheduler import get_shard_count
+
+    assert get_shard_count(settings) == expected
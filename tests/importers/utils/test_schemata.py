@@ -0,0 +1,73 @@
+def test_find_existing_forms(db_session):
+    """
+    It should find which candidate forms already exist in a single query
+    """
+
+    from datetime import date
+
+    from occams_datastore import models as datastore
+    from occams_imports.importers.utils.schemata import find_existing_forms
+
+    db_session.add_all([
+        datastore.Schema(
+            name=u'demographics',
+            title=u'Demographics',
+            publish_date=date(2015, 1, 1)),
+        datastore.Schema(
+            name=u'medications',
+            title=u'Medications',
+            publish_date=date(2015, 1, 1)),
+    ])
+    db_session.flush()
+
+    existing = find_existing_forms(db_session, [
+        (u'demographics', u'Demographics', u'2015-01-01'),
+        (u'demographics', u'Demographics', u'2016-01-01'),
+        (u'medications', u'Other Title', u'2015-01-01'),
+        (u'missing', u'Missing', u'2015-01-01'),
+    ])
+
+    assert existing == {(u'demographics', u'Demographics', u'2015-01-01')}
+    assert find_existing_forms(db_session, []) == set()
+
+
+def test_get_schema_versions(db_session):
+    """
+    It should load every published version of the given schemata, oldest
+    first
+    """
+
+    from datetime import date
+
+    from occams_datastore import models as datastore
+    from occams_imports.importers.utils.schemata import get_schema_versions
+
+    db_session.add_all([
+        datastore.Schema(
+            name=u'demographics',
+            title=u'Demographics',
+            publish_date=date(2016, 1, 1)),
+        datastore.Schema(
+            name=u'demographics',
+            title=u'Demographics',
+            publish_date=date(2015, 1, 1)),
+        datastore.Schema(
+            name=u'demographics',
+            title=u'Demographics'),
+        datastore.Schema(
+            name=u'medications',
+            title=u'Medications',
+            publish_date=date(2015, 1, 1)),
+        datastore.Schema(
+            name=u'drafts',
+            title=u'Drafts'),
+    ])
+    db_session.flush()
+
+    versions = get_schema_versions(
+        db_session, [u'demographics', u'drafts', u'missing'])
+
+    assert list(versions) == [u'demographics']
+    assert [s.publish_date for s in versions[u'demographics']] == \
+        [date(2015, 1, 1), date(2016, 1, 1)]
+    assert versions[u'demographics'][-1].publish_date == date(2016, 1, 1)
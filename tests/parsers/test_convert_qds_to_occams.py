@@ -1,5 +1,7 @@
 # flake8: noqa
 
+import io
+
 from occams_imports.parsers import convert_qds_to_occams as cqo
 import unicodecsv as csv
 
@@ -125,3 +127,48 @@ def test_convert(datadir):
     assert row3['type'] == u'choice'
 
     converted.close()
+
+
+def test_iter_rows(datadir):
+    codebook = datadir.join('qds_input_fixture.csv').open()
+
+    rows = list(cqo.iter_rows(codebook))
+
+    assert [row['field'] for row in rows[:3]] == \
+        [u'TODAY', u'GENDER', u'BIRTHSEX']
+    assert [row['type'] for row in rows[:3]] == \
+        [u'string', u'choice', u'choice']
+    assert rows[1]['choices'].startswith(u'1=Male;2=Female')
+
+
+def test_grouped_rows(datadir):
+    codebook = datadir.join('qds_input_fixture.csv').open('rb')
+    expected = list(cqo.iter_rows(codebook))
+
+    codebook = datadir.join('qds_input_fixture.csv').open('rb')
+    actual = cqo.grouped_rows(codebook)
+
+    assert actual == expected
+
+
+def test_grouped_rows_multiple_forms():
+    codebook = io.BytesIO(b"""\
+formTitle,formDesc,formPublishDate,var1,var2,questionID,questionText,value,responseText,units,varType
+Form_A,Form A,08/11/2015,TODAY,Calculated,1,Today,,,,string
+Form_A,Form A,08/11/2015,SEX,A1,2,Sex,1,Male,,int
+Form_A,Form A,08/11/2015,SEX,A1,2,Sex,2,Female,,int
+Form_B,Form B,01/01/2016,AGE,B1,1,Age,,,,float
+Form_B,Form B,01/01/2016,SEX,B2,2,Sex,1,Male,,int
+""")
+
+    rows = cqo.grouped_rows(codebook)
+
+    assert [(r['table'], r['publish_date'], r['field'], r['type'])
+            for r in rows] == [
+        (u'Form_A', u'08/11/2015', u'TODAY', u'string'),
+        (u'Form_A', u'08/11/2015', u'SEX', u'choice'),
+        (u'Form_B', u'01/01/2016', u'AGE', u'number'),
+        (u'Form_B', u'01/01/2016', u'SEX', u'choice'),
+    ]
+    assert rows[1]['choices'] == u'1=Male;2=Female'
+    assert rows[3]['choices'] == u'1=Male'
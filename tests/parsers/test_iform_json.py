@@ -128,3 +128,39 @@ def test_convert(datadir):
         assert row['title'] == u'Test label.'
 
     converted.close()
+
+
+def test_iter_rows(datadir):
+    codebook = datadir.join('iform_input_fixture.json').open()
+
+    rows = list(iform_json.iter_rows(codebook))
+
+    assert rows
+    for row in rows:
+        assert sorted(row) == sorted(iform_json.CODEBOOK_HEADERS)
+        assert row['form'] == u'test_595_hiv_test_v04'
+        assert row['title'] == u'Test label.'
+
+
+def test_iter_rows_without_ijson(datadir, monkeypatch):
+    codebook = datadir.join('iform_input_fixture.json').open('rb')
+    expected = list(iform_json.iter_rows(codebook))
+
+    monkeypatch.setattr(iform_json, 'ijson', None)
+
+    codebook = datadir.join('iform_input_fixture.json').open('rb')
+    actual = list(iform_json.iter_rows(codebook))
+
+    assert actual == expected
+
+
+def test_build_option_lookup():
+    option_lists = [(11, {u'options': [
+        {u'key_value': u'0', u'label': u'TRUE'},
+        {u'key_value': u'1', u'label': u'FALSE'},
+    ]})]
+
+    actual = iform_json.build_option_lookup(option_lists)
+
+    assert actual == {u'11': [[u'0', u'TRUE'], [u'1', u'FALSE']]}
+
@@ -69,12 +69,12 @@ def test_parse_dispatch():
         delimiter = u'comma'
 
         codebook = six.StringIO()
-        mock_convert.convert.return_value = six.StringIO()
+        mock_convert.iter_rows.return_value = iter([])
 
         response = parse.parse_dispatch(codebook, codebook_format, delimiter)
         codebook.close()
 
-        assert mock_convert.convert.called == True
+        assert mock_convert.iter_rows.called == True
 
     with mock.patch('occams_imports.parsers.parse.convert_qds_to_occams') \
         as mock_convert:
@@ -83,12 +83,12 @@ def test_parse_dispatch():
         delimiter = u'comma'
 
         codebook = six.StringIO()
-        mock_convert.convert.return_value = six.StringIO()
+        mock_convert.grouped_rows.return_value = []
 
         response = parse.parse_dispatch(codebook, codebook_format, delimiter)
         codebook.close()
 
-        assert mock_convert.convert.called == True
+        assert mock_convert.grouped_rows.called == True
 
 
 def test_parse_dispatch_tab_delimiter():
@@ -100,12 +100,12 @@ def test_parse_dispatch_tab_delimiter():
         delimiter = u'tab'
 
         codebook = six.StringIO()
-        mock_convert.convert.return_value = six.StringIO()
+        mock_convert.iter_rows.return_value = iter([])
 
         response = parse.parse_dispatch(codebook, codebook_format, delimiter)
         codebook.close()
 
-        assert mock_convert.convert.called == True
+        assert mock_convert.iter_rows.called == True
 
     with mock.patch('occams_imports.parsers.parse.convert_qds_to_occams') \
         as mock_convert:
@@ -114,12 +114,34 @@ def test_parse_dispatch_tab_delimiter():
         delimiter = u'comma'
 
         codebook = six.StringIO()
-        mock_convert.convert.return_value = six.StringIO()
+        mock_convert.grouped_rows.return_value = []
 
         response = parse.parse_dispatch(codebook, codebook_format, delimiter)
         codebook.close()
 
-        assert mock_convert.convert.called == True
+        assert mock_convert.grouped_rows.called == True
+
+
+def test_iter_dispatch(datadir):
+    import types
+
+    codebook = datadir.join('codebook.csv').open()
+
+    records = parse.iter_dispatch(codebook, u'occams', u'comma')
+
+    assert isinstance(records, types.GeneratorType)
+
+    records = list(parse.skip_system_entries(records))
+
+    assert len(records) == 10
+    assert records[0]['name'] == u'cont'
+    assert records[0]['order'] == 3001
+
+
+def test_skip_system_entries():
+    records = iter([{'is_system': True}, {'is_system': False}])
+
+    assert list(parse.skip_system_entries(records)) == [{'is_system': False}]
 
 
 def test_convert_date():
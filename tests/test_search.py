@@ -0,0 +1,141 @@
+import pytest
+
+
+def test_lru_cache():
+    """
+    It should evict the least-recently used entries first
+    """
+
+    from occams_imports.search import LRUCache
+
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+
+    assert cache.get('a') == 1
+
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def test_lru_cache_ttl():
+    """
+    It should discard entries once they expire
+    """
+
+    from occams_imports.search import LRUCache
+
+    now = [1000.0]
+    cache = LRUCache(maxsize=2, ttl=60, clock=lambda: now[0])
+    cache.put('a', 1)
+
+    now[0] += 59
+    assert cache.get('a') == 1
+
+    now[0] += 1
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_cached():
+    """
+    It should only search again once the generation changes
+    """
+
+    import mock
+    from occams_imports import search
+
+    redis = mock.Mock()
+    redis.get.return_value = b'generation-1'
+    run = mock.Mock(return_value=[{'name': u'demographics'}])
+
+    search.cached(redis, ('schemata', u'test-cached'), run)
+    search.cached(redis, ('schemata', u'test-cached'), run)
+
+    assert run.call_count == 1
+
+    redis.get.return_value = b'generation-2'
+    search.cached(redis, ('schemata', u'test-cached'), run)
+
+    assert run.call_count == 2
+
+
+class TestSearch:
+
+    @pytest.fixture(autouse=True)
+    def populate(self, db_session):
+        from datetime import date
+
+        from occams_datastore import models as datastore
+        from occams_studies import models as studies
+        from occams_imports import search
+
+        study = studies.Study(
+            name=u'ucsd',
+            title=u'UCSD',
+            short_title=u'ucsd',
+            code=u'ucsd',
+            consent_date=date.today(),
+            is_randomized=False
+        )
+
+        for name in [u'demographics', u'sexual_demographics', u'vitals']:
+            study.schemata.add(datastore.Schema(
+                name=name,
+                title=name,
+                publish_date=date(2015, 1, 1),
+                attributes={
+                    'age': datastore.Attribute(
+                        name=u'age',
+                        title=u'Age',
+                        type=u'number',
+                        order=0),
+                    'race_other': datastore.Attribute(
+                        name=u'race_other',
+                        title=u'Other race',
+                        type=u'string',
+                        order=1),
+                }
+            ))
+
+        # Schemata not associated with a study may not be mapped
+        db_session.add(datastore.Schema(
+            name=u'demographics_draft',
+            title=u'demographics_draft',
+            publish_date=date(2015, 1, 1)
+        ))
+
+        db_session.add(study)
+        db_session.flush()
+
+        search.refresh(db_session)
+
+    def test_schemata_ranked(self, db_session):
+        """
+        It should list the closest matches first
+        """
+        from occams_imports import search
+
+        results = search.search_schemata(db_session, u'Demographics')
+
+        assert [r['name'] for r in results] == \
+            [u'demographics', u'sexual_demographics']
+
+    def test_attributes_literal(self, db_session):
+        """
+        It should match wildcard characters literally
+        """
+        from occams_imports import search
+
+        results = search.search_attributes(
+            db_session, u'vitals', u'e_o')
+
+        assert [r['name'] for r in results] == [u'race_other']
+
+        results = search.search_attributes(db_session, u'vitals', u'%')
+
+        assert results == []
@@ -0,0 +1,83 @@
+"""Tests for the upload file store."""
+
+
+def test_store(tmpdir):
+    """
+    It should stream contents into a content-addressed file
+    """
+
+    import hashlib
+    import io
+    import os
+    from occams_imports import storage
+
+    upload_dir = str(tmpdir)
+    contents = b'pid,visit\n' + b'P1,wk1\n' * 1000
+
+    checksum, size = storage.store(
+        upload_dir, io.BytesIO(contents), chunk_size=100)
+
+    assert checksum == hashlib.sha256(contents).hexdigest()
+    assert size == len(contents)
+
+    path = storage.get_path(upload_dir, checksum)
+    with open(path, 'rb') as fp:
+        assert fp.read() == contents
+
+    # No temporary files should be left behind
+    assert [f for f in os.listdir(upload_dir) if f.endswith('.part')] == []
+
+
+def test_store_duplicate(tmpdir):
+    """
+    It should only store identical contents once
+    """
+
+    import io
+    from occams_imports import storage
+
+    upload_dir = str(tmpdir)
+
+    first, __ = storage.store(upload_dir, io.BytesIO(b'foo'))
+    second, __ = storage.store(upload_dir, io.BytesIO(b'foo'))
+
+    assert first == second
+
+
+def test_open_upload(tmpdir):
+    """
+    It should open uploads from either the file store or the database
+    """
+
+    import io
+    from occams_imports import models, storage
+
+    upload_dir = str(tmpdir)
+    checksum, size = storage.store(upload_dir, io.BytesIO(b'foo'))
+
+    stored = models.Upload(checksum=checksum, size=size)
+    legacy = models.Upload(project_file=b'bar')
+
+    with storage.open_upload(upload_dir, stored) as fp:
+        assert fp.read() == b'foo'
+
+    with storage.open_upload(upload_dir, legacy) as fp:
+        assert fp.read() == b'bar'
+
+
+def test_remove(tmpdir):
+    """
+    It should remove files and ignore files that are already gone
+    """
+
+    import io
+    import os
+    from occams_imports import storage
+
+    upload_dir = str(tmpdir)
+    checksum, __ = storage.store(upload_dir, io.BytesIO(b'foo'))
+
+    storage.remove(upload_dir, checksum)
+    storage.remove(upload_dir, checksum)
+
+    assert not os.path.exists(storage.get_path(upload_dir, checksum))
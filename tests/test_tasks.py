@@ -395,3 +395,118 @@ class TestAddDRSCEntitiy:
         )
 
         assert len(patient.entities) == 1
+
+
+class TestDistributeMappings:
+    """Test applying mappings in patient shards."""
+
+    @pytest.fixture(autouse=True)
+    def populate(self, db_session, study_factory, site_factory,
+                 upload_factory):
+        from datetime import date
+
+        from occams_datastore import models as datastore
+        from occams_imports import models
+
+        def make_schema(name):
+            return datastore.Schema(
+                name=name,
+                title=name,
+                publish_date=date(2017, 1, 1),
+                attributes={
+                    'age': datastore.Attribute(
+                        name=u'age',
+                        title=u'age',
+                        type=u'number',
+                        order=0),
+                    'gender': datastore.Attribute(
+                        name=u'gender',
+                        title=u'gender',
+                        type=u'choice',
+                        order=1,
+                        choices={
+                            u'0': datastore.Choice(
+                                name=u'0', title=u'male', order=0),
+                            u'1': datastore.Choice(
+                                name=u'1', title=u'female', order=1),
+                        })})
+
+        source = study_factory(name=u'source')
+        target = study_factory(name=u'drsc')
+        site_factory(name=u'drsc')
+
+        source_schema = make_schema(u'demographics')
+        target_schema = make_schema(u'drsc_demographics')
+        source.schemata.add(source_schema)
+        target.schemata.add(target_schema)
+
+        # Patients P1-P3 and P4-P6 fall in different shards
+        upload_factory.create(
+            study=source,
+            schema=source_schema,
+            project_file=b''.join(
+                [b'pid,visit,collect_date,age,gender\n'] +
+                [
+                    u'P{0},week1,2017-01-0{0},{1},{2}\n'.format(
+                        i, 20 + i, i % 2).encode('utf-8')
+                    for i in range(1, 7)
+                ]))
+
+        approved = (
+            db_session.query(models.Status)
+            .filter_by(name=u'approved')
+            .one())
+
+        for name in [u'age', u'gender']:
+            db_session.add(models.Mapping(
+                study=source,
+                status=approved,
+                type=u'direct',
+                logic={
+                    'source_schema': source_schema.name,
+                    'source_variable': name,
+                    'target_schema': target_schema.name,
+                    'target_variable': name,
+                }))
+
+        db_session.flush()
+
+    @pytest.yield_fixture
+    def eager(self, celery, db_session, redis):
+        import mock
+        from occams_imports import tasks
+
+        with mock.patch.object(tasks, 'Session', db_session), \
+                mock.patch.object(tasks.app, 'redis', redis, create=True):
+            yield tasks
+
+    def _dump_project(self, db_session, project_name):
+        from occams_studies import models as studies
+
+        db_session.expire_all()
+
+        patients = (
+            db_session.query(studies.Patient)
+            .filter(studies.Patient.site.has(name=project_name)))
+
+        return sorted(
+            (patient.pid, entity.schema.name, entity['age'], entity['gender'])
+            for patient in patients
+            for entity in patient.entities)
+
+    def test_matches_apply_mappings(self, db_session, eager):
+        """
+        It should populate the target project as when applied in one task
+        """
+
+        eager.apply_mappings.apply(
+            args=['serial', u'source', u'drsc']).get()
+
+        expected = self._dump_project(db_session, u'drsc')
+
+        assert len(expected) == 6
+
+        eager.distribute_mappings(
+            'sharded', u'source', u'drsc', 2).apply().get()
+
+        assert self._dump_project(db_session, u'drsc') == expected
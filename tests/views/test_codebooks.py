@@ -405,20 +405,11 @@ def test_validate_populate_imports(monkeypatch):
         'choices': []
     }
 
-    mock_validate = mock.MagicMock()
-    mock_validate.return_value = True
-    mock_field_form = mock.MagicMock()
-    mock_field_form.from_json.return_value = mock_validate
-
     mock_form_validate = mock.MagicMock()
     mock_form_validate.return_value = True
     mock_form_form = mock.MagicMock()
     mock_form_form.from_json.return_value = mock_form_validate
 
-    monkeypatch.setattr(
-        'occams_imports.views.codebook.FieldFormFactory',
-        lambda **x: mock_field_form)
-
     monkeypatch.setattr(
         'occams_imports.views.codebook.FormFormFactory',
         lambda **x: mock_form_form)
@@ -454,20 +445,11 @@ def test_validate_populate_imports_schema_with_errors(monkeypatch):
         'choices': []
     }
 
-    mock_validate = mock.MagicMock()
-    mock_validate.return_value = True
-    mock_field_form = mock.MagicMock()
-    mock_field_form.from_json.return_value = mock_validate
-
     mock_form_validate = mock.MagicMock()
     mock_form_validate.validate.return_value = False
     mock_form_form = mock.MagicMock()
     mock_form_form.from_json.return_value = mock_form_validate
 
-    monkeypatch.setattr(
-        'occams_imports.views.codebook.FieldFormFactory',
-        lambda **x: mock_field_form)
-
     monkeypatch.setattr(
         'occams_imports.views.codebook.FormFormFactory',
         lambda **x: mock_form_form)
@@ -479,6 +461,103 @@ def test_validate_populate_imports_schema_with_errors(monkeypatch):
     assert errors[0]['schema_title'] == u'test_schema_title'
 
 
+def test_validate_populate_imports_once_per_schema(monkeypatch):
+    import datetime
+
+    from occams_imports.views.codebook import validate_populate_imports
+
+    def make_record(schema_name, name, type_=u'number', choices=(), order=0):
+        return {
+            'schema_name': schema_name,
+            'schema_title': schema_name,
+            'publish_date': datetime.date.today(),
+            'name': name,
+            'title': u'test_title',
+            'description': u'',
+            'is_required': False,
+            'is_collection': False,
+            'is_private': False,
+            'type': type_,
+            'order': order,
+            'choices': list(choices)
+        }
+
+    records = [
+        make_record(u'schema_a', u'test_number'),
+        make_record(u'schema_a', u'1_invalid'),
+        make_record(
+            u'schema_a', u'test_choice', u'choice',
+            [[u'0', u'No'], [u'1', u'Yes']]),
+        make_record(u'schema_a', u'test_bad_code', u'choice', [[u'yes', u'Yes']]),
+        make_record(u'schema_a', u'test_bad_type', u'float'),
+    ] + [
+        make_record(u'schema_b', u'test_{}'.format(i), order=i)
+        for i in range(1000)
+    ]
+
+    mock_form_form = mock.MagicMock()
+    mock_form_form.from_json.return_value.validate.return_value = True
+
+    monkeypatch.setattr(
+        'occams_imports.views.codebook.FormFormFactory',
+        lambda **x: mock_form_form)
+
+    # Fields are validated in bulk, no field form is built for any row
+    monkeypatch.setattr(
+        'occams_forms.views.field.FieldFormFactory',
+        mock.Mock(side_effect=AssertionError('Field form built')))
+
+    errors, imports, forms = validate_populate_imports(None, records)
+
+    assert mock_form_form.from_json.call_count == 2
+    assert len(forms) == 2
+    assert len(imports) == 1002
+    assert [i[0].name for i in imports[:2]] == [u'test_number', u'test_choice']
+    assert imports[0][1] is imports[1][1]
+    assert imports[1][0].choices[u'1'].title == u'Yes'
+    assert [e['name'] for e in errors] == \
+        [u'1_invalid', u'test_bad_code', u'test_bad_type']
+    assert set(errors[0]['errors']) == {'name'}
+    assert set(errors[1]['errors']) == {'choices-0-name'}
+    assert set(errors[2]['errors']) == {'type'}
+
+
+def test_validate_fields():
+    """
+    It should apply the field editor's rules to every record at once
+    """
+
+    from occams_imports.views.codebook import validate_fields
+
+    def make_record(name, title=u'Title', type_=u'string', choices=()):
+        return {
+            'name': name,
+            'title': title,
+            'type': type_,
+            'choices': list(choices)
+        }
+
+    results = validate_fields([
+        make_record(u'valid'),
+        make_record(u''),
+        make_record(u'x' * 101),
+        make_record(u'class'),
+        make_record(u'no_title', title=u''),
+        make_record(
+            u'duplicate_codes', type_=u'choice',
+            choices=[[u'0', u'No'], [u'1', u'Yes'], [u'1', u'Maybe']]),
+    ])
+
+    assert results[0] is None
+    assert results[1] == {'name': u'This field is required.'}
+    assert results[2] == \
+        {'name': u'Field cannot be longer than 100 characters.'}
+    assert results[3] == {'name': u'Can not use a reserved word'}
+    assert results[4] == {'title': u'This field is required.'}
+    assert results[5] == {'choices-2-name': u'Duplicate code'}
+    assert validate_fields([]) == []
+
+
 def test_log_errors():
     from occams_imports.views.codebook import log_errors
     errors = {
@@ -543,6 +622,74 @@ def test_group_imports_by_schema():
         assert response == 2
 
 
+def test_group_imports_by_schema_batches(db_session):
+    """
+    It should insert attributes grouped by schema, in batches
+    """
+    import datetime
+
+    from occams_datastore import models as datastore
+    from occams_studies import models as studies
+    from occams_imports import models
+    from occams_imports.views.codebook import group_imports_by_schema
+
+    study = studies.Study(
+        name=u'test_site',
+        title=u'test_title',
+        short_title=u'tt',
+        code=u'tt1',
+        consent_date=datetime.date.today(),
+        is_randomized=False
+    )
+    db_session.add(study)
+
+    schema = datastore.Schema(
+        name=u'test_schema_name',
+        title=u'test_schema_title',
+        publish_date=datetime.date.today())
+    schema2 = datastore.Schema(
+        name=u'test_schema_name2',
+        title=u'test_schema_title2',
+        publish_date=datetime.date.today())
+
+    imports = [
+        (datastore.Attribute(name=name, title=name, type=u'string', order=i),
+         s)
+        for i, (name, s) in enumerate([
+            (u'test_a', schema),
+            (u'test_b', schema2),
+            (u'test_c', schema),
+        ])
+    ]
+
+    progress = mock.Mock()
+
+    inserted = group_imports_by_schema(
+        imports, study, db_session, batch_size=2, progress=progress)
+
+    assert inserted == 3
+    assert sorted(schema.attributes) == [u'test_a', u'test_c']
+    assert db_session.query(models.Import).count() == 2
+    assert [c[0][0] for c in progress.call_args_list] == [2, 1]
+
+
+def test_dump_load_records():
+    import datetime
+
+    from occams_imports.views.codebook import dump_records, load_records
+
+    records = [{
+        'schema_name': u'test_schema_name',
+        'publish_date': datetime.date(2015, 1, 1),
+        'choices': [[u'0', u'No']],
+    }]
+
+    dumped = dump_records(records)
+
+    assert dumped[0]['publish_date'] == u'2015-01-01'
+    assert load_records(dumped) == records
+
+
 def test_get_unique_forms():
     from occams_imports.views.codebook import get_unique_forms
 
@@ -0,0 +1,137 @@
+# flake8: noqa
+
+import pytest
+
+
+@pytest.fixture
+def projects(db_session):
+    from datetime import date
+
+    from occams_studies import models as studies
+
+    drsc = studies.Study(
+        name=u'drsc',
+        title=u'DRSC',
+        short_title=u'dr',
+        code=u'drs',
+        consent_date=date.today(),
+        is_randomized=False
+    )
+    ucsd = studies.Study(
+        name=u'ucsd',
+        title=u'UCSD',
+        short_title=u'ucsd',
+        code=u'ucsd',
+        consent_date=date.today(),
+        is_randomized=False
+    )
+
+    db_session.add_all([drsc, ucsd])
+    db_session.flush()
+
+    return ucsd, drsc
+
+
+class TestList:
+
+    @pytest.fixture(autouse=True)
+    def routes(self, config):
+        config.add_route('imports.job_detail', '/api/jobs/{job}')
+        config.add_route('imports.job_status', '/api/jobs/{job}/status')
+
+    def _call_fut(self, *args, **kw):
+        from occams_imports.views.job import list_ as view
+
+        return view(*args, **kw)
+
+    def test_list(self, req, db_session, projects):
+        """
+        It should list the most recent jobs of a project first
+        """
+        from datetime import datetime
+        from webob.multidict import MultiDict
+        from occams_imports import models
+
+        source, target = projects
+
+        db_session.add_all([
+            models.Job(
+                name=u'job-1',
+                study=source,
+                target_study=target,
+                status=u'complete',
+                start_date=datetime(2017, 1, 1, 10),
+                end_date=datetime(2017, 1, 1, 11),
+                timings={'load': 10.0},
+                create_date=datetime(2017, 1, 1, 10),
+                modify_date=datetime(2017, 1, 1, 11)),
+            models.Job(
+                name=u'job-2',
+                study=source,
+                target_study=target,
+                status=u'running',
+                create_date=datetime(2017, 1, 2, 10),
+                modify_date=datetime(2017, 1, 2, 10)),
+            models.Job(
+                name=u'job-3',
+                study=target,
+                target_study=target,
+                create_date=datetime(2017, 1, 3, 10),
+                modify_date=datetime(2017, 1, 3, 10)),
+        ])
+        db_session.flush()
+
+        req.GET = MultiDict([('project', u'ucsd')])
+        response = self._call_fut(None, req)
+
+        assert [j['id'] for j in response['items']] == [u'job-2', u'job-1']
+        assert response['items'][1]['duration'] == 3600
+        assert response['items'][1]['timings'] == {'load': 10.0}
+
+
+class TestGetActiveJob:
+
+    def _call_fut(self, *args, **kw):
+        from occams_imports.views.process import get_active_job as view
+
+        return view(*args, **kw)
+
+    def test_active(self, db_session, projects):
+        """
+        It should find unfinished jobs of the project
+        """
+        from occams_imports import models
+
+        source, target = projects
+
+        job = models.Job(name=u'job-1', study=source, target_study=target)
+        db_session.add(job)
+        db_session.flush()
+
+        assert self._call_fut(db_session, source, {}) is job
+        assert self._call_fut(db_session, target, {}) is None
+
+        job.status = u'failed'
+        db_session.flush()
+
+        assert self._call_fut(db_session, source, {}) is None
+
+    def test_expired(self, db_session, projects):
+        """
+        It should ignore jobs that have been active for too long
+        """
+        from datetime import datetime
+        from occams_imports import models
+
+        source, target = projects
+
+        db_session.add(models.Job(
+            name=u'job-1',
+            study=source,
+            target_study=target,
+            status=u'running',
+            create_date=datetime(2017, 1, 1),
+            modify_date=datetime(2017, 1, 1)))
+        db_session.flush()
+
+        assert self._call_fut(db_session, source, {}) is None
@@ -1,6 +1,9 @@
 # flake8: noqa
 
+import json
+
 import pytest
+from six.moves.urllib.parse import parse_qs, urlparse
 
 
 @pytest.yield_fixture
@@ -73,15 +76,165 @@ class TestGetAllSchemas:
 
         return view(*args, **kw)
 
-    def test_get_all_schemas(self, req, db_session):
+    def _accept_encoding(self, req, value):
+        from webob import Request
+
+        req.headers['Accept-Encoding'] = value
+        # Dummy requests do not parse the header
+        req.accept_encoding = Request.blank(
+            '/', headers={'Accept-Encoding': value}).accept_encoding
+
+    def test_get_all_schemas(self, req, db_session, redis):
         """
         Only one schema should be returned eventhough multiple studies have
         the same schema associated
         """
         response = self._call_fut(None, req)
+        data = json.loads(response.body.decode('utf-8'))
+
+        assert len(data['forms']) == 2
+        assert data['forms'][0]['name'] == u'demographics'
+        assert data['forms'][0]['site'] == u'DRSC'
+        assert [c['name'] for c in
+                data['forms'][0]['attributes'][0]['choices']] == [u'0', u'1']
+
+    def test_conditional(self, req, db_session, redis):
+        """
+        It should not send the catalog again if the client has it already
+        """
+        response = self._call_fut(None, req)
+        etag = response.headers['ETag']
+
+        req.headers['If-None-Match'] = etag
+        response = self._call_fut(None, req)
+
+        assert response.status_code == 304
+        assert not response.body
+
+    def test_gzip(self, req, db_session, redis):
+        """
+        It should send the compressed catalog to clients that accept it
+        """
+        from occams_imports import catalog
+
+        self._accept_encoding(req, 'gzip, deflate')
+        response = self._call_fut(None, req)
+
+        assert response.content_encoding == 'gzip'
+        data = json.loads(catalog.decompress(response.body).decode('utf-8'))
+        assert len(data['forms']) == 2
+
+    def test_gzip_refused(self, req, db_session, redis):
+        """
+        It should not compress the catalog if the client refuses gzip
+        """
+        self._accept_encoding(req, 'gzip;q=0, identity')
+        response = self._call_fut(None, req)
+
+        assert response.content_encoding is None
+        data = json.loads(response.body.decode('utf-8'))
+        assert len(data['forms']) == 2
+
+    def test_invalidate(self, req, db_session, redis):
+        """
+        It should rebuild the catalog once it has been invalidated
+        """
+        from datetime import date
+        from occams_datastore import models as datastore
+        from occams_studies import models as studies
+        from occams_imports import catalog
+
+        self._call_fut(None, req)
+
+        drsc = db_session.query(studies.Study).filter_by(name=u'drsc').one()
+        drsc.schemata.add(datastore.Schema(
+            name=u'vitals', title=u'vitals', publish_date=date.today()))
+        db_session.flush()
+
+        response = self._call_fut(None, req)
+        data = json.loads(response.body.decode('utf-8'))
+        assert len(data['forms']) == 2
+
+        catalog.invalidate(redis)
+
+        response = self._call_fut(None, req)
+        data = json.loads(response.body.decode('utf-8'))
+        assert len(data['forms']) == 3
+
+
+class TestSchemaCatalog:
+    @pytest.fixture(autouse=True)
+    def populate(self, db_session):
+        from datetime import date
+
+        from occams_datastore import models as datastore
+        from occams_studies import models as studies
+
+        drsc = studies.Study(
+            name=u'drsc',
+            title=u'DRSC',
+            short_title=u'dr',
+            code=u'drs',
+            consent_date=date.today(),
+            is_randomized=False
+        )
+
+        drsc.schemata.add(datastore.Schema(
+            name=u'demographics',
+            title=u'demographics',
+            publish_date=date(2015, 1, 1),
+            attributes={
+                'question': datastore.Attribute(
+                    name=u'question',
+                    title=u'question',
+                    type=u'string',
+                    order=0)
+            }
+        ))
+        db_session.add(drsc)
+        db_session.flush()
 
-        assert len(response['forms']) == 2
-        assert response['forms'][0]['name'] == u'demographics'
+    def test_index(self, req, db_session, redis):
+        """
+        It should list the forms without their attributes
+        """
+        from webob.multidict import MultiDict
+        from occams_imports.views.mapping import schema_catalog as view
+
+        req.GET = MultiDict([('study', u'drsc')])
+        response = view(None, req)
+        data = json.loads(response.body.decode('utf-8'))
+
+        assert data['forms'] == [{
+            u'name': u'demographics',
+            u'publish_date': u'2015-01-01',
+            u'site': u'DRSC'
+        }]
+
+    def test_detail(self, req, db_session, redis):
+        """
+        It should list the attributes of a single form
+        """
+        from occams_imports.views.mapping import schema_catalog_detail as view
+
+        req.matchdict = {'schema': u'demographics', 'publish_date': u'2015-01-01'}
+        response = view(None, req)
+        data = json.loads(response.body.decode('utf-8'))
+
+        assert data['name'] == u'demographics'
+        assert [a['variable'] for a in data['attributes']] == [u'question']
+
+    def test_detail_not_found(self, req, db_session, redis):
+        """
+        It should fail if the form does not exist
+        """
+        from pyramid.httpexceptions import HTTPNotFound
+        from occams_imports.views.mapping import schema_catalog_detail as view
+
+        req.matchdict = {'schema': u'vitals', 'publish_date': u'2015-01-01'}
+
+        with pytest.raises(HTTPNotFound):
+            view(None, req)
 
 
 class TestOccamsDirect:
@@ -115,6 +268,7 @@ class TestSchemasSearchTerm:
 
         from occams_datastore import models as datastore
         from occams_studies import models as studies
+        from occams_imports import search
 
         drsc = studies.Study(
             name=u'drsc',
@@ -141,12 +295,14 @@ class TestSchemasSearchTerm:
         db_session.add(drsc)
         db_session.flush()
 
+        search.refresh(db_session)
+
     def _call_fut(self, *args, **kw):
         from occams_imports.views.mapping import schemas as view
 
         return view(*args, **kw)
 
-    def test_get_schemas(self, req, db_session):
+    def test_get_schemas(self, req, db_session, redis):
         """
         Only schema with matching search terms should be returned
         """
@@ -166,6 +322,7 @@ class TestAttributesSearchTerm:
 
         from occams_datastore import models as datastore
         from occams_studies import models as studies
+        from occams_imports import search
 
         drsc = studies.Study(
             name=u'drsc',
@@ -196,12 +353,14 @@ class TestAttributesSearchTerm:
         db_session.add(drsc)
         db_session.flush()
 
+        search.refresh(db_session)
+
     def _call_fut(self, *args, **kw):
         from occams_imports.views.mapping import get_attributes as view
 
         return view(*args, **kw)
 
-    def test_get_attributes(self, req, db_session):
+    def test_get_attributes(self, req, db_session, redis):
         """
         Get attributes for schema
         """
@@ -221,6 +380,7 @@ class TestChoicesSearchTerm:
 
         from occams_datastore import models as datastore
         from occams_studies import models as studies
+        from occams_imports import search
 
         drsc = studies.Study(
             name=u'drsc',
@@ -258,12 +418,14 @@ class TestChoicesSearchTerm:
         db_session.add(drsc)
         db_session.flush()
 
+        search.refresh(db_session)
+
     def _call_fut(self, *args, **kw):
         from occams_imports.views.mapping import get_choices as view
 
         return view(*args, **kw)
 
-    def test_get_choices(self, req, db_session):
+    def test_get_choices(self, req, db_session, redis):
         """
         Get choices for attribute
         """
@@ -600,12 +762,126 @@ class TestGetSchemas:
         config.testing_securitypolicy(permissive=False)
         response = self._call_fut(None, req)
 
-        row = response['rows'][0]
+        row = json.loads(response.body.decode('utf-8'))['rows'][0]
 
         assert row['study'] == u'DRSC'
         assert row['study_form'] == u'demographics'
         assert row['target_form'] == u'ucsd_demographics'
 
+    def test_paginate(self, config, req, db_session):
+        """
+        It should list filtered mappings a page at a time
+        """
+        from webob.multidict import MultiDict
+        from occams_studies import models as studies
+        from occams_imports import models
+
+        drsc = db_session.query(studies.Study).filter_by(name=u'drsc').one()
+        statuses = dict(db_session.query(models.Status.name, models.Status))
+
+        for i, status in enumerate([u'review', u'approved'] * 3):
+            db_session.add(models.Mapping(
+                study=drsc,
+                status=statuses[status],
+                type=u'direct',
+                logic={
+                    'source_schema': u'demographics',
+                    'source_variable': u'question',
+                    'target_schema': u'ucsd_demographics',
+                    'target_variable': u'ucsd_question_{}'.format(i),
+                }))
+        db_session.flush()
+
+        config.add_route('imports.mappings.view', '/mappings/view')
+        config.testing_securitypolicy(permissive=False)
+
+        params = MultiDict(
+            [('status', u'review'), ('sort', u'-target_form'), ('limit', '2')])
+        ids = []
+
+        while params is not None:
+            req.GET = params
+            data = json.loads(self._call_fut(None, req).body.decode('utf-8'))
+            ids.append([row['mapped_id'] for row in data['rows']])
+            assert all(row['status'] == u'review' for row in data['rows'])
+            assert data['count'] == 3
+            assert data['variable_count'] == 3
+            params = None
+            if data['$next']:
+                params = MultiDict(req.GET, cursor=parse_qs(
+                    urlparse(data['$next']).query)['cursor'][0])
+
+        assert [len(page) for page in ids] == [2, 1]
+        assert sorted(sum(ids, []), reverse=True) == sum(ids, [])
+
+    def test_paginate_null_sort_values(self, config, req, db_session):
+        """
+        It should list mappings without a value for the sorted column
+        """
+        from webob.multidict import MultiDict
+        from occams_studies import models as studies
+        from occams_imports import models
+
+        drsc = db_session.query(studies.Study).filter_by(name=u'drsc').one()
+        review = db_session.query(models.Status).filter_by(name=u'review').one()
+
+        for target_schema in [u'b_form', None, u'a_form', None]:
+            db_session.add(models.Mapping(
+                study=drsc,
+                status=review,
+                type=u'direct',
+                logic={
+                    'source_schema': u'demographics',
+                    'source_variable': u'question',
+                    'target_schema': target_schema,
+                    'target_variable': u'ucsd_question',
+                }))
+        db_session.flush()
+
+        expected = sorted(
+            mapping.id for mapping in db_session.query(models.Mapping))
+
+        config.add_route('imports.mappings.view', '/mappings/view')
+        config.testing_securitypolicy(permissive=False)
+
+        for sort in [u'target_form', u'-target_form']:
+            params = MultiDict([('sort', sort), ('limit', '1')])
+            listed = []
+
+            while params is not None:
+                req.GET = params
+                data = json.loads(
+                    self._call_fut(None, req).body.decode('utf-8'))
+                listed.extend(row['mapped_id'] for row in data['rows'])
+                params = None
+                if data['$next']:
+                    params = MultiDict(req.GET, cursor=parse_qs(
+                        urlparse(data['$next']).query)['cursor'][0])
+
+            assert sorted(listed) == expected
+            assert len(listed) == len(expected)
+
+    def test_paginate_invalid(self, config, req, db_session):
+        """
+        It should refuse unknown sort columns and malformed cursors
+        """
+        from webob.multidict import MultiDict
+
+        config.add_route('imports.mappings.view', '/mappings/view')
+        config.testing_securitypolicy(permissive=False)
+
+        req.GET = MultiDict([('sort', u'-secret')])
+        response = self._call_fut(None, req)
+
+        assert req.response.status_code == 400
+        assert response == {'errors': ['Invalid sort: -secret']}
+
+        req.GET = MultiDict([('cursor', u'not-a-cursor')])
+        response = self._call_fut(None, req)
+
+        assert req.response.status_code == 400
+        assert response == {'errors': ['Invalid cursor']}
+
 
 class TestDeleteMappings:
     @pytest.fixture(autouse=True)
@@ -718,6 +994,115 @@ class TestDeleteMappings:
 
         assert mapping_exists is False
 
+    def test_delete_mappings_missing(self, req, db_session):
+        """
+        It should not delete any mapping if one of them does not exist
+        """
+        from occams_studies import models as studies
+        from occams_imports import models
+
+        drsc = db_session.query(studies.Study).filter_by(name=u'drsc').one()
+        review = db_session.query(models.Status).filter_by(name=u'review').one()
+        mapping = models.Mapping(
+            study=drsc, status=review, type=u'direct', logic={})
+        db_session.add(mapping)
+        db_session.flush()
+
+        req.json = {'ids': [mapping.id, mapping.id + 1]}
+
+        response = self._call_fut(None, req)
+
+        assert req.response.status_code == 400
+        assert str(mapping.id + 1) in response['error']
+        assert db_session.query(models.Mapping).count() == 1
+
+
+class TestBulkUpdate:
+    @pytest.fixture(autouse=True)
+    def populate(self, db_session):
+        from datetime import date
+
+        from occams_studies import models as studies
+        from occams_imports import models
+
+        drsc = studies.Study(
+            name=u'drsc',
+            title=u'DRSC',
+            short_title=u'dr',
+            code=u'drs',
+            consent_date=date.today(),
+            is_randomized=False
+        )
+
+        review = db_session.query(models.Status).filter_by(name=u'review').one()
+
+        db_session.add_all([
+            models.Mapping(
+                study=drsc, status=review, type=u'direct', logic={})
+            for __ in range(3)
+        ])
+        db_session.flush()
+
+    def test_status(self, req, db_session):
+        """
+        It should set the status of all selected mappings
+        """
+        from occams_imports import models
+        from occams_imports.views.mapping import bulk_update_status as view
+
+        ids = [id_ for id_, in db_session.query(models.Mapping.id)]
+
+        req.json = {'ids': ids[:2], 'status': u'approved'}
+
+        response = view(None, req)
+
+        assert response == {'count': 2}
+
+        db_session.expire_all()
+        statuses = dict(
+            db_session.query(models.Mapping.id, models.Status.name)
+            .join(models.Mapping.status))
+        assert [statuses[id_] for id_ in ids] == \
+            [u'approved', u'approved', u'review']
+
+    def test_status_missing(self, req, db_session):
+        """
+        It should not update any mapping if one of them does not exist
+        """
+        from occams_imports import models
+        from occams_imports.views.mapping import bulk_update_status as view
+
+        ids = [id_ for id_, in db_session.query(models.Mapping.id)]
+
+        req.json = {'ids': ids + [max(ids) + 1], 'status': u'approved'}
+
+        view(None, req)
+
+        assert req.response.status_code == 400
+        db_session.expire_all()
+        assert not (
+            db_session.query(models.Mapping)
+            .filter(models.Mapping.status.has(name=u'approved'))
+            .count())
+
+    def test_notes(self, req, db_session):
+        """
+        It should set the notes of all selected mappings
+        """
+        from occams_imports import models
+        from occams_imports.views.mapping import bulk_update_notes as view
+
+        ids = [id_ for id_, in db_session.query(models.Mapping.id)]
+
+        req.json = {'ids': ids, 'notes': u'Revised codebook'}
+
+        response = view(None, req)
+
+        assert response == {'count': 3}
+        db_session.expire_all()
+        assert {n for n, in db_session.query(models.Mapping.notes)} == \
+            {u'Revised codebook'}
+
 
 class TestGetSchemasMapped:
     @pytest.fixture(autouse=True)